@@ -0,0 +1,248 @@
+"""
+Admission control for DM turns.
+
+Every turn ends in a slow model call, so the API caps how many run at once:
+  - at most max_concurrency turns in flight;
+  - up to max_queue more wait, first come first served, for at most queue_timeout;
+  - one turn in flight (or queued) per player_id, so one player can't crowd out the table
+    (a party round takes one slot per member, all at once, see acquire_many);
+  - anything else is rejected immediately with Rejected(status, reason, retry_after),
+    which app.py / asgi.py turn into 429 (player busy) or 503 (overloaded) + Retry-After.
+
+Works from Flask threads (acquire) and the asyncio route (aacquire) on the same
+controller; a released slot is handed straight to the oldest waiter.
+
+Env vars:
+  ADMISSION_MAX_CONCURRENCY  turns in flight (default 32; 0 disables admission control)
+  ADMISSION_MAX_QUEUE        turns waiting for a slot (default 64)
+  ADMISSION_QUEUE_TIMEOUT    seconds a turn may wait for a slot (default 10)
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any
+
+import metrics
+
+ADMITTED = metrics.counter("admission_admitted_total", "Turns admitted", ["queued"])
+REJECTED = metrics.counter("admission_rejections_total", "Turns rejected by admission control", ["reason"])
+QUEUE_WAIT = metrics.histogram("admission_queue_wait_seconds", "Time admitted turns waited for a slot")
+
+
+class Rejected(Exception):
+    """The turn was not admitted. status is the HTTP status to answer with; retry_after is in seconds."""
+
+    def __init__(self, status: int, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("player_ids", "slots", "event", "future", "loop", "admitted")
+
+    def __init__(self, player_ids: tuple[str, ...], slots: int, loop: asyncio.AbstractEventLoop | None = None):
+        self.player_ids = player_ids
+        self.slots = slots
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.admitted = False
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+class Ticket:
+    """An admitted turn's slots. release() (or leaving the `with` block) frees them; safe to call twice."""
+
+    def __init__(self, controller: "AdmissionController | None", player_ids: tuple[str, ...] = (), slots: int = 1):
+        self._controller = controller
+        self._player_ids = player_ids
+        self._slots = slots
+        self._start = time.monotonic()
+
+    def release(self) -> None:
+        controller, self._controller = self._controller, None
+        if controller is not None:
+            controller._release(self._player_ids, self._slots, time.monotonic() - self._start)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0  # slots taken
+        self._queue: deque[_Waiter] = deque()
+        self._players: set[str] = set()  # players with a turn in flight or queued
+        self._avg_turn = 5.0  # seconds; EWMA of slot hold times, for Retry-After
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def _retry_after_locked(self, ahead: int) -> int:
+        per_slot = self._avg_turn / max(1, self.max_concurrency)
+        return max(1, math.ceil(per_slot * (ahead + 1)))
+
+    def _admit_or_enqueue(
+        self, player_ids: tuple[str, ...], slots: int, loop: asyncio.AbstractEventLoop | None
+    ) -> _Waiter | None:
+        """Admit immediately (None), queue (returns the waiter), or raise Rejected."""
+        with self._lock:
+            if any(player_id in self._players for player_id in player_ids):
+                REJECTED.inc(reason="player_busy")
+                raise Rejected(429, "player_busy", self._retry_after_locked(0),
+                               "You already have an action in progress")
+            if self._in_flight + slots <= self.max_concurrency and not self._queue:
+                self._in_flight += slots
+                self._players.update(player_ids)
+                ADMITTED.inc(queued="false")
+                return None
+            if len(self._queue) >= self.max_queue:
+                REJECTED.inc(reason="queue_full")
+                raise Rejected(503, "queue_full", self._retry_after_locked(len(self._queue)),
+                               "The Dungeon Master is busy; try again shortly")
+            waiter = _Waiter(player_ids, slots, loop)
+            self._queue.append(waiter)
+            self._players.update(player_ids)
+            return waiter
+
+    def _give_up_locked(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that timed out. False if it was admitted in the meantime."""
+        if waiter.admitted:
+            return False
+        self._queue.remove(waiter)
+        self._players.difference_update(waiter.player_ids)
+        # A party waiting at the head may have been holding back smaller turns behind it
+        self._admit_waiters_locked()
+        return True
+
+    def _timeout_rejection_locked(self) -> Rejected:
+        REJECTED.inc(reason="queue_timeout")
+        return Rejected(503, "queue_timeout", self._retry_after_locked(len(self._queue)),
+                        "The Dungeon Master is busy; try again shortly")
+
+    def acquire(self, player_id: str | None = None) -> Ticket:
+        """Block until the turn is admitted (up to queue_timeout). Raises Rejected."""
+        return self._acquire(() if player_id is None else (player_id,), 1)
+
+    def acquire_many(self, player_ids: list[str]) -> Ticket:
+        """
+        One ticket for a party round: a slot per player, taken all at once when enough are free
+        (a round never holds some slots while waiting for the rest). A party larger than
+        max_concurrency takes every slot. Raises Rejected.
+        """
+        members = tuple(dict.fromkeys(pid for pid in player_ids if pid is not None))
+        return self._acquire(members, max(1, min(len(player_ids), self.max_concurrency)))
+
+    def _acquire(self, player_ids: tuple[str, ...], slots: int) -> Ticket:
+        if not self.enabled:
+            return Ticket(None)
+        start = time.monotonic()
+        waiter = self._admit_or_enqueue(player_ids, slots, None)
+        if waiter is not None:
+            if not waiter.event.wait(self.queue_timeout):
+                with self._lock:
+                    if self._give_up_locked(waiter):
+                        raise self._timeout_rejection_locked()
+            ADMITTED.inc(queued="true")
+            QUEUE_WAIT.observe(time.monotonic() - start)
+        return Ticket(self, player_ids, slots)
+
+    async def aacquire(self, player_id: str | None = None) -> Ticket:
+        """acquire() for coroutines: waits without blocking the event loop."""
+        if not self.enabled:
+            return Ticket(None)
+        player_ids = () if player_id is None else (player_id,)
+        start = time.monotonic()
+        waiter = self._admit_or_enqueue(player_ids, 1, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if self._give_up_locked(waiter):
+                        raise self._timeout_rejection_locked() from None
+                # Admitted just as the deadline passed: go ahead
+            except asyncio.CancelledError:
+                with self._lock:
+                    gave_up = self._give_up_locked(waiter)
+                if not gave_up:
+                    # Admitted just as the client went away: hand the slot on
+                    Ticket(self, player_ids).release()
+                raise
+            ADMITTED.inc(queued="true")
+            QUEUE_WAIT.observe(time.monotonic() - start)
+        return Ticket(self, player_ids)
+
+    def _admit_waiters_locked(self) -> None:
+        """Hand free slots to waiters in FIFO order, stopping at the first one that doesn't fit yet."""
+        while self._queue and self._in_flight + self._queue[0].slots <= self.max_concurrency:
+            waiter = self._queue.popleft()
+            self._in_flight += waiter.slots
+            waiter.admitted = True
+            waiter.wake()
+
+    def _release(self, player_ids: tuple[str, ...], slots: int, held: float) -> None:
+        with self._lock:
+            self._avg_turn = 0.9 * self._avg_turn + 0.1 * held
+            self._players.difference_update(player_ids)
+            self._in_flight -= slots
+            self._admit_waiters_locked()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "avg_turn_seconds": round(self._avg_turn, 3),
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def from_env() -> AdmissionController:
+    try:
+        timeout = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+    except ValueError:
+        timeout = 10.0
+    return AdmissionController(
+        max_concurrency=_env_int("ADMISSION_MAX_CONCURRENCY", 32),
+        max_queue=_env_int("ADMISSION_MAX_QUEUE", 64),
+        queue_timeout=timeout,
+    )
+
+
+controller = from_env()
+
+metrics.gauge("admission_in_flight", "Turns currently admitted", lambda: controller.stats()["in_flight"])
+metrics.gauge("admission_queue_depth", "Turns waiting for a slot", lambda: controller.stats()["queued"])
@@ -1,9 +1,17 @@
 """
 Flask backend: /api/game-action and /api/stats for React frontend.
 Uses dm_agent (Snowflake first, then OpenRouter/Gemini). CharacterSheet and GameLog fetch from GET /api/stats.
+Importing this module is cheap; warmup.py does the slow first connections in the background (GET /api/ready).
 """
 
 import time
+
+_import_started = time.perf_counter()
+
+import hashlib
+import json
+import logging
+import os
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -11,15 +19,33 @@ from dotenv import load_dotenv
 # Load .env from backend/ so OPENROUTER_API_KEY, SNOWFLAKE_*, etc. are set
 load_dotenv(Path(__file__).resolve().parent / ".env")
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 
-from dm_agent import run_turn
+import conversation_memory
+import metrics
+import state_backend
+import turn_journal
+import warmup
+from admission import Rejected
+from admission import controller as admission
+from dm_agent import ERROR_NARRATIVE, NO_API_KEY_NARRATIVE, run_party_turn, run_turn, run_turn_stream
+from session_store import DEFAULT_PLAYER_ID, LockTimeout, VersionConflict
+from snowflake_db import save_game_turn
+
+CORS_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]  # Vite default
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app, origins=["http://localhost:5173", "http://127.0.0.1:5173"])  # Vite default
+CORS(app, origins=CORS_ORIGINS)
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
 
-# In-memory store for characters and logs (CharacterSheet and GameLog fetch from GET /api/stats)
+# Starting character for every new session (CharacterSheet and GameLog fetch from GET /api/stats)
 DEFAULT_CHARACTER = {
     "id": "valerius-bold-001",
     "name": "Valerius the Bold",
@@ -38,7 +64,62 @@ DEFAULT_CHARACTER = {
     "wis": 12,
     "cha": 8,
 }
-_store = {"characters": [DEFAULT_CHARACTER.copy()], "logs": []}
+# Per-player sessions (character + bounded log + turn lock), keyed by player_id: in this process,
+# or shared between workers with STATE_BACKEND=sqlite|redis; see session_store.py and state_backend.py
+sessions = state_backend.from_env(
+    DEFAULT_CHARACTER,
+    memory_factory=conversation_memory.factory_from_env() if conversation_memory.enabled() else None,
+)
+
+
+def _mark_synced(records: list) -> None:
+    """Journal upload listener: flag the uploaded turns' log entries isSnowflakeSynced in the shared store."""
+    by_player: dict[str, list] = {}
+    for record in records:
+        by_player.setdefault(record.get("player_id"), []).append(record.get("turn_id"))
+    for player_id, turn_ids in by_player.items():
+        sessions.mark_synced(player_id, turn_ids)
+
+
+turn_journal.add_upload_listener(_mark_synced)
+
+# Add a Server-Timing header (per-stage durations from metrics.timed) to API responses
+SERVER_TIMING = _env_flag("METRICS_SERVER_TIMING")
+# Endpoints whose first successful answer counts as the first turn (warmup.record_turn)
+TURN_ENDPOINTS = {"game_action", "game_actions"}
+REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Flask request latency", ["endpoint", "status"])
+LOCK_WAIT = metrics.histogram("state_lock_wait_seconds", "Time turns waited for their players' state locks")
+metrics.gauge("sessions_live", "Live player sessions in the state store", lambda: sessions.stats()["sessions"])
+
+
+@app.before_request
+def _start_timing():
+    g.request_start = time.perf_counter()
+    g.timing_token = metrics.start_request()
+
+
+@app.after_request
+def _finish_timing(response):
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or "unknown", status=response.status_code)
+    if request.endpoint in TURN_ENDPOINTS and response.status_code == 200 and not response.is_streamed:
+        warmup.record_turn(elapsed)
+    token = g.pop("timing_token", None)
+    timings = metrics.end_request(token) if token is not None else []
+    # Streamed bodies are still running here, so their timings would be incomplete
+    if SERVER_TIMING and not response.is_streamed:
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    return response
+
+
+@app.teardown_request
+def _reset_timing(exc):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        metrics.end_request(token)
 
 
 @app.route("/")
@@ -47,65 +128,413 @@ def index():
     return jsonify({
         "message": "API is running. Use the frontend at http://localhost:5173",
         "endpoints": {
-            "GET /api/stats": "Characters and logs for the dashboard",
+            "GET /api/stats": "Characters and logs for the dashboard (?player_id=&since=&limit=, ETag)",
             "POST /api/game-action": "Send a player action, get narrative + updated stats",
+            "POST /api/game-action/stream": "Same as /api/game-action, streamed as Server-Sent Events",
+            "POST /api/game-actions": "A party round: several players' actions resolved together",
+            "GET /api/metrics": "Prometheus metrics (stage latency, queries, tokens, errors)",
             "GET /api/health": "Health check",
+            "GET /api/ready": "Readiness: 200 once the startup warm-up has finished (503 before)",
         },
     })
 
 
+def _int_arg(name: str) -> int | None:
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    n = int(value)  # ValueError -> 400 in get_stats
+    if n < 0:
+        raise ValueError(name)
+    return n
+
+
 @app.route("/api/stats", methods=["GET"])
 def get_stats():
-    """Return characters and logs for CharacterSheet and GameLog."""
-    return jsonify(_store)
+    """
+    Return characters and logs for CharacterSheet and GameLog (oldest log entry first).
+
+    Query params (all optional):
+      player_id  only this player's character and logs
+      since      only log entries with seq > since (use next_cursor from the previous response)
+      limit      at most this many log entries (the newest ones when since is omitted)
+    Responses carry an ETag; send it back in If-None-Match to get 304 when nothing changed.
+    """
+    player_id = request.args.get("player_id") or None
+    try:
+        since = _int_arg("since")
+        limit = _int_arg("limit")
+    except ValueError:
+        return jsonify({"error": "'since' and 'limit' must be non-negative integers"}), 400
+
+    version = sessions.version(player_id)
+    etag = hashlib.sha1(f"{version}|{player_id}|{since}|{limit}".encode("utf-8")).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    characters = sessions.characters(player_id)
+    if not characters and player_id is None:
+        characters = [sessions.default_character()]
+    logs = sessions.logs(player_id, since=since, limit=limit)
+    next_cursor = logs[-1]["seq"] if logs else (since or 0)
+    resp = jsonify({"characters": characters, "logs": logs, "next_cursor": next_cursor})
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def _resolve_stats(data: dict) -> dict:
+    """Stats from the request body, or the player's current character from their session if none were sent."""
+    stats = data.get("stats") or {}
+    if not stats:
+        stats, _ = sessions.state(data.get("player_id"))
+    return stats
+
+
+def _expected_version(data: dict) -> int | None:
+    """The body's "version" (delta protocol), or None for a full-stats request. Raises ValueError if malformed."""
+    version = data.get("version")
+    if version is None:
+        return None
+    if isinstance(version, bool) or not isinstance(version, int) or version < 0:
+        raise ValueError("'version' must be a non-negative integer")
+    return version
+
+
+def _turn_stats(data: dict, expected_version: int | None) -> dict:
+    """
+    Stats a turn starts from. Delta protocol (expected_version given): the session's character,
+    which must still be at that version (raises VersionConflict). Otherwise as _resolve_stats.
+    Call it once the turn is admitted, so no other turn for the player can slip in between.
+    """
+    if expected_version is None:
+        return _resolve_stats(data)
+    stats, _ = sessions.state(data.get("player_id"), expected_version)
+    return stats
+
+
+def _turn_body(result: dict, version: int, delta: bool) -> dict:
+    """
+    Response for a turn. Delta protocol: { narrative, version, changes, monster? } where changes
+    holds only what the turn changed. Full-stats requests: { narrative, stats, monster?, version }.
+    """
+    if delta:
+        body = {"narrative": result.get("narrative", ""), "version": version, "changes": result.get("changes", {})}
+        if "monster" in result:
+            body["monster"] = result["monster"]
+        return body
+    body = {k: v for k, v in result.items() if k != "changes"}
+    body["version"] = version
+    return body
+
+
+def _conflict(exc: VersionConflict):
+    """409 for a delta-protocol turn sent against a stale version: the current state to resync from."""
+    resp = jsonify({"error": str(exc), "reason": "version_conflict", "version": exc.version, "stats": exc.stats})
+    resp.status_code = 409
+    return resp
+
+
+def _history(player_id: str | None) -> str:
+    """The player's conversation memory as a token-capped prompt section ("" when memory is off)."""
+    memory = sessions.memory(player_id)
+    return memory.context() if memory is not None else ""
+
+
+def _use_llm_cache(data: dict, cache_control: str | None) -> bool:
+    """Per-request completion cache bypass: body {"no_cache": true} or header Cache-Control: no-cache."""
+    if data.get("no_cache"):
+        return False
+    return "no-cache" not in (cache_control or "").lower()
+
+
+def _rejected(exc: Rejected):
+    """Fast 429/503 for a turn admission control turned away."""
+    resp = jsonify({"error": str(exc), "reason": exc.reason})
+    resp.status_code = exc.status
+    resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp
+
+
+class _Turn:
+    """An admitted turn: its admission ticket plus its players' state locks. release() frees all; safe to call twice."""
+
+    def __init__(self, ticket, locks: list):
+        self._ticket = ticket
+        self._locks = locks
+
+    def release(self) -> None:
+        for lock in reversed(self._locks):
+            lock.release()
+        self._ticket.release()
+
+    def __enter__(self) -> "_Turn":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def _admit(player_ids: list) -> _Turn:
+    """
+    Admit a turn for these players (admission.py), then take each player's state lock, in a
+    fixed order so party rounds can't deadlock. The locks serialize turns for a player across
+    every worker sharing the state store. Raises Rejected (429 player_busy if a lock times out).
+    Anonymous turns are admitted as DEFAULT_PLAYER_ID, whose state (and lock) they share, so a
+    second one is turned away as player_busy instead of holding a slot while it waits for the lock.
+    """
+    player_ids = [pid or DEFAULT_PLAYER_ID for pid in player_ids]
+    ticket = admission.acquire_many(player_ids)
+    locks = []
+    start = time.perf_counter()
+    try:
+        for player_id in sorted(set(player_ids)):
+            locks.append(sessions.player_lock(player_id).acquire())
+    except LockTimeout as exc:
+        _Turn(ticket, locks).release()
+        raise Rejected(429, "player_busy", 1, str(exc)) from None
+    except BaseException:
+        _Turn(ticket, locks).release()
+        raise
+    LOCK_WAIT.observe(time.perf_counter() - start)
+    return _Turn(ticket, locks)
+
+
+def _journal_turn(action: str, narrative: str, player_id: str | None, character: dict) -> str | None:
+    """Journal the turn for GAME_HISTORY (turn_journal.py); None if journaling is off or failed (logged)."""
+    if not turn_journal.enabled():
+        return None
+    try:
+        return save_game_turn(player_id or "default", action, narrative, {
+            k: character.get(k) for k in ("hp", "gold", "xp", "inventory")
+        })
+    except Exception:
+        logger.warning("could not journal turn for %s", player_id or "default", exc_info=True)
+        return None
+
+
+def _record_turn(action: str, result: dict, player_id: str | None = None, delta: bool = False) -> int:
+    """
+    Commit the turn to the player's character, journal it for GAME_HISTORY and append the user/DM
+    log entries (isSnowflakeSynced is set by _mark_synced once the journal uploads the turn). Delta-protocol
+    turns commit only their "changes"; full-stats turns take the new stats whole. Returns the new
+    state version.
+    """
+    narrative = result.get("narrative", "")
+    if delta:
+        character, version = sessions.apply_changes(player_id, result.get("changes", {}))
+    else:
+        character, version = sessions.update_character(player_id, result.get("stats", {}))
+    memory = sessions.memory(player_id)
+    if memory is not None and narrative and narrative not in (ERROR_NARRATIVE, NO_API_KEY_NARRATIVE):
+        memory.record(action, narrative)
+    turn_id = _journal_turn(action, narrative, player_id, character)
+    ts = time.time()
+    sessions.append_logs(player_id, [
+        {
+            "id": f"user-{ts}",
+            "timestamp": time.strftime("%H:%M:%S", time.localtime(ts)),
+            "role": "user",
+            "content": action,
+            "isSnowflakeSynced": False,
+            "turnId": turn_id,
+        },
+        {
+            "id": f"dm-{ts}",
+            "timestamp": time.strftime("%H:%M:%S", time.localtime(ts)),
+            "role": "dm",
+            "content": narrative,
+            "isSnowflakeSynced": False,
+            "turnId": turn_id,
+        },
+    ])
+    journal = turn_journal.get_journal()
+    if turn_id and journal is not None and journal.is_synced(turn_id):
+        sessions.mark_synced(player_id, [turn_id])  # uploaded before the entries above were appended
+    return version
 
 
 @app.route("/api/game-action", methods=["POST"])
 def game_action():
     """
-    POST body: { "action": "player message", "stats": { "hp", "gold", "xp", "inventory" }, "player_id": "optional" }
+    POST body: { "action": "player message", "stats": { "hp", "gold", "xp", "inventory" }, "player_id": "optional", "no_cache": optional }
     Flow: 1) Query Snowflake for monster data, 2) Call Gemini, 3) Update store and return result.
+
+    Delta protocol: send "version" (from the previous response or GET /api/stats) instead of
+    "stats". The turn starts from the server's copy of the character; the response carries only
+    { narrative, version, changes, monster? }. A stale version gets 409 with the current stats and version.
     """
     data = request.get_json(silent=True) or {}
     action = (data.get("action") or "").strip()
     if not action:
         return jsonify({"error": "Missing 'action' in request body"}), 400
+    try:
+        expected = _expected_version(data)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
-    stats = data.get("stats") or {}
     player_id = data.get("player_id")
-    # Use current character from store if stats not provided
-    if not stats and _store["characters"]:
-        c = _store["characters"][0]
-        stats = {"hp": c.get("hp"), "gold": c.get("gold"), "xp": c.get("xp"), "inventory": c.get("inventory", [])}
 
-    result = run_turn(message=action, stats=stats, player_id=player_id)
-    narrative = result.get("narrative", "")
-    new_stats = result.get("stats", {})
-
-    # Update store: merge into first character and append logs
-    if _store["characters"]:
-        cur = _store["characters"][0]
-        cur["hp"] = new_stats.get("hp", cur.get("hp"))
-        cur["xp"] = new_stats.get("xp", cur.get("xp"))
-        cur["gold"] = new_stats.get("gold", cur.get("gold"))
-        cur["inventory"] = new_stats.get("inventory", cur.get("inventory", []))
-    ts = time.time()
-    _store["logs"].append({
-        "id": f"user-{ts}",
-        "timestamp": time.strftime("%H:%M:%S", time.localtime(ts)),
-        "role": "user",
-        "content": action,
-        "isSnowflakeSynced": False,
-    })
-    _store["logs"].append({
-        "id": f"dm-{ts}",
-        "timestamp": time.strftime("%H:%M:%S", time.localtime(ts)),
-        "role": "dm",
-        "content": narrative,
-        "isSnowflakeSynced": True,
-    })
+    use_cache = _use_llm_cache(data, request.headers.get("Cache-Control"))
+
+    try:
+        turn = _admit([player_id])
+    except Rejected as exc:
+        return _rejected(exc)
+    with turn:
+        try:
+            stats = _turn_stats(data, expected)
+        except VersionConflict as exc:
+            return _conflict(exc)
+        result = run_turn(
+            message=action, stats=stats, player_id=player_id, use_cache=use_cache, history=_history(player_id),
+            delta=expected is not None,
+        )
+        version = _record_turn(action, result, player_id, delta=expected is not None)
+
+    return jsonify(_turn_body(result, version, delta=expected is not None))
+
+
+# Most players resolved by one POST /api/game-actions
+PARTY_MAX_PLAYERS = int(os.environ.get("PARTY_MAX_PLAYERS", "8"))
+
+
+@app.route("/api/game-actions", methods=["POST"])
+def game_actions():
+    """
+    A party round in one request.
+    POST body: { "actions": [ { "player_id", "action", "stats"? | "version"? }, ... ], "mode": "parallel" | "scene", "no_cache": optional }
+    Compendium lookups cover every player's terms in one query per table; "parallel" (default) sends
+    one model call per player concurrently, "scene" resolves the round in one call. New stats are
+    written together. Conversation memory is only sent in "parallel" mode.
+    Returns { "mode", "results": [ { "player_id", "narrative", "stats", "monster"?, "version" }, ... ] };
+    entries sent with "version" use the delta protocol (see game_action) and any stale one fails the round with 409.
+    """
+    data = request.get_json(silent=True) or {}
+    actions = data.get("actions")
+    if not isinstance(actions, list) or not actions:
+        return jsonify({"error": "'actions' must be a non-empty list"}), 400
+    if len(actions) > PARTY_MAX_PLAYERS:
+        return jsonify({"error": f"At most {PARTY_MAX_PLAYERS} actions per request"}), 400
+    mode = data.get("mode") or "parallel"
+    if mode not in ("parallel", "scene"):
+        return jsonify({"error": "'mode' must be 'parallel' or 'scene'"}), 400
 
-    return jsonify(result)
+    members = []
+    for item in actions:
+        item = item if isinstance(item, dict) else {}
+        action = (item.get("action") or "").strip()
+        player_id = item.get("player_id")
+        if not action or not player_id:
+            return jsonify({"error": "Every entry needs 'player_id' and 'action'"}), 400
+        try:
+            expected = _expected_version(item)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        members.append({
+            "player_id": str(player_id), "message": action, "data": item, "expected": expected,
+            "delta": expected is not None,
+        })
+    player_ids = [m["player_id"] for m in members]
+    if len(set(player_ids)) != len(player_ids):
+        return jsonify({"error": "Each player_id may appear only once"}), 400
+
+    use_cache = _use_llm_cache(data, request.headers.get("Cache-Control"))
+
+    try:
+        turn = _admit(player_ids)
+    except Rejected as exc:
+        return _rejected(exc)
+    try:
+        for member in members:
+            member["stats"] = _turn_stats(dict(member["data"], player_id=member["player_id"]), member["expected"])
+        if mode == "parallel":
+            for member in members:
+                member["history"] = _history(member["player_id"])
+        outs = run_party_turn(members, scene=mode == "scene", use_cache=use_cache)
+        results = []
+        for member, out in zip(members, outs):
+            delta = member["expected"] is not None
+            version = _record_turn(member["message"], out, member["player_id"], delta=delta)
+            results.append(dict(_turn_body(out, version, delta), player_id=member["player_id"]))
+    except VersionConflict as exc:
+        return _conflict(exc)
+    finally:
+        turn.release()
+
+    return jsonify({"mode": mode, "results": results})
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route("/api/game-action/stream", methods=["POST"])
+def game_action_stream():
+    """
+    Same body as /api/game-action, answered as Server-Sent Events:
+      event: narrative  data: {"text": "..."}   (repeated as the DM writes)
+      event: done       data: { "narrative", "stats", "monster"?, "version" }   (same as /api/game-action)
+      event: error      data: {"error": "..."}
+    """
+    data = request.get_json(silent=True) or {}
+    action = (data.get("action") or "").strip()
+    if not action:
+        return jsonify({"error": "Missing 'action' in request body"}), 400
+    try:
+        expected = _expected_version(data)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    player_id = data.get("player_id")
+    use_cache = _use_llm_cache(data, request.headers.get("Cache-Control"))
+
+    # Admit (and check the version) before the stream starts so a rejection is still a plain 429/503/409
+    try:
+        turn = _admit([player_id])
+    except Rejected as exc:
+        return _rejected(exc)
+    try:
+        stats = _turn_stats(data, expected)
+    except VersionConflict as exc:
+        turn.release()
+        return _conflict(exc)
+
+    history = _history(player_id)
+
+    def events():
+        try:
+            for kind, value in run_turn_stream(
+                message=action, stats=stats, player_id=player_id, use_cache=use_cache, history=history,
+                delta=expected is not None,
+            ):
+                if kind == "narrative":
+                    yield _sse("narrative", {"text": value})
+                else:
+                    version = _record_turn(action, value, player_id, delta=expected is not None)
+                    yield _sse("done", _turn_body(value, version, delta=expected is not None))
+        except Exception:
+            logger.exception("streamed turn failed")
+            yield _sse("error", {"error": "The DM could not process that action."})
+        finally:
+            turn.release()
+
+    resp = Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Frees the slot and locks even if the body is never iterated (release is idempotent)
+    resp.call_on_close(turn.release)
+    return resp
+
+
+@app.route("/api/metrics")
+def get_metrics():
+    """Prometheus text exposition of metrics.py (turn stages, Snowflake, LLM, caches, sessions)."""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/api/health")
@@ -113,5 +542,19 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@app.route("/api/ready")
+def ready():
+    """
+    Readiness probe, separate from /api/health (liveness): 200 once the boot warm-up has
+    finished, 503 while it runs. The body lists each warm-up step and the startup timings.
+    """
+    body = warmup.status()
+    return jsonify(body), 200 if body["ready"] else 503
+
+
+warmup.mark_imported(_import_started)
+warmup.start()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
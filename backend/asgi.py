@@ -0,0 +1,200 @@
+"""
+ASGI entry point: serves POST /api/game-action with the asyncio turn pipeline
+(dm_agent.run_turn_async) and hands every other route to the Flask app.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+One process can then keep many turns in flight while they wait on the LLM,
+instead of tying up one Flask worker thread per request.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+import llm_client
+import metrics
+import warmup
+from admission import Rejected
+from admission import controller as admission
+from app import (
+    CORS_ORIGINS,
+    LOCK_WAIT,
+    REQUEST_SECONDS,
+    SERVER_TIMING,
+    _expected_version,
+    _history,
+    _record_turn,
+    _turn_body,
+    _turn_stats,
+    _use_llm_cache,
+    sessions,
+)
+from app import app as flask_app
+from dm_agent import run_turn_async
+from session_store import DEFAULT_PLAYER_ID, LockTimeout, PlayerLock, VersionConflict
+from snowflake_db import flush_player_stats
+from turn_journal import close_journal
+
+logger = logging.getLogger(__name__)
+
+_flask = WsgiToAsgi(flask_app)
+
+# Cap request bodies on the async route (Flask routes keep their own limits)
+MAX_BODY_BYTES = 1024 * 1024
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise OverflowError("request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(
+    send, scope, status: int, payload: dict, server_timing: str | None = None, retry_after: int | None = None
+) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    if server_timing:
+        headers.append((b"server-timing", server_timing.encode("latin-1")))
+    origin = dict(scope.get("headers") or []).get(b"origin", b"").decode("latin-1")
+    if origin in CORS_ORIGINS:
+        headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+        headers.append((b"vary", b"Origin"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lock_player(player_id: str | None) -> PlayerLock:
+    """The player's state lock (see app._admit), taken off the event loop. Raises Rejected on timeout."""
+    lock = sessions.player_lock(player_id)
+    start = time.perf_counter()
+    task = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+    try:
+        await asyncio.shield(task)
+    except LockTimeout as exc:
+        raise Rejected(429, "player_busy", 1, str(exc)) from None
+    except asyncio.CancelledError:
+        # The client went away while we waited: let go of the lock as soon as the thread gets it
+        task.add_done_callback(lambda _: lock.release())
+        raise
+    LOCK_WAIT.observe(time.perf_counter() - start)
+    return lock
+
+
+async def game_action(scope, receive, send) -> None:
+    """Async twin of app.game_action: same request body and response."""
+    try:
+        raw = await _read_body(receive)
+    except OverflowError:
+        await _send_json(send, scope, 413, {"error": "Request body too large"})
+        return
+    try:
+        data = json.loads(raw or b"{}")
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    action = (data.get("action") or "").strip()
+    if not action:
+        await _send_json(send, scope, 400, {"error": "Missing 'action' in request body"})
+        return
+    try:
+        expected = _expected_version(data)
+    except ValueError as exc:
+        await _send_json(send, scope, 400, {"error": str(exc)})
+        return
+
+    player_id = data.get("player_id")
+    cache_control = dict(scope.get("headers") or []).get(b"cache-control", b"").decode("latin-1")
+    use_cache = _use_llm_cache(data, cache_control)
+
+    start = time.perf_counter()
+    try:
+        # Anonymous turns share DEFAULT_PLAYER_ID's state lock: admit them as that player (see app._admit)
+        ticket = await admission.aacquire(player_id or DEFAULT_PLAYER_ID)
+        try:
+            lock = await _lock_player(player_id)
+        except BaseException:
+            ticket.release()
+            raise
+    except Rejected as exc:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="game_action_async", status=exc.status)
+        await _send_json(send, scope, exc.status, {"error": str(exc), "reason": exc.reason}, retry_after=exc.retry_after)
+        return
+    token = metrics.start_request()
+    try:
+        with ticket:
+            try:
+                try:
+                    # Off the event loop too: with STATE_BACKEND=sqlite|redis this reads the shared store
+                    stats = await asyncio.to_thread(_turn_stats, data, expected)
+                except VersionConflict as exc:
+                    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint="game_action_async", status=409)
+                    await _send_json(send, scope, 409, {
+                        "error": str(exc), "reason": "version_conflict", "version": exc.version, "stats": exc.stats,
+                    })
+                    return
+                result = await run_turn_async(
+                    message=action, stats=stats, player_id=player_id, use_cache=use_cache, history=_history(player_id),
+                    delta=expected is not None,
+                )
+                # Off the event loop: journaling may fsync (TURN_JOURNAL_FSYNC)
+                version = await asyncio.to_thread(_record_turn, action, result, player_id, expected is not None)
+            finally:
+                await asyncio.to_thread(lock.release)
+    finally:
+        timings = metrics.end_request(token)
+    body = _turn_body(result, version, delta=expected is not None)
+    elapsed = time.perf_counter() - start
+    REQUEST_SECONDS.observe(elapsed, endpoint="game_action_async", status=200)
+    warmup.record_turn(elapsed)
+    await _send_json(send, scope, 200, body, metrics.server_timing(timings, elapsed) if SERVER_TIMING else None)
+
+
+async def _prime_async_client() -> None:
+    """The warm-up's llm step for this event loop's AsyncOpenAI client (warmup.py primes the sync one)."""
+    try:
+        await llm_client.aprime()
+    except Exception:
+        logger.warning("could not prime the async LLM client", exc_info=True)
+
+
+async def _lifespan(receive, send) -> None:
+    primer = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if "llm" in warmup.configured_steps():
+                primer = asyncio.create_task(_prime_async_client())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if primer is not None:
+                primer.cancel()
+            # Write any queued PLAYER_STATS and journaled turns before the process exits
+            await asyncio.to_thread(flush_player_stats, 10.0)
+            await asyncio.to_thread(close_journal, 10.0)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/api/game-action":
+        await game_action(scope, receive, send)
+        return
+    await _flask(scope, receive, send)
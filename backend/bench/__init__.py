@@ -0,0 +1 @@
+"""Offline benchmark harness: SQLite stand-in for Snowflake and a fake OpenRouter server."""
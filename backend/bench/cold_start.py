@@ -0,0 +1,159 @@
+"""
+Cold-start benchmark: import time, warm-up and time to first turn, fully offline.
+
+Each trial is a fresh Python process that imports app.py against the bench fakes
+(bench/fake_snowflake.py with a simulated login delay, bench/fake_openrouter.py) and
+serves one POST /api/game-action through the Flask test client. Two modes are compared:
+
+  cold  no warm-up: the first turn pays for the first Snowflake login, the OpenAI
+        SDK import and the first connection to the model API
+  warm  WARMUP_STEPS=all: the process waits for GET /api/ready, then serves the turn
+
+Reported per mode (median over trials): app import seconds, seconds until ready,
+first-turn latency, time from import start to the first turn's answer, and peak RSS.
+
+    cd backend
+    python -m bench.cold_start --trials 3 --connect-latency 0.5
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import fake_snowflake  # noqa: E402
+from bench.fake_openrouter import FakeOpenRouter  # noqa: E402
+from bench.run_bench import RESULTS_DIR, write_report  # noqa: E402
+
+MODES = ("cold", "warm")
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def child(args: argparse.Namespace) -> int:
+    """One trial, in a fresh process: prints one JSON line of timings."""
+    fake_snowflake.install(args.db_path, connect_latency=args.connect_latency, query_latency=args.db_latency)
+    import app
+    import warmup
+
+    client = app.app.test_client()
+    ready_wait = None
+    if args.mode == "warm":
+        start = time.perf_counter()
+        while client.get("/api/ready").status_code != 200:
+            time.sleep(0.01)
+        ready_wait = time.perf_counter() - start
+    start = time.perf_counter()
+    resp = client.post("/api/game-action", json={"action": "I attack the goblin", "player_id": "cold", "no_cache": True})
+    turn = time.perf_counter() - start
+    status = warmup.status()
+    print(json.dumps({
+        "status": resp.status_code,
+        "import": status["timings"]["import"],
+        "ready_wait": round(ready_wait, 3) if ready_wait is not None else None,
+        "warmup": status["timings"]["warmup"],
+        "first_turn": round(turn, 3),
+        "to_first_turn": status["timings"]["to_first_turn"],
+        "steps": status["steps"],
+        "openai_imported": "openai" in sys.modules,
+        "peak_rss_mb": _peak_rss_mb(),
+    }))
+    import turn_journal
+
+    turn_journal.close_journal(5.0)
+    return 0
+
+
+def _trial(mode: str, args: argparse.Namespace, env: dict[str, str]) -> dict[str, Any]:
+    cmd = [
+        sys.executable, "-m", "bench.cold_start", "--child", "--mode", mode, "--db-path", args.db_path,
+        "--connect-latency", str(args.connect_latency), "--db-latency", str(args.db_latency),
+    ]
+    env = dict(env, WARMUP_STEPS="all" if mode == "warm" else "")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run(cmd, cwd=backend_dir, env=env, capture_output=True, text=True, timeout=300)
+    lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+    if out.returncode != 0 or not lines:
+        raise RuntimeError(f"{mode} trial failed:\n{out.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def _median(values: list[Any]) -> float | None:
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=3, help="fresh processes per mode")
+    parser.add_argument("--connect-latency", type=float, default=0.5, help="simulated Snowflake login time")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="simulated latency per DB round trip")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake model latency (seconds)")
+    parser.add_argument(
+        "--out", default=os.path.join(RESULTS_DIR, "cold_start.json"), help="JSON results file ('-' for stdout only)"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, default="cold", help=argparse.SUPPRESS)
+    parser.add_argument("--db-path", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child(args)
+
+    fake_llm = FakeOpenRouter(latency=args.llm_latency).start()
+    tmpdir = tempfile.TemporaryDirectory(prefix="dm-cold-")
+    args.db_path = os.path.join(tmpdir.name, "snowflake.sqlite")
+    fake_snowflake.create_fixture(args.db_path)
+    env = dict(
+        os.environ,
+        OPENROUTER_BASE_URL=fake_llm.base_url,
+        OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY", "bench"),
+        LLM_CACHE_ENABLED="0",
+        DM_ROUTING="0",
+        STATE_BACKEND="memory",
+        TURN_JOURNAL_DIR=os.path.join(tmpdir.name, "journal"),
+    )
+    results = []
+    try:
+        for mode in MODES:
+            trials = [_trial(mode, args, env) for _ in range(args.trials)]
+            row = {"mode": mode, "trials": len(trials), "errors": sum(t["status"] != 200 for t in trials)}
+            for key in ("import", "ready_wait", "first_turn", "to_first_turn", "peak_rss_mb"):
+                row[key] = _median([t[key] for t in trials])
+            row["runs"] = trials
+            results.append(row)
+            print(
+                f"{mode:<5} import={row['import']}s ready_wait={row['ready_wait']}s "
+                f"first_turn={row['first_turn']}s to_first_turn={row['to_first_turn']}s "
+                f"peak_rss={row['peak_rss_mb']}MB errors={row['errors']}"
+            )
+    finally:
+        fake_llm.stop()
+        tmpdir.cleanup()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "child", "mode", "db_path")},
+        "results": results,
+    }
+    write_report(report, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+"""
+Fake OpenAI-compatible chat completions server for benchmarks.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with a canned DM
+JSON answer after a configurable delay, so llm_client / dm_agent can be exercised
+without OpenRouter. Point the backend at it with OPENROUTER_BASE_URL.
+
+    python -m bench.fake_openrouter --port 8090 --latency 0.8 --jitter 0.2
+    OPENROUTER_BASE_URL=http://127.0.0.1:8090/v1 OPENROUTER_API_KEY=x python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+DEFAULT_RESULT = {
+    "narrative": "The torchlight flickers as you press on. Something skitters in the dark ahead, "
+    "and the air grows cold. You steady your grip and wait for it to show itself.",
+    "hp_change": 0,
+    "xp_change": 10,
+    "gold_change": 2,
+    "new_items": [],
+}
+
+
+class FakeOpenRouter:
+    """
+    Threaded HTTP server answering chat completions after latency +/- jitter seconds.
+    error_rate is the fraction of requests answered with a 503 (to exercise retries).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        chunk_chars: int = 24,
+        result: dict[str, Any] | None = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_chars = max(1, chunk_chars)
+        self.result = result or DEFAULT_RESULT
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "streams": 0, "errors": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenRouter":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler signature
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    body = {}
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                fake._count("requests")
+                time.sleep(fake._delay())
+                if fake.error_rate and random.random() < fake.error_rate:
+                    fake._count("errors")
+                    return self._send_json(503, {"error": {"message": "fake upstream overloaded"}})
+                if body.get("stream"):
+                    fake._count("streams")
+                    return self._send_stream(body)
+                self._send_json(200, self._completion(body))
+
+            def _usage(self, body: dict[str, Any], content: str) -> dict[str, int]:
+                prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+                prompt, completion = prompt_chars // 4 + 1, len(content) // 4 + 1
+                return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+            def _completion(self, body: dict[str, Any]) -> dict[str, Any]:
+                content = json.dumps(fake.result)
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    ],
+                    "usage": self._usage(body, content),
+                }
+
+            def _send_json(self, status: int, payload: dict[str, Any]) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, body: dict[str, Any]) -> None:
+                content = json.dumps(fake.result)
+                cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def event(delta: dict[str, Any], finish: str | None = None) -> None:
+                    chunk = {
+                        "id": cid,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+                event({"role": "assistant", "content": ""})
+                for i in range(0, len(content), fake.chunk_chars):
+                    event({"content": content[i:i + fake.chunk_chars]})
+                event({}, "stop")
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="uniform +/- jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = FakeOpenRouter(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"fake OpenRouter listening on {server.base_url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
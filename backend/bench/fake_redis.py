@@ -0,0 +1,375 @@
+"""
+In-memory stand-in for a Redis server, for testing state_backend.RedisStateStore
+without one.
+
+Speaks RESP2 over TCP and implements the commands RedisStateStore uses (strings
+with expiry, counters, lists, sorted sets, WATCH/MULTI/EXEC transactions). One
+global lock serializes commands, as Redis' single thread does.
+
+    python -m bench.fake_redis --port 6390
+    STATE_BACKEND=redis STATE_REDIS_URL=redis://127.0.0.1:6390/0 python app.py
+"""
+
+import argparse
+import socket
+import socketserver
+import threading
+import time
+from typing import Any
+
+
+class _Error(Exception):
+    pass
+
+
+def _score(text: str, exclusive_ok: bool = True) -> tuple[float, bool]:
+    """(value, exclusive) for a ZRANGEBYSCORE bound like '1.5', '(1.5', '-inf', '+inf'."""
+    exclusive = exclusive_ok and text.startswith("(")
+    text = text[1:] if exclusive else text
+    try:
+        return float(text), exclusive
+    except ValueError:
+        raise _Error("ERR min or max is not a float") from None
+
+
+class FakeRedis:
+    """Threaded RESP server over an in-memory keyspace. host/port 0 picks a free port."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str | None = None):
+        self.password = password
+        self._lock = threading.Lock()
+        self._data: dict[str, Any] = {}  # key -> str | list | dict (zset: member -> score)
+        self._expires: dict[str, float] = {}  # key -> monotonic deadline
+        self._versions: dict[str, int] = {}  # key -> change counter, for WATCH
+        self._clock = 0
+        self._commands = 0
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                fake._serve(self.rfile, self.wfile)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def start(self) -> "FakeRedis":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"commands": self._commands, "keys": len(self._data)}
+
+    # -- protocol ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _read_command(rfile) -> list[str] | None:
+        line = rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode("utf-8").split()  # inline command (e.g. from telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            n = int(rfile.readline()[1:])
+            args.append(rfile.read(n + 2)[:-2].decode("utf-8"))
+        return args
+
+    @classmethod
+    def _encode(cls, value: Any) -> bytes:
+        if isinstance(value, _Error):
+            return b"-%s\r\n" % str(value).encode("utf-8")
+        if value is True:
+            return b"+OK\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(cls._encode(v) for v in value)
+        if isinstance(value, tuple):  # simple string, e.g. ("QUEUED",)
+            return b"+%s\r\n" % value[0].encode("utf-8")
+        data = str(value).encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def _serve(self, rfile, wfile) -> None:
+        conn = {"authed": not self.password, "watched": None, "queue": None}
+        while True:
+            try:
+                args = self._read_command(rfile)
+            except (OSError, ValueError):
+                return
+            if not args:
+                return
+            wfile.write(self._encode(self._dispatch(conn, args)))
+            wfile.flush()
+
+    def _dispatch(self, conn: dict[str, Any], args: list[str]) -> Any:
+        name = args[0].upper()
+        if name == "AUTH":
+            if args[-1] != self.password:
+                return _Error("WRONGPASS invalid password")
+            conn["authed"] = True
+            return True
+        if not conn["authed"]:
+            return _Error("NOAUTH Authentication required.")
+        with self._lock:
+            self._commands += 1
+            if name == "MULTI":
+                conn["queue"] = []
+                return True
+            if name == "DISCARD":
+                conn["queue"] = conn["watched"] = None
+                return True
+            if name == "EXEC":
+                queue, watched = conn["queue"], conn["watched"]
+                conn["queue"] = conn["watched"] = None
+                if queue is None:
+                    return _Error("ERR EXEC without MULTI")
+                if watched and any(self._version(k) != v for k, v in watched.items()):
+                    return None  # a watched key changed: the transaction is dropped
+                return [self._run(cmd) for cmd in queue]
+            if conn["queue"] is not None:
+                conn["queue"].append(args)
+                return ("QUEUED",)
+            if name == "WATCH":
+                conn["watched"] = dict(conn["watched"] or {}, **{k: self._version(k) for k in args[1:]})
+                return True
+            if name == "UNWATCH":
+                conn["watched"] = None
+                return True
+            return self._run(args)
+
+    # -- keyspace ----------------------------------------------------------------------------
+
+    def _version(self, key: str) -> int:
+        self._get(key)  # an expired key counts as changed
+        return self._versions.get(key, 0)
+
+    def _touch(self, key: str) -> None:
+        self._clock += 1
+        self._versions[key] = self._clock
+
+    def _get(self, key: str, kind: type | None = None) -> Any:
+        deadline = self._expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self._delete(key)
+        value = self._data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _delete(self, key: str) -> bool:
+        self._expires.pop(key, None)
+        if self._data.pop(key, None) is None:
+            return False
+        self._touch(key)
+        return True
+
+    def _set(self, key: str, value: Any, keep_ttl: bool = False) -> None:
+        self._data[key] = value
+        if not keep_ttl:
+            self._expires.pop(key, None)
+        self._touch(key)
+
+    def _run(self, args: list[str]) -> Any:
+        name, rest = args[0].upper(), args[1:]
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return _Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(*rest)
+        except _Error as exc:
+            return exc
+        except (TypeError, ValueError, IndexError):
+            return _Error(f"ERR wrong arguments for '{name}'")
+
+    def _cmd_ping(self, *args: str) -> Any:
+        return args[0] if args else ("PONG",)
+
+    def _cmd_select(self, db: str) -> Any:
+        return True  # one keyspace for every db
+
+    def _cmd_flushdb(self) -> Any:
+        for key in list(self._data):
+            self._delete(key)
+        return True
+
+    def _cmd_get(self, key: str) -> Any:
+        return self._get(key, str)
+
+    def _cmd_set(self, key: str, value: str, *options: str) -> Any:
+        opts = [o.upper() for o in options]
+        if "NX" in opts and self._get(key) is not None:
+            return None
+        if "XX" in opts and self._get(key) is None:
+            return None
+        self._set(key, value, keep_ttl="KEEPTTL" in opts)
+        for unit, scale in (("PX", 0.001), ("EX", 1.0)):
+            if unit in opts:
+                self._expires[key] = time.monotonic() + int(options[opts.index(unit) + 1]) * scale
+        return True
+
+    def _cmd_del(self, *keys: str) -> Any:
+        return sum(self._delete(k) for k in keys if self._get(k) is not None)
+
+    def _cmd_incrby(self, key: str, n: str) -> Any:
+        try:
+            value = int(self._get(key, str) or 0) + int(n)
+        except ValueError:
+            raise _Error("ERR value is not an integer or out of range") from None
+        self._set(key, str(value), keep_ttl=True)
+        return value
+
+    def _cmd_incr(self, key: str) -> Any:
+        return self._cmd_incrby(key, "1")
+
+    def _cmd_pexpire(self, key: str, ms: str) -> Any:
+        if self._get(key) is None:
+            return 0
+        self._expires[key] = time.monotonic() + int(ms) / 1000
+        self._touch(key)
+        return 1
+
+    def _cmd_expire(self, key: str, seconds: str) -> Any:
+        return self._cmd_pexpire(key, str(int(seconds) * 1000))
+
+    def _cmd_pttl(self, key: str) -> Any:
+        if self._get(key) is None:
+            return -2
+        deadline = self._expires.get(key)
+        return -1 if deadline is None else max(0, int((deadline - time.monotonic()) * 1000))
+
+    @staticmethod
+    def _span(length: int, start: str, stop: str) -> tuple[int, int]:
+        """Redis' inclusive (start, stop) indexes, negatives from the end, clamped -> Python slice bounds."""
+        lo, hi = int(start), int(stop)
+        lo = max(0, lo + length if lo < 0 else lo)
+        hi = hi + length if hi < 0 else min(hi, length - 1)
+        return lo, hi + 1
+
+    def _cmd_rpush(self, key: str, *values: str) -> Any:
+        items = self._get(key, list)
+        if items is None:
+            items = []
+            self._set(key, items)
+        items.extend(values)
+        self._touch(key)
+        return len(items)
+
+    def _cmd_lrange(self, key: str, start: str, stop: str) -> Any:
+        items = self._get(key, list) or []
+        lo, hi = self._span(len(items), start, stop)
+        return items[lo:hi]
+
+    def _cmd_lset(self, key: str, index: str, value: str) -> Any:
+        items = self._get(key, list)
+        if items is None:
+            raise _Error("ERR no such key")
+        i = int(index)
+        if not -len(items) <= i < len(items):
+            raise _Error("ERR index out of range")
+        items[i] = value
+        self._touch(key)
+        return True
+
+    def _cmd_ltrim(self, key: str, start: str, stop: str) -> Any:
+        items = self._get(key, list)
+        if items is not None:
+            lo, hi = self._span(len(items), start, stop)
+            items[:] = items[lo:hi]
+            if not items:
+                self._delete(key)
+            else:
+                self._touch(key)
+        return True
+
+    def _zset(self, key: str, create: bool = False) -> dict[str, float] | None:
+        zset = self._get(key, dict)
+        if zset is None and create:
+            zset = {}
+            self._set(key, zset)
+        return zset
+
+    @staticmethod
+    def _sorted(zset: dict[str, float]) -> list[str]:
+        return [m for m, _ in sorted(zset.items(), key=lambda item: (item[1], item[0]))]
+
+    def _in_range(self, zset: dict[str, float], lo: str, hi: str) -> list[str]:
+        (low, low_ex), (high, high_ex) = _score(lo), _score(hi)
+        return [
+            m for m in self._sorted(zset)
+            if (zset[m] > low if low_ex else zset[m] >= low) and (zset[m] < high if high_ex else zset[m] <= high)
+        ]
+
+    def _cmd_zadd(self, key: str, *pairs: str) -> Any:
+        zset = self._zset(key, create=True)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in zset
+            zset[member] = _score(score, exclusive_ok=False)[0]
+        self._touch(key)
+        return added
+
+    def _cmd_zrem(self, key: str, *members: str) -> Any:
+        zset = self._zset(key) or {}
+        removed = sum(zset.pop(m, None) is not None for m in members)
+        if removed:
+            self._touch(key)
+        return removed
+
+    def _cmd_zcard(self, key: str) -> Any:
+        return len(self._zset(key) or {})
+
+    def _cmd_zcount(self, key: str, lo: str, hi: str) -> Any:
+        return len(self._in_range(self._zset(key) or {}, lo, hi))
+
+    def _cmd_zrange(self, key: str, start: str, stop: str) -> Any:
+        members = self._sorted(self._zset(key) or {})
+        lo, hi = self._span(len(members), start, stop)
+        return members[lo:hi]
+
+    def _cmd_zrangebyscore(self, key: str, lo: str, hi: str) -> Any:
+        return self._in_range(self._zset(key) or {}, lo, hi)
+
+    def _cmd_zremrangebyscore(self, key: str, lo: str, hi: str) -> Any:
+        zset = self._zset(key) or {}
+        members = self._in_range(zset, lo, hi)
+        for m in members:
+            del zset[m]
+        if members:
+            self._touch(key)
+        return len(members)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+    server = FakeRedis(args.host, args.port, args.password)
+    print(f"fake Redis listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
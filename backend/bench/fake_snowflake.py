@@ -0,0 +1,325 @@
+"""
+Local stand-in for Snowflake, backed by a SQLite file.
+
+FakeSnowflakeConnection implements the small DB-API surface snowflake_db and
+game_engine use (cursor/execute/fetchone/fetchall/commit/rollback/close) and maps
+each of their statements onto equivalent SQLite SQL over the same table layout:
+COMPENDIUM, MONSTERS (JSON document in DATA), PLAYER_STATS and GAME_HISTORY.
+Every execute() counts as one round trip, and connect/query latency can be
+simulated, so benchmarks see the same call pattern as production.
+
+    from bench import fake_snowflake
+    fake_snowflake.install(db_path)          # snowflake_db now talks to SQLite
+    fake_snowflake.stats()                   # {"connects": ..., "round_trips": ..., "by_kind": {...}}
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+SEED_MONSTERS = [
+    {"name": "Goblin", "type": "humanoid", "hit_points": 7, "armor_class": [{"value": 15}],
+     "special_abilities": [{"name": "Nimble Escape", "desc": "Disengage or Hide as a bonus action."}]},
+    {"name": "Goblin Boss", "type": "humanoid", "hit_points": 21, "armor_class": [{"value": 17}],
+     "special_abilities": [{"name": "Redirect Attack", "desc": "Swap places with a goblin."}]},
+    {"name": "Orc", "type": "humanoid", "hit_points": 15, "armor_class": [{"value": 13}],
+     "special_abilities": [{"name": "Aggressive", "desc": "Move toward a hostile creature as a bonus action."}]},
+    {"name": "Skeleton", "type": "undead", "hit_points": 13, "armor_class": [{"value": 13}], "special_abilities": []},
+    {"name": "Zombie", "type": "undead", "hit_points": 22, "armor_class": [{"value": 8}],
+     "special_abilities": [{"name": "Undead Fortitude", "desc": "May drop to 1 HP instead of 0."}]},
+    {"name": "Wolf", "type": "beast", "hit_points": 11, "armor_class": [{"value": 13}],
+     "special_abilities": [{"name": "Pack Tactics", "desc": "Advantage when an ally is adjacent."}]},
+    {"name": "Owlbear", "type": "monstrosity", "hit_points": 59, "armor_class": [{"value": 13}],
+     "special_abilities": [{"name": "Keen Sight and Smell", "desc": "Advantage on Perception."}]},
+    {"name": "Aboleth", "type": "aberration", "hit_points": 135, "armor_class": [{"value": 17}],
+     "special_abilities": [{"name": "Amphibious", "desc": "Can breathe air and water."}]},
+    {"name": "Young Red Dragon", "type": "dragon", "hit_points": 178, "armor_class": [{"value": 18}],
+     "special_abilities": []},
+    {"name": "Adult Red Dragon", "type": "dragon", "hit_points": 256, "armor_class": [{"value": 19}],
+     "special_abilities": [{"name": "Legendary Resistance", "desc": "3/day, choose to succeed a failed save."}]},
+    {"name": "Giant Spider", "type": "beast", "hit_points": 26, "armor_class": [{"value": 14}],
+     "special_abilities": [{"name": "Web Walker", "desc": "Ignores movement restrictions caused by webbing."}]},
+    {"name": "Troll", "type": "giant", "hit_points": 84, "armor_class": [{"value": 15}],
+     "special_abilities": [{"name": "Regeneration", "desc": "Regains 10 HP at the start of its turn."}]},
+]
+
+SEED_COMPENDIUM = [
+    ("Goblin", "monster", 7, 15, "Small, black-hearted humanoids that lair in despoiled dungeons."),
+    ("Orc", "monster", 15, 13, "Savage raiders with a hunger for slaughter."),
+    ("Owlbear", "monster", 59, 13, "A monstrous cross between a giant owl and a bear."),
+    ("Troll", "monster", 84, 15, "Horrifying giants that regrow severed limbs."),
+    ("Longsword", "item", None, None, "Martial melee weapon, 1d8 slashing (versatile 1d10)."),
+    ("Shield", "item", None, None, "+2 AC while wielded."),
+    ("Healing Potion", "item", None, None, "Regain 2d4 + 2 hit points."),
+    ("Rations", "item", None, None, "Dry food suitable for one day of travel."),
+    ("Torch", "item", None, None, "Bright light in a 20-foot radius for 1 hour."),
+    ("Phandalin", "lore", None, None, "A frontier town built on the ruins of an older settlement."),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS COMPENDIUM (name TEXT, type TEXT, hp INTEGER, ac INTEGER, description TEXT);
+CREATE TABLE IF NOT EXISTS MONSTERS (DATA TEXT);
+CREATE TABLE IF NOT EXISTS PLAYER_STATS (
+    player_id TEXT PRIMARY KEY, hp INTEGER, gold INTEGER, xp INTEGER, inventory TEXT, updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS GAME_HISTORY (
+    turn_id TEXT UNIQUE, player_name TEXT, action TEXT, narrative TEXT, stats TEXT, created_at REAL
+);
+"""
+
+_MONSTER_COLS = (
+    "json_extract(DATA, '$.name'), json_extract(DATA, '$.hit_points'), "
+    "json_extract(DATA, '$.armor_class[0].value'), json_extract(DATA, '$.type'), "
+    "json_extract(DATA, '$.special_abilities')"
+)
+
+_stats_lock = threading.Lock()
+_stats: dict[str, Any] = {"connects": 0, "round_trips": 0, "by_kind": {}}
+
+
+def _count(kind: str) -> None:
+    with _stats_lock:
+        _stats["round_trips"] += 1
+        _stats["by_kind"][kind] = _stats["by_kind"].get(kind, 0) + 1
+
+
+def stats() -> dict[str, Any]:
+    with _stats_lock:
+        return {"connects": _stats["connects"], "round_trips": _stats["round_trips"], "by_kind": dict(_stats["by_kind"])}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.update(connects=0, round_trips=0, by_kind={})
+
+
+def create_fixture(path: str, monsters: list[dict] | None = None, compendium: list[tuple] | None = None) -> None:
+    """Create (or reset) the SQLite fixture with the seed compendium and monsters."""
+    db = sqlite3.connect(path)
+    try:
+        db.executescript(SCHEMA)
+        db.execute("PRAGMA journal_mode=WAL")
+        for table in ("COMPENDIUM", "MONSTERS", "PLAYER_STATS", "GAME_HISTORY"):
+            db.execute(f"DELETE FROM {table}")
+        db.executemany("INSERT INTO COMPENDIUM VALUES (?, ?, ?, ?, ?)", compendium or SEED_COMPENDIUM)
+        db.executemany("INSERT INTO MONSTERS VALUES (?)", [(json.dumps(m),) for m in (monsters or SEED_MONSTERS)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _norm(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class FakeSnowflakeCursor:
+    def __init__(self, conn: "FakeSnowflakeConnection"):
+        self._conn = conn
+        self._rows: list[tuple] = []
+        self.rowcount = 0
+
+    def execute(self, sql: str, params: tuple | list | None = None) -> "FakeSnowflakeCursor":
+        params = tuple(params or ())
+        q = _norm(sql)
+        for pattern, kind, handler in _HANDLERS:
+            if pattern.search(q):
+                _count(kind)
+                if self._conn.query_latency:
+                    time.sleep(self._conn.query_latency)
+                self._rows = handler(self._conn.db, q, params) or []
+                self.rowcount = len(self._rows)
+                return self
+        raise NotImplementedError(f"fake_snowflake: unsupported statement: {q[:120]}")
+
+    def executemany(self, sql: str, seq_of_params) -> "FakeSnowflakeCursor":
+        for params in seq_of_params:
+            self.execute(sql, params)
+        return self
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self) -> None:
+        self._rows = []
+
+
+class FakeSnowflakeConnection:
+    def __init__(self, path: str, connect_latency: float = 0.0, query_latency: float = 0.0):
+        if connect_latency:
+            time.sleep(connect_latency)
+        with _stats_lock:
+            _stats["connects"] += 1
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.query_latency = query_latency
+        self._closed = False
+
+    def cursor(self) -> FakeSnowflakeCursor:
+        return FakeSnowflakeCursor(self)
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def rollback(self) -> None:
+        self.db.rollback()
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.db.close()
+
+
+def connection_factory(path: str, connect_latency: float = 0.0, query_latency: float = 0.0) -> Callable[[], Any]:
+    return lambda: FakeSnowflakeConnection(path, connect_latency, query_latency)
+
+
+def install(path: str, connect_latency: float = 0.0, query_latency: float = 0.0) -> None:
+    """Point snowflake_db (and game_engine, which shares its pool) at the SQLite fixture."""
+    import snowflake_db
+
+    snowflake_db.set_connection_factory(connection_factory(path, connect_latency, query_latency))
+    snowflake_db.clear_caches()
+
+
+# ---- statement handlers: (regex on normalized SQL, kind, fn(db, sql, params) -> rows) ----
+
+
+def _select_1(db, q, params):
+    return [(1,)]
+
+
+def _compendium_in(db, q, params):
+    marks = ", ".join("?" * len(params))
+    return db.execute(
+        f"SELECT name, type, hp, ac, description FROM COMPENDIUM WHERE UPPER(TRIM(name)) IN ({marks})", params
+    ).fetchall()
+
+
+def _compendium_all(db, q, params):
+    return db.execute("SELECT name, type, hp, ac, description FROM COMPENDIUM").fetchall()
+
+
+def _monsters_bulk(db, q, params):
+    rows = []
+    for i in range(0, len(params), 2):
+        idx, pattern = params[i], params[i + 1]
+        row = db.execute(
+            f"SELECT {_MONSTER_COLS} FROM MONSTERS WHERE json_extract(DATA, '$.name') LIKE ? "
+            "ORDER BY length(json_extract(DATA, '$.name')), json_extract(DATA, '$.name') LIMIT 1",
+            (pattern,),
+        ).fetchone()
+        if row:
+            rows.append((idx,) + tuple(row))
+    return rows
+
+
+def _monsters_all(db, q, params):
+    return db.execute(f"SELECT {_MONSTER_COLS} FROM MONSTERS").fetchall()
+
+
+def _monster_document(db, q, params):
+    row = db.execute(
+        "SELECT DATA FROM MONSTERS WHERE json_extract(DATA, '$.name') LIKE ? LIMIT 1", (params[0],)
+    ).fetchone()
+    return [row] if row else []
+
+
+_PLAYER_STATS_DEFAULTS = {"hp": 100, "gold": 0, "xp": 0, "inventory": "{}"}
+
+
+def _merge_player_stats(db, q, params):
+    # snowflake_db sends only the columns that changed: (player_id, *columns) per row
+    columns = re.findall(r"column\d+::\w+ AS (\w+)", q)
+    now = time.time()
+    for i in range(0, len(params), len(columns)):
+        row = dict(zip(columns, params[i:i + len(columns)]))
+        sent = {c: v for c, v in row.items() if c != "player_id" and v is not None}
+        values = [sent.get(c, d) for c, d in _PLAYER_STATS_DEFAULTS.items()]
+        cur = db.execute(
+            "INSERT OR IGNORE INTO PLAYER_STATS (player_id, hp, gold, xp, inventory, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (row["player_id"], *values, now),
+        )
+        if cur.rowcount == 0:
+            assignments = "".join(f"{c} = ?, " for c in sent)
+            db.execute(
+                f"UPDATE PLAYER_STATS SET {assignments}updated_at = ? WHERE player_id = ?",
+                (*sent.values(), now, row["player_id"]),
+            )
+    return []
+
+
+def _migrate_game_history(db, q, params):
+    column = re.search(r"ADD COLUMN IF NOT EXISTS (\w+)", q, re.I).group(1).lower()
+    if column not in {r[1].lower() for r in db.execute("PRAGMA table_info(GAME_HISTORY)")}:
+        db.execute(f"ALTER TABLE GAME_HISTORY ADD COLUMN {column} {'REAL' if column == 'created_at' else 'TEXT'}")
+    if column == "turn_id":
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS game_history_turn_id ON GAME_HISTORY (turn_id)")
+    return []
+
+
+def _insert_game_history(db, q, params):
+    now = time.time()
+    if "ACTION_TAKEN" in q.upper():
+        # game_engine.save_turn_to_snowflake: (PLAYER_NAME, ACTION_TAKEN, DM_NARRATIVE)
+        db.execute(
+            "INSERT INTO GAME_HISTORY (player_name, action, narrative, stats, created_at) VALUES (?, ?, ?, '{}', ?)",
+            tuple(params) + (now,),
+        )
+        return []
+    for i in range(0, len(params), 4):
+        db.execute(
+            "INSERT INTO GAME_HISTORY (player_name, action, narrative, stats, created_at) VALUES (?, ?, ?, ?, ?)",
+            tuple(params[i:i + 4]) + (now,),
+        )
+    return []
+
+
+def _merge_game_history(db, q, params):
+    for i in range(0, len(params), 6):
+        db.execute(
+            "INSERT OR IGNORE INTO GAME_HISTORY (turn_id, player_name, action, narrative, stats, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            tuple(params[i:i + 6]),
+        )
+    return []
+
+
+def _read_game_history(db, q, params):
+    return db.execute(
+        "SELECT player_name, action, created_at FROM GAME_HISTORY ORDER BY created_at DESC LIMIT ?", params
+    ).fetchall()
+
+
+def _monster_documents(db, q, params):
+    return db.execute("SELECT DATA FROM MONSTERS").fetchall()
+
+
+def _count_monsters(db, q, params):
+    return db.execute("SELECT COUNT(*) FROM MONSTERS").fetchall()
+
+
+_HANDLERS: list[tuple[re.Pattern, str, Callable]] = [
+    (re.compile(r"^SELECT 1$"), "health_check", _select_1),
+    (re.compile(r"FROM COMPENDIUM WHERE UPPER\(TRIM\(name\)\) IN", re.I), "compendium_lookup", _compendium_in),
+    (re.compile(r"^SELECT name, type, hp, ac, description FROM COMPENDIUM$", re.I), "compendium_export", _compendium_all),
+    (re.compile(r"FROM MONSTERS JOIN \(SELECT column1 AS idx", re.I), "monster_lookup", _monsters_bulk),
+    (re.compile(r"^SELECT DATA FROM MONSTERS$", re.I), "monster_document_export", _monster_documents),
+    (re.compile(r"^SELECT .* FROM MONSTERS$", re.I), "monster_export", _monsters_all),
+    (re.compile(r'SELECT "VARIANT_COL" FROM', re.I), "monster_document", _monster_document),
+    (re.compile(r"SELECT COUNT\(\*\) FROM MONSTERS", re.I), "monster_count", _count_monsters),
+    (re.compile(r"^MERGE INTO PLAYER_STATS", re.I), "player_stats_write", _merge_player_stats),
+    (re.compile(r"^INSERT INTO (\S+\.)?GAME_HISTORY", re.I), "game_history_write", _insert_game_history),
+    (re.compile(r"^MERGE INTO GAME_HISTORY", re.I), "game_history_merge", _merge_game_history),
+    (re.compile(r"^ALTER TABLE GAME_HISTORY ADD COLUMN", re.I), "game_history_migrate", _migrate_game_history),
+    (re.compile(r"^SELECT player_name, action, created_at FROM GAME_HISTORY", re.I), "game_history_read",
+     _read_game_history),
+]
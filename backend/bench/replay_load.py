@@ -0,0 +1,692 @@
+"""
+Session replay load generator: recorded game history replayed as concurrent players.
+
+Recorded turns are grouped into per-player sessions and replayed against
+POST /api/game-action by many synthetic players (player i replays session
+i % sessions as player_id "replay-<i>-<player>"). Sources (--source):
+
+  history.csv / .json / .jsonl  a GAME_HISTORY export (PLAYER_NAME, ACTION, CREATED_AT;
+                                column names in any case) or turn journal segments
+  logs.json                     log entries as kept by the session store / returned by
+                                GET /api/stats ({"logs": [...]} or a bare list); the
+                                user entries are the actions, grouped by player_id if present
+  snowflake                     the newest --limit GAME_HISTORY rows (snowflake_db.fetch_game_history)
+  (none)                        synthetic sessions built from bench.run_bench.ACTIONS
+
+Load models:
+  --mode closed  --players N players, each sends its next turn after the previous answer
+                 plus a think time (--think none | const:S | uniform:A:B | exp:MEAN |
+                 lognormal:MEDIAN:SIGMA | recorded[:SCALE], the gaps between the recorded
+                 turns; capped by --think-cap)
+  --mode open    turns arrive at --rate per second (--arrivals poisson | uniform) whether or
+                 not earlier ones have been answered, spread over --players players; arrivals
+                 beyond --max-inflight outstanding turns are dropped and counted. Latency is
+                 measured from the scheduled arrival.
+  --ramp T:V,... piecewise-linear schedule (seconds:value) of active players (closed) or
+                 arrival rate (open); the run lasts until its last point unless --duration is set
+
+By default the server runs offline in a child process: app.py behind werkzeug, with
+snowflake_db pointed at bench/fake_snowflake.py and OpenRouter replaced by
+bench/fake_openrouter.py (--llm-error-rate makes it fail some calls, which then show up as
+fallbacks). --target URL replays against a running server instead (--server-pid, repeatable,
+to watch its memory). Every --interval seconds it prints throughput, latency, errors,
+fallbacks and server RSS; the JSON report has the totals and that time series.
+
+    cd backend
+    python -m bench.replay_load --players 16 --think exp:1 --duration 60
+    python -m bench.replay_load --source history.csv --mode open --ramp 0:1,60:40,120:40
+"""
+
+import argparse
+import csv
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from bench import fake_snowflake  # noqa: E402
+from bench.fake_openrouter import FakeOpenRouter  # noqa: E402
+from bench.run_bench import ACTIONS, RESULTS_DIR, percentile, write_report  # noqa: E402
+from dm_agent import ERROR_NARRATIVE, NO_API_KEY_NARRATIVE  # noqa: E402
+
+# Narratives dm_agent answers with when the model call fails or can't be parsed
+FALLBACK_NARRATIVES = (ERROR_NARRATIVE, NO_API_KEY_NARRATIVE)
+
+_FALLBACK_METRIC = re.compile(r'^dm_fallbacks_total\{reason="([^"]+)"\} ([0-9.e+-]+)$')
+
+
+# ---- sources ----
+
+
+def _timestamp(value: Any) -> float | None:
+    """Epoch seconds from a number, datetime or timestamp string (Snowflake exports); None if unparseable."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for parse in (
+        lambda s: datetime.fromisoformat(s.replace("Z", "+00:00")),
+        lambda s: datetime.strptime(s, "%Y-%m-%d %H:%M:%S.%f %z"),
+        lambda s: datetime.strptime(s, "%Y-%m-%d %H:%M:%S %z"),
+    ):
+        try:
+            return parse(text).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def _log_timestamp(entry: dict[str, Any]) -> float | None:
+    # ids are "user-<epoch>"; the HH:MM:SS timestamp is only good for gaps within a day
+    try:
+        return float(str(entry.get("id", "")).split("-", 1)[1])
+    except (IndexError, ValueError):
+        pass
+    try:
+        h, m, s = (int(p) for p in str(entry.get("timestamp", "")).split(":"))
+        return float(h * 3600 + m * 60 + s)
+    except ValueError:
+        return None
+
+
+def _with_gaps(sessions: dict[str, list[dict[str, Any]]]) -> dict[str, list[dict[str, Any]]]:
+    """Order each session by time (when every turn has one) and add "gap": seconds since the previous turn."""
+    for turns in sessions.values():
+        if all(t["at"] is not None for t in turns):
+            turns.sort(key=lambda t: t["at"])
+        prev = None
+        for t in turns:
+            gap = None
+            if prev is not None and t["at"] is not None:
+                gap = t["at"] - prev
+                if gap < 0:  # HH:MM:SS log timestamps across midnight
+                    gap += 86400
+            t["gap"] = gap
+            prev = t["at"] if t["at"] is not None else prev
+    return sessions
+
+
+def sessions_from_rows(rows: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    """GAME_HISTORY rows (or turn journal records) -> {player: [{"action", "at", "gap"}, ...]}."""
+    sessions: dict[str, list[dict[str, Any]]] = {}
+    for row in rows:
+        row = {str(k).lower(): v for k, v in row.items()}
+        action = str(row.get("action") or row.get("action_taken") or "").strip()
+        if not action:
+            continue
+        player = str(row.get("player_name") or row.get("player_id") or "default")
+        at = _timestamp(row.get("created_at") if row.get("created_at") is not None else row.get("ts"))
+        sessions.setdefault(player, []).append({"action": action, "at": at})
+    return _with_gaps(sessions)
+
+
+def sessions_from_logs(entries: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    """Session-store log entries -> sessions; the user entries are the recorded actions."""
+    sessions: dict[str, list[dict[str, Any]]] = {}
+    for entry in sorted(entries, key=lambda e: e.get("seq") or 0):
+        if entry.get("role") != "user" or not str(entry.get("content") or "").strip():
+            continue
+        player = str(entry.get("player_id") or entry.get("playerId") or "default")
+        sessions.setdefault(player, []).append({"action": str(entry["content"]).strip(), "at": _log_timestamp(entry)})
+    return _with_gaps(sessions)
+
+
+def synthetic_sessions(players: int = 8) -> dict[str, list[dict[str, Any]]]:
+    return {
+        f"bench-{i}": [{"action": ACTIONS[(i + k) % len(ACTIONS)], "at": None, "gap": None} for k in range(len(ACTIONS))]
+        for i in range(players)
+    }
+
+
+def _records(items: list[Any]) -> dict[str, list[dict[str, Any]]]:
+    items = [i for i in items if isinstance(i, dict)]
+    if any("role" in i for i in items):
+        return sessions_from_logs(items)
+    return sessions_from_rows(items)
+
+
+def load_sessions(source: str | None, limit: int = 1000) -> dict[str, list[dict[str, Any]]]:
+    if not source:
+        return synthetic_sessions()
+    if source == "snowflake":
+        import snowflake_db
+
+        return sessions_from_rows(snowflake_db.fetch_game_history(limit))
+    with open(source, encoding="utf-8", newline="") as f:
+        if source.lower().endswith(".csv"):
+            return sessions_from_rows(list(csv.DictReader(f)))
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = data.get("logs", [data])
+    return _records(data)
+
+
+# ---- schedules and think times ----
+
+
+class Schedule:
+    """Piecewise-linear value over time from "T:V,T:V,..." (held flat before the first and after the last point)."""
+
+    def __init__(self, points: list[tuple[float, float]]):
+        self.points = sorted(points)
+
+    @classmethod
+    def parse(cls, spec: str) -> "Schedule":
+        points = []
+        for part in spec.split(","):
+            t, _, v = part.strip().partition(":")
+            points.append((float(t), float(v)))
+        return cls(points)
+
+    @property
+    def duration(self) -> float:
+        return self.points[-1][0]
+
+    def value(self, t: float) -> float:
+        if t <= self.points[0][0]:
+            return self.points[0][1]
+        for (t0, v0), (t1, v1) in zip(self.points, self.points[1:]):
+            if t <= t1:
+                return v0 + (v1 - v0) * (t - t0) / (t1 - t0) if t1 > t0 else v1
+        return self.points[-1][1]
+
+
+def think_sampler(spec: str, cap: float) -> Callable[[random.Random, float | None], float]:
+    """Think-time distribution from its spec; the sampler takes (rng, recorded gap or None)."""
+    kind, *args = spec.split(":")
+    nums = [float(a) for a in args]
+    samplers: dict[str, Callable[[random.Random, float | None], float]] = {
+        "none": lambda rng, gap: 0.0,
+        "const": lambda rng, gap: nums[0],
+        "uniform": lambda rng, gap: rng.uniform(nums[0], nums[1]),
+        "exp": lambda rng, gap: rng.expovariate(1.0 / nums[0]) if nums[0] > 0 else 0.0,
+        "lognormal": lambda rng, gap: rng.lognormvariate(math.log(nums[0]), nums[1]),
+        "recorded": lambda rng, gap: (gap or 0.0) * (nums[0] if nums else 1.0),
+    }
+    if kind not in samplers:
+        raise ValueError(f"unknown think-time distribution {spec!r}")
+    sample = samplers[kind]
+    return lambda rng, gap: max(0.0, min(cap, sample(rng, gap)))
+
+
+# ---- measurement ----
+
+
+def _rss_mb(pids: list[int]) -> float | None:
+    """Summed resident set size of the server processes (Linux /proc); None if unavailable."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status", encoding="ascii") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration, ValueError):
+            return None
+    return round(total / 1024, 1) if pids else None
+
+
+class _Recorder:
+    """Thread-safe log of finished turns: (finished_at, latency, status, fallback)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events: list[tuple[float, float, int, bool]] = []
+        self.sent = 0
+        self.dropped = 0
+
+    def add(self, latency: float, status: int, fallback: bool) -> None:
+        with self._lock:
+            self.events.append((time.perf_counter(), latency, status, fallback))
+
+    def count(self, sent: int = 0, dropped: int = 0) -> None:
+        with self._lock:
+            self.sent += sent
+            self.dropped += dropped
+
+    def since(self, index: int) -> list[tuple[float, float, int, bool]]:
+        with self._lock:
+            return self.events[index:]
+
+
+def _window(events: list[tuple[float, float, int, bool]], seconds: float) -> dict[str, Any]:
+    lat = [e[1] for e in events]
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    return {
+        "turns": len(events),
+        "tps": round(len(events) / seconds, 2) if seconds else None,
+        "errors": sum(e[2] != 200 for e in events),
+        "fallbacks": sum(e[3] for e in events),
+        "p50_ms": ms(percentile(lat, 0.50)),
+        "p95_ms": ms(percentile(lat, 0.95)),
+    }
+
+
+class _Monitor(threading.Thread):
+    """Every `interval` seconds: sample server RSS and print/keep the window's throughput and latency."""
+
+    def __init__(self, rec: _Recorder, pids: list[int], interval: float, t0: float, load: Callable[[float], float]):
+        super().__init__(name="replay-monitor", daemon=True)
+        self.rec, self.pids, self.interval, self.t0, self.load = rec, pids, interval, t0, load
+        self.series: list[dict[str, Any]] = []
+        self.rss: list[float] = []
+        self._halt = threading.Event()
+        self._index = 0
+        self._sample()
+
+    def _sample(self) -> float | None:
+        rss = _rss_mb(self.pids)
+        if rss is not None:
+            self.rss.append(rss)
+        return rss
+
+    def tick(self) -> None:
+        events = self.rec.since(self._index)
+        self._index += len(events)
+        t = time.perf_counter() - self.t0
+        last = self.series[-1]["t"] if self.series else 0.0
+        row = {"t": round(t, 1), "load": round(self.load(t), 2), **_window(events, t - last), "rss_mb": self._sample()}
+        self.series.append(row)
+        print(
+            f"t={row['t']:>6}s load={row['load']:<6} tps={row['tps']:<7} p50={row['p50_ms']}ms "
+            f"p95={row['p95_ms']}ms err={row['errors']} fallback={row['fallbacks']} rss={row['rss_mb']}MB",
+            flush=True,
+        )
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            self.tick()
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+        last = self.series[-1]["t"] if self.series else 0.0
+        if time.perf_counter() - self.t0 - last >= min(1.0, self.interval / 2):
+            self.tick()
+
+
+# ---- client ----
+
+
+class _Client:
+    def __init__(self, target: str, no_cache: bool):
+        url = urllib.parse.urlsplit(target)
+        self.host, self.port = url.hostname or "127.0.0.1", url.port or (443 if url.scheme == "https" else 80)
+        self.conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.prefix = url.path.rstrip("/")
+        self.no_cache = no_cache
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, body: bytes | None = None) -> tuple[int, bytes]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.conn_class(self.host, self.port, timeout=120)
+        try:
+            conn.request(method, self.prefix + path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def turn(self, player_id: str, action: str) -> tuple[int, bool]:
+        """POST one turn; returns (HTTP status or 0 on a connection error, answered with a fallback)."""
+        body = {"action": action, "player_id": player_id}
+        if self.no_cache:
+            body["no_cache"] = True
+        try:
+            status, data = self._request("POST", "/api/game-action", json.dumps(body).encode("utf-8"))
+        except (OSError, http.client.HTTPException):
+            return 0, False
+        if status != 200:
+            return status, False
+        try:
+            narrative = json.loads(data).get("narrative")
+        except ValueError:
+            return status, False
+        return status, narrative in FALLBACK_NARRATIVES
+
+    def fallback_counts(self) -> dict[str, float] | None:
+        """dm_fallbacks_total by reason from GET /api/metrics (one worker's view); None if unavailable."""
+        try:
+            status, data = self._request("GET", "/api/metrics")
+        except (OSError, http.client.HTTPException):
+            return None
+        if status != 200:
+            return None
+        counts = {}
+        for line in data.decode("utf-8", "replace").splitlines():
+            m = _FALLBACK_METRIC.match(line)
+            if m:
+                counts[m.group(1)] = float(m.group(2))
+        return counts
+
+
+class _Player:
+    def __init__(self, index: int, name: str, turns: list[dict[str, Any]], seed: int):
+        self.player_id = f"replay-{index}-{name}"
+        self.turns = turns
+        self.next = 0
+        self.rng = random.Random(seed + index)
+        self.busy = False
+
+    def take(self) -> dict[str, Any]:
+        turn = self.turns[self.next % len(self.turns)]
+        self.next += 1
+        return turn
+
+
+def _players(sessions: dict[str, list[dict[str, Any]]], n: int, seed: int) -> list[_Player]:
+    names = sorted(sessions)
+    return [_Player(i, names[i % len(names)], sessions[names[i % len(names)]], seed) for i in range(n)]
+
+
+def run_closed(client: _Client, players: list[_Player], schedule: Schedule, duration: float,
+               think: Callable[[random.Random, float | None], float], rec: _Recorder, t0: float) -> None:
+    deadline = t0 + duration
+
+    def loop(index: int) -> None:
+        player = players[index]
+        while time.perf_counter() < deadline:
+            if index >= schedule.value(time.perf_counter() - t0):
+                time.sleep(0.05)
+                continue
+            turn = player.take()
+            if player.next > 1:
+                pause = think(player.rng, turn["gap"])
+                time.sleep(max(0.0, min(pause, deadline - time.perf_counter())))
+                if time.perf_counter() >= deadline:
+                    return
+            rec.count(sent=1)
+            start = time.perf_counter()
+            status, fallback = client.turn(player.player_id, turn["action"])
+            rec.add(time.perf_counter() - start, status, fallback)
+
+    with ThreadPoolExecutor(max_workers=len(players), thread_name_prefix="replay-player") as pool:
+        list(pool.map(loop, range(len(players))))
+
+
+def run_open(client: _Client, players: list[_Player], schedule: Schedule, duration: float, arrivals: str,
+             max_inflight: int, rec: _Recorder, t0: float, seed: int) -> None:
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    inflight = 0
+    rr = 0
+
+    def send(player: _Player, turn: dict[str, Any], scheduled: float) -> None:
+        nonlocal inflight
+        status, fallback = client.turn(player.player_id, turn["action"])
+        rec.add(time.perf_counter() - scheduled, status, fallback)
+        with lock:
+            player.busy = False
+            inflight -= 1
+
+    with ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="replay-open") as pool:
+        next_at = t0
+        while True:
+            rate = schedule.value(next_at - t0)
+            if rate <= 0:
+                next_at += 0.05
+            else:
+                next_at += rng.expovariate(rate) if arrivals == "poisson" else 1.0 / rate
+            if next_at - t0 >= duration:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if rate <= 0:
+                continue
+            with lock:
+                if inflight >= max_inflight:
+                    rec.count(dropped=1)
+                    continue
+                # Prefer the next player without a turn in flight; if all are busy the turn
+                # goes out anyway (and may get 429 player_busy, as a real client would)
+                for k in range(len(players)):
+                    player = players[(rr + k) % len(players)]
+                    if not player.busy:
+                        break
+                else:
+                    player = players[rr % len(players)]
+                rr = (players.index(player) + 1) % len(players)
+                player.busy = True
+                inflight += 1
+                turn = player.take()
+            rec.count(sent=1)
+            pool.submit(send, player, turn, next_at)
+
+
+# ---- offline server ----
+
+
+def serve(args: argparse.Namespace) -> int:
+    """Child process: app.py on werkzeug against the fake Snowflake; prints its port, stops when stdin closes."""
+    from bench.run_bench import _FlaskServer
+
+    fake_snowflake.install(args.db_path, connect_latency=args.connect_latency, query_latency=args.db_latency)
+    server = _FlaskServer()
+    print(json.dumps({"port": server.port}), flush=True)
+    sys.stdin.read()
+    server.stop()
+    import snowflake_db
+    import turn_journal
+
+    snowflake_db.flush_player_stats(timeout=10)
+    turn_journal.close_journal(10.0)
+    return 0
+
+
+class _ServerProcess:
+    def __init__(self, args: argparse.Namespace, env: dict[str, str], log_path: str):
+        cmd = [
+            sys.executable, "-m", "bench.replay_load", "--serve", "--db-path", args.db_path,
+            "--connect-latency", str(args.connect_latency), "--db-latency", str(args.db_latency),
+        ]
+        self._log = open(log_path, "w", encoding="utf-8")
+        self.proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=self._log, text=True)
+        line = self.proc.stdout.readline()
+        if not line.startswith("{"):
+            self.proc.kill()
+            self._log.close()
+            with open(log_path, encoding="utf-8") as f:
+                raise RuntimeError(f"replay server failed to start:\n{f.read()[-2000:]}")
+        self.url = f"http://127.0.0.1:{json.loads(line)['port']}"
+
+    def stop(self) -> None:
+        self.proc.stdin.close()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._log.close()
+
+
+# ---- main ----
+
+
+def _summary(rec: _Recorder, wall: float, rss: list[float], before: dict | None, after: dict | None) -> dict[str, Any]:
+    events = rec.since(0)
+    lat = [e[1] for e in events]
+    n = len(events)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    statuses: dict[str, int] = {}
+    for e in events:
+        statuses[str(e[2])] = statuses.get(str(e[2]), 0) + 1
+    errors = sum(e[2] != 200 for e in events)
+    fallbacks = sum(e[3] for e in events)
+    reasons = None
+    if before is not None and after is not None:
+        reasons = {r: after[r] - before.get(r, 0) for r in after if after[r] - before.get(r, 0)}
+    return {
+        "sent": rec.sent,
+        "completed": n,
+        "dropped": rec.dropped,
+        "wall_seconds": round(wall, 3),
+        "throughput_tps": round(n / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": ms(statistics.fmean(lat)) if lat else None,
+            "p50": ms(percentile(lat, 0.50)),
+            "p90": ms(percentile(lat, 0.90)),
+            "p95": ms(percentile(lat, 0.95)),
+            "p99": ms(percentile(lat, 0.99)),
+            "max": ms(max(lat)) if lat else None,
+        },
+        "status_counts": statuses,
+        "errors": errors,
+        "error_rate": round(errors / n, 4) if n else None,
+        "fallbacks": fallbacks,
+        "fallback_rate": round(fallbacks / (n - errors), 4) if n - errors else None,
+        "fallback_reasons": reasons,
+        "server_rss_mb": {
+            "start": rss[0] if rss else None,
+            "end": rss[-1] if rss else None,
+            "peak": max(rss) if rss else None,
+            "growth": round(rss[-1] - rss[0], 1) if rss else None,
+        },
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="GAME_HISTORY export (.csv/.json/.jsonl), log export (.json) or 'snowflake'")
+    parser.add_argument("--limit", type=int, default=1000, help="rows to read with --source snowflake")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--players", type=int, default=16, help="synthetic players (closed: concurrency)")
+    parser.add_argument("--rate", type=float, default=10.0, help="open loop: turns per second")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--ramp", help="schedule of players (closed) or rate (open), e.g. 0:1,60:32,120:32")
+    parser.add_argument("--duration", type=float, help="seconds (default: end of --ramp, else 30)")
+    parser.add_argument("--think", default="exp:1.0", help="closed loop think time distribution")
+    parser.add_argument("--think-cap", type=float, default=60.0, help="upper bound on one think time (seconds)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="open loop: outstanding turns before dropping")
+    parser.add_argument("--allow-cache", action="store_true", help="let the server answer from its LLM cache")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between progress/RSS samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--target", help="replay against this running server instead of an offline one")
+    parser.add_argument("--server-pid", type=int, action="append", default=[], help="with --target: pid to watch")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="offline: fake model latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="offline: latency per DB round trip")
+    parser.add_argument("--connect-latency", type=float, default=0.3, help="offline: Snowflake connect time")
+    parser.add_argument("--db-path", help="offline: SQLite fixture (default: temp file; kept GAME_HISTORY is replayable)")
+    parser.add_argument(
+        "--out", default=os.path.join(RESULTS_DIR, "replay_load.json"), help="JSON results file ('-' for stdout only)"
+    )
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        return serve(args)
+
+    think = think_sampler(args.think, args.think_cap)
+    default = args.players if args.mode == "closed" else args.rate
+    schedule = Schedule.parse(args.ramp) if args.ramp else Schedule([(0.0, default)])
+    duration = args.duration or (schedule.duration if args.ramp and schedule.duration > 0 else 30.0)
+
+    tmpdir = fake_llm = server = None
+    try:
+        if args.target:
+            target, pids = args.target, args.server_pid
+        else:
+            tmpdir = tempfile.TemporaryDirectory(prefix="dm-replay-")
+            if not args.db_path:
+                args.db_path = os.path.join(tmpdir.name, "snowflake.sqlite")
+            if not os.path.exists(args.db_path):
+                fake_snowflake.create_fixture(args.db_path)
+            fake_llm = FakeOpenRouter(latency=args.llm_latency, jitter=args.llm_jitter,
+                                      error_rate=args.llm_error_rate).start()
+            env = dict(
+                os.environ,
+                OPENROUTER_BASE_URL=fake_llm.base_url,
+                OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY", "bench"),
+                OPENROUTER_MAX_RETRIES=os.environ.get("OPENROUTER_MAX_RETRIES", "2"),
+                OPENROUTER_RETRY_BASE_DELAY=os.environ.get("OPENROUTER_RETRY_BASE_DELAY", "0.05"),
+                TURN_JOURNAL_DIR=os.environ.get("TURN_JOURNAL_DIR", os.path.join(tmpdir.name, "journal")),
+            )
+            if args.source == "snowflake":
+                fake_snowflake.install(args.db_path)
+            server = _ServerProcess(args, env, os.path.join(tmpdir.name, "server.log"))
+            target, pids = server.url, [server.proc.pid]
+
+        sessions = load_sessions(args.source, args.limit)
+        if not sessions:
+            print(f"no recorded turns in {args.source}", file=sys.stderr)
+            return 1
+        n_players = args.players
+        if args.mode == "closed" and args.ramp:
+            n_players = max(1, math.ceil(max(v for _, v in schedule.points)))
+        players = _players(sessions, n_players, args.seed)
+        print(f"replaying {sum(len(t) for t in sessions.values())} turns from {len(sessions)} sessions "
+              f"as {len(players)} players against {target} ({args.mode} loop, {duration:.0f}s)", flush=True)
+
+        client = _Client(target, no_cache=not args.allow_cache)
+        before = client.fallback_counts()
+        rec = _Recorder()
+        t0 = time.perf_counter()
+        monitor = _Monitor(rec, pids, args.interval, t0, schedule.value)
+        monitor.start()
+        if args.mode == "closed":
+            run_closed(client, players, schedule, duration, think, rec, t0)
+        else:
+            run_open(client, players, schedule, duration, args.arrivals, args.max_inflight, rec, t0, args.seed)
+        wall = time.perf_counter() - t0
+        monitor.stop()
+        summary = _summary(rec, wall, monitor.rss, before, client.fallback_counts())
+    finally:
+        if server is not None:
+            server.stop()
+        if fake_llm is not None:
+            fake_llm.stop()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    lat = summary["latency_ms"]
+    print(
+        f"sent={summary['sent']} completed={summary['completed']} dropped={summary['dropped']} "
+        f"tps={summary['throughput_tps']} p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms "
+        f"error_rate={summary['error_rate']} fallback_rate={summary['fallback_rate']} "
+        f"rss_growth={summary['server_rss_mb']['growth']}MB"
+    )
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "serve")},
+        "sessions": len(sessions),
+        "recorded_turns": sum(len(t) for t in sessions.values()),
+        "summary": summary,
+        "series": monitor.series,
+    }
+    write_report(report, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
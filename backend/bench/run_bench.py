@@ -0,0 +1,316 @@
+"""
+Turn latency / throughput benchmark, fully offline.
+
+Runs dm_agent.run_turn directly and the Flask POST /api/game-action endpoint over
+HTTP, with snowflake_db pointed at a SQLite fixture (bench/fake_snowflake.py) and
+OpenRouter replaced by a local fake (bench/fake_openrouter.py); with
+--state-backend redis, session state goes to bench/fake_redis.py. For each scenario
+it reports p50/p95/p99 turn latency, throughput with N concurrent clients, DB
+round trips and new connections per turn, and model calls per turn, and writes
+everything to a JSON file so runs can be diffed for regressions.
+
+    cd backend
+    python -m bench.run_bench --clients 1,8,32 --turns 200 --llm-latency 0.2
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")  # gitignored
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from bench import fake_snowflake  # noqa: E402
+from bench.fake_openrouter import FakeOpenRouter  # noqa: E402
+from bench.fake_redis import FakeRedis  # noqa: E402
+
+ACTIONS = [
+    "I attack the goblin with my longsword",
+    "I raise my shield and advance on the orc",
+    "I drink a healing potion",
+    "I search the room for traps",
+    "I cast a spell at the skeleton",
+    "I try to sneak past the owlbear",
+    "I ask the innkeeper about Phandalin",
+    "I light a torch and look around",
+    "I fight the wolf and the giant spider",
+    "I flee from the troll",
+]
+
+
+def write_report(report: dict[str, Any], out: str) -> None:
+    """Write the JSON report to out ('-' prints it instead), creating its directory."""
+    text = json.dumps(report, indent=2)
+    if out == "-":
+        print(text)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    print(f"wrote {out}")
+
+
+def percentile(samples: list[float], q: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _stats_payload(client: int) -> dict[str, Any]:
+    return {"hp": 100, "xp": 0, "gold": 10, "inventory": ["Rations", "Torch"], "player_id": f"bench-{client}"}
+
+
+def _run_clients(clients: int, turns: int, do_turn: Callable[[int, int], bool]) -> dict[str, Any]:
+    """Split `turns` over `clients` threads (closed loop: each client waits for its reply)."""
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(turns))
+    counter_lock = threading.Lock()
+
+    def client_loop(client: int) -> None:
+        nonlocal errors
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                ok = do_turn(client, i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client_loop, range(clients)))
+    wall = time.perf_counter() - start
+    return {"latencies": latencies, "errors": errors, "wall": wall}
+
+
+def _summarize(name: str, clients: int, run: dict[str, Any], db: dict[str, Any], llm_calls: int) -> dict[str, Any]:
+    lat = run["latencies"]
+    n = len(lat)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None  # noqa: E731
+    return {
+        "scenario": name,
+        "clients": clients,
+        "turns": n,
+        "errors": run["errors"],
+        "wall_seconds": round(run["wall"], 3),
+        "throughput_tps": round(n / run["wall"], 2) if run["wall"] else None,
+        "latency_ms": {
+            "mean": ms(statistics.fmean(lat)) if lat else None,
+            "p50": ms(percentile(lat, 0.50)),
+            "p95": ms(percentile(lat, 0.95)),
+            "p99": ms(percentile(lat, 0.99)),
+            "max": ms(max(lat)) if lat else None,
+        },
+        "db_round_trips": db["round_trips"],
+        "db_round_trips_per_turn": round(db["round_trips"] / n, 3) if n else None,
+        "db_connects": db["connects"],
+        "db_by_kind": db["by_kind"],
+        "llm_calls": llm_calls,
+        "llm_calls_per_turn": round(llm_calls / n, 3) if n else None,
+    }
+
+
+def _reset(fake_llm: FakeOpenRouter, warm: bool) -> None:
+    import snowflake_db
+
+    snowflake_db.flush_player_stats(timeout=30)
+    snowflake_db.clear_caches()
+    if warm:
+        snowflake_db.warm_compendium_cache()
+    fake_snowflake.reset_stats()
+    fake_llm.reset_stats()
+
+
+def bench_run_turn(clients: int, turns: int, fake_llm: FakeOpenRouter, warm: bool) -> dict[str, Any]:
+    import snowflake_db
+    from dm_agent import run_turn
+
+    _reset(fake_llm, warm)
+
+    def do_turn(client: int, i: int) -> bool:
+        out = run_turn(ACTIONS[i % len(ACTIONS)], _stats_payload(client), player_id=f"bench-{client}", use_cache=False)
+        return bool(out.get("narrative"))
+
+    run = _run_clients(clients, turns, do_turn)
+    snowflake_db.flush_player_stats(timeout=30)  # count the deferred writes too
+    name = "run_turn" + ("_warm" if warm else "")
+    return _summarize(name, clients, run, fake_snowflake.stats(), fake_llm.stats()["requests"])
+
+
+class _FlaskServer:
+    def __init__(self):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        from app import app
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bench-flask", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+
+def bench_http(clients: int, turns: int, fake_llm: FakeOpenRouter, server: _FlaskServer, warm: bool) -> dict[str, Any]:
+    import snowflake_db
+
+    _reset(fake_llm, warm)
+    local = threading.local()
+
+    def do_turn(client: int, i: int) -> bool:
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=120)
+        body = json.dumps({
+            "action": ACTIONS[i % len(ACTIONS)],
+            "player_id": f"bench-{client}",
+            "no_cache": True,
+        })
+        try:
+            conn.request("POST", "/api/game-action", body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            local.conn = None
+            raise
+        return resp.status == 200
+
+    run = _run_clients(clients, turns, do_turn)
+    snowflake_db.flush_player_stats(timeout=30)
+    name = "http_game_action" + ("_warm" if warm else "")
+    return _summarize(name, clients, run, fake_snowflake.stats(), fake_llm.stats()["requests"])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=100, help="turns per scenario and concurrency level")
+    parser.add_argument("--scenarios", default="run_turn,http", help="run_turn,http")
+    parser.add_argument("--warm", action="store_true", help="also run each scenario with the compendium warm-loaded")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake model latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="simulated latency per DB round trip")
+    parser.add_argument("--connect-latency", type=float, default=0.3, help="simulated Snowflake connect time")
+    parser.add_argument("--db-path", help="SQLite fixture path (default: temp file)")
+    parser.add_argument("--compendium-backend", choices=("snowflake", "sqlite"), default="snowflake",
+                        help="sqlite: sync a local mirror from the fixture and serve lookups from it")
+    parser.add_argument("--state-backend", choices=("memory", "sqlite", "redis"), default="memory",
+                        help="STATE_BACKEND for the http scenario (redis uses bench/fake_redis.py)")
+    parser.add_argument(
+        "--out", default=os.path.join(RESULTS_DIR, "run_bench.json"), help="JSON results file ('-' for stdout only)"
+    )
+    args = parser.parse_args(argv)
+
+    fake_llm = FakeOpenRouter(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate).start()
+    os.environ["OPENROUTER_BASE_URL"] = fake_llm.base_url
+    os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+    os.environ.setdefault("OPENROUTER_MAX_RETRIES", "2")
+    os.environ.setdefault("OPENROUTER_RETRY_BASE_DELAY", "0.05")
+    os.environ["LLM_CACHE_ENABLED"] = "0"
+
+    tmpdir = None
+    db_path = args.db_path
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory(prefix="dm-bench-")
+        db_path = os.path.join(tmpdir.name, "snowflake.sqlite")
+    fake_snowflake.create_fixture(db_path)
+    os.environ.setdefault("TURN_JOURNAL_DIR", os.path.join(os.path.dirname(os.path.abspath(db_path)), "journal"))
+    fake_snowflake.install(db_path, connect_latency=args.connect_latency, query_latency=args.db_latency)
+    if args.compendium_backend == "sqlite":
+        import compendium_backend
+        from snowflake_db import SnowflakeCompendium
+
+        mirror_path = os.path.join(os.path.dirname(db_path), "compendium-mirror.sqlite")
+        compendium_backend.sync_mirror(mirror_path, SnowflakeCompendium())
+        os.environ["COMPENDIUM_BACKEND"] = "sqlite"
+        os.environ["COMPENDIUM_MIRROR_PATH"] = mirror_path
+        compendium_backend.reset_backend()
+
+    fake_redis = None
+    os.environ["STATE_BACKEND"] = args.state_backend
+    if args.state_backend == "sqlite":
+        os.environ["STATE_SQLITE_PATH"] = os.path.join(os.path.dirname(os.path.abspath(db_path)), "state.sqlite")
+    elif args.state_backend == "redis":
+        fake_redis = FakeRedis().start()
+        os.environ["STATE_REDIS_URL"] = fake_redis.url
+
+    levels = [int(c) for c in args.clients.split(",") if c.strip()]
+    scenarios = {s.strip() for s in args.scenarios.split(",") if s.strip()}
+    warm_modes = [False, True] if args.warm else [False]
+    results = []
+    server = _FlaskServer() if "http" in scenarios else None
+    try:
+        for warm in warm_modes:
+            for clients in levels:
+                if "run_turn" in scenarios:
+                    results.append(bench_run_turn(clients, args.turns, fake_llm, warm))
+                    _print_row(results[-1])
+                if server is not None:
+                    results.append(bench_http(clients, args.turns, fake_llm, server, warm))
+                    _print_row(results[-1])
+    finally:
+        if server is not None:
+            server.stop()
+        fake_llm.stop()
+        if fake_redis is not None:
+            fake_redis.stop()
+        import snowflake_db
+        import turn_journal
+
+        turn_journal.close_journal(10.0)  # upload journaled turns while the fake is still installed
+        snowflake_db.close_pool()
+        snowflake_db.set_connection_factory(None)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+    write_report(report, args.out)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return 0
+
+
+def _print_row(r: dict[str, Any]) -> None:
+    lat = r["latency_ms"]
+    print(
+        f"{r['scenario']:<22} clients={r['clients']:<4} turns={r['turns']:<5} err={r['errors']:<3} "
+        f"tps={r['throughput_tps']:<8} p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms "
+        f"db/turn={r['db_round_trips_per_turn']} connects={r['db_connects']} llm/turn={r['llm_calls_per_turn']}"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
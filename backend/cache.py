@@ -0,0 +1,92 @@
+"""
+Small thread-safe in-process cache with per-entry TTL and LRU eviction.
+
+Used by snowflake_db for compendium/monster lookups. Misses can be cached too
+(store None); they get their own, usually shorter, TTL so a word like "sword"
+that isn't in the compendium is remembered without hiding new rows for long.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping where each entry expires after a TTL.
+
+    get() returns MISSING when the key is absent or expired; a cached None means
+    "known absent" (negative entry). stats() exposes hit/miss/eviction counters.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0, negative_ttl: float = 300.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value (None for a negative entry) or MISSING."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._counters["misses"] += 1
+                return MISSING
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self._counters["negative_hits" if value is None else "hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Store value; None is cached with negative_ttl unless ttl is given."""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            self._counters["sets"] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        """Counters plus current size and hit ratio (negative hits count as hits)."""
+        with self._lock:
+            out = dict(self._counters)
+            out["size"] = len(self._data)
+            out["max_entries"] = self.max_entries
+        lookups = out["hits"] + out["negative_hits"] + out["misses"]
+        out["hit_ratio"] = (out["hits"] + out["negative_hits"]) / lookups if lookups else 0.0
+        return out
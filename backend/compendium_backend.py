@@ -0,0 +1,341 @@
+"""
+Where compendium data (COMPENDIUM rows and MONSTERS documents) is read from.
+
+Two implementations of CompendiumBackend:
+  - snowflake_db.SnowflakeCompendium: queries Snowflake (the system of record).
+  - SQLiteCompendium: a local, indexed SQLite mirror of both tables, filled by
+
+        python compendium_backend.py sync [--path compendium.sqlite]
+
+    which bulk-exports the Snowflake tables into a new file and swaps it in
+    atomically. Running servers pick up the new file on their next lookup.
+
+snowflake_db's cached lookups (fetch_compendium_bulk, fetch_monsters_bulk,
+warm_compendium_cache) and game_engine.lookup_monster go through get_backend().
+
+Env vars:
+  COMPENDIUM_BACKEND      snowflake (default) or sqlite
+  COMPENDIUM_MIRROR_PATH  mirror file (default compendium.sqlite next to this file)
+If COMPENDIUM_BACKEND=sqlite but the mirror hasn't been synced yet, lookups fall back to Snowflake.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRROR_PATH = str(Path(__file__).resolve().parent / "compendium.sqlite")
+
+LOOKUP_SECONDS = metrics.histogram(
+    "compendium_mirror_seconds", "Local compendium mirror lookup latency", ["op"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+def name_key(name: Any) -> str:
+    """Lookup key for a name: UPPER(TRIM(name)), as the Snowflake queries compare it."""
+    return str(name or "").strip().upper()
+
+
+def monster_stats_from_document(doc: dict[str, Any]) -> dict[str, Any]:
+    """{name, hp, ac, type, abilities} from a MONSTERS document, like snowflake_db's DATA: column paths."""
+    ac = doc.get("armor_class")
+    if isinstance(ac, list):
+        ac = ac[0].get("value") if ac and isinstance(ac[0], dict) else None
+    abilities = doc.get("special_abilities")
+    return {
+        "name": doc.get("name"),
+        "hp": doc.get("hit_points"),
+        "ac": ac if isinstance(ac, int) else None,
+        "type": doc.get("type"),
+        # Snowflake returns VARIANT columns as JSON text; keep the same shape
+        "abilities": json.dumps(abilities) if abilities is not None else None,
+    }
+
+
+class CompendiumBackend:
+    """
+    Read-only access to compendium data. Rows are dicts:
+      compendium: {name, type, hp, ac, description}
+      monster stats: {name, hp, ac, type, abilities}
+    Errors propagate; callers decide whether a failed lookup is fatal.
+    """
+
+    name = ""
+
+    def lookup_compendium(self, keys: list[str]) -> dict[str, dict[str, Any]]:
+        """COMPENDIUM rows whose name_key() is in keys (already normalized), as {key: row}."""
+        raise NotImplementedError
+
+    def lookup_monsters(self, terms: list[str]) -> list[dict[str, Any] | None]:
+        """For each term, the MONSTERS row whose name contains it (case-insensitive); shortest name wins."""
+        raise NotImplementedError
+
+    def monster_document(self, name: str) -> dict[str, Any] | None:
+        """Full MONSTERS document for the first monster whose name contains `name`."""
+        raise NotImplementedError
+
+    def export_compendium(self) -> list[dict[str, Any]]:
+        raise NotImplementedError
+
+    def export_monsters(self) -> list[dict[str, Any]]:
+        """Stats rows for every monster."""
+        raise NotImplementedError
+
+    def export_monster_documents(self) -> Iterable[dict[str, Any]]:
+        """Every full MONSTERS document (used by sync_mirror)."""
+        raise NotImplementedError
+
+
+_SCHEMA = """
+CREATE TABLE compendium (name TEXT, name_key TEXT NOT NULL, type TEXT, hp INTEGER, ac INTEGER, description TEXT);
+CREATE INDEX compendium_name_key ON compendium (name_key);
+CREATE TABLE monsters (
+    name TEXT, name_key TEXT NOT NULL, hp INTEGER, ac INTEGER, type TEXT, abilities TEXT, document TEXT NOT NULL
+);
+CREATE INDEX monsters_name_key ON monsters (name_key);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class SQLiteCompendium(CompendiumBackend):
+    """
+    Compendium served from a local SQLite mirror (see sync_mirror). Exact-name lookups use
+    an index; substring monster matches try the exact name first (it is always the shortest
+    match) and only then scan. Each thread keeps its own read-only connection, reopened
+    when a sync replaces the file.
+    """
+
+    name = "sqlite"
+    RECHECK_INTERVAL = 5.0  # seconds between checks for a re-synced file
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._generation = 0
+        self._file_id: tuple | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """True if the mirror file exists and has been fully synced."""
+        try:
+            return self.meta().get("synced_at") is not None
+        except Exception:
+            return False
+
+    def meta(self) -> dict[str, str]:
+        return dict(self._conn().execute("SELECT key, value FROM meta").fetchall())
+
+    def _file_identity(self) -> tuple:
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _conn(self) -> sqlite3.Connection:
+        now = time.monotonic()
+        if now - self._checked_at >= self.RECHECK_INTERVAL:
+            with self._lock:
+                self._checked_at = now
+                ident = self._file_identity()
+                if ident != self._file_id:
+                    self._file_id = ident
+                    self._generation += 1
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def lookup_compendium(self, keys: list[str]) -> dict[str, dict[str, Any]]:
+        if not keys:
+            return {}
+        start = time.perf_counter()
+        placeholders = ", ".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT name_key, name, type, hp, ac, description FROM compendium "
+            f"WHERE name_key IN ({placeholders}) ORDER BY rowid",
+            tuple(keys),
+        ).fetchall()
+        found: dict[str, dict[str, Any]] = {}
+        for key, name, type_, hp, ac, description in rows:
+            found.setdefault(key, {"name": name, "type": type_, "hp": hp, "ac": ac, "description": description or ""})
+        LOOKUP_SECONDS.observe(time.perf_counter() - start, op="compendium")
+        return found
+
+    def _find_monster(self, conn: sqlite3.Connection, columns: str, term: str) -> tuple | None:
+        row = conn.execute(
+            f"SELECT {columns} FROM monsters WHERE name_key = ? ORDER BY name LIMIT 1", (name_key(term),)
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                f"SELECT {columns} FROM monsters WHERE name LIKE ? ORDER BY length(name), name LIMIT 1",
+                (f"%{term.strip()}%",),
+            ).fetchone()
+        return row
+
+    def lookup_monsters(self, terms: list[str]) -> list[dict[str, Any] | None]:
+        start = time.perf_counter()
+        conn = self._conn()
+        out = []
+        for term in terms:
+            row = self._find_monster(conn, "name, hp, ac, type, abilities", term)
+            out.append({"name": row[0], "hp": row[1], "ac": row[2], "type": row[3], "abilities": row[4]} if row else None)
+        LOOKUP_SECONDS.observe(time.perf_counter() - start, op="monsters")
+        return out
+
+    def monster_document(self, name: str) -> dict[str, Any] | None:
+        start = time.perf_counter()
+        row = self._find_monster(self._conn(), "document", name)
+        LOOKUP_SECONDS.observe(time.perf_counter() - start, op="document")
+        return json.loads(row[0]) if row else None
+
+    def export_compendium(self) -> list[dict[str, Any]]:
+        rows = self._conn().execute("SELECT name, type, hp, ac, description FROM compendium ORDER BY rowid").fetchall()
+        return [{"name": r[0], "type": r[1], "hp": r[2], "ac": r[3], "description": r[4] or ""} for r in rows]
+
+    def export_monsters(self) -> list[dict[str, Any]]:
+        rows = self._conn().execute("SELECT name, hp, ac, type, abilities FROM monsters ORDER BY rowid").fetchall()
+        return [{"name": r[0], "hp": r[1], "ac": r[2], "type": r[3], "abilities": r[4]} for r in rows]
+
+    def export_monster_documents(self) -> Iterable[dict[str, Any]]:
+        for (doc,) in self._conn().execute("SELECT document FROM monsters ORDER BY rowid"):
+            yield json.loads(doc)
+
+
+def sync_mirror(path: str, source: CompendiumBackend) -> dict[str, Any]:
+    """
+    Export COMPENDIUM and MONSTERS from source into a fresh SQLite file and atomically
+    replace path with it. Returns row counts and the sync duration.
+    """
+    start = time.perf_counter()
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        db.executescript(_SCHEMA)
+        compendium = source.export_compendium()
+        db.executemany(
+            "INSERT INTO compendium (name, name_key, type, hp, ac, description) VALUES (?, ?, ?, ?, ?, ?)",
+            [(r["name"], name_key(r["name"]), r["type"], r["hp"], r["ac"], r["description"]) for r in compendium],
+        )
+        monsters = 0
+        batch = []
+        for doc in source.export_monster_documents():
+            stats = monster_stats_from_document(doc)
+            batch.append((
+                stats["name"], name_key(stats["name"]), stats["hp"], stats["ac"], stats["type"],
+                stats["abilities"], json.dumps(doc),
+            ))
+            if len(batch) >= 1000:
+                db.executemany("INSERT INTO monsters VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                monsters += len(batch)
+                batch = []
+        db.executemany("INSERT INTO monsters VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        monsters += len(batch)
+        db.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("synced_at", str(time.time())), ("source", source.name),
+             ("compendium_rows", str(len(compendium))), ("monster_rows", str(monsters))],
+        )
+        db.commit()
+        db.execute("VACUUM")
+    except Exception:
+        db.close()
+        os.remove(tmp)
+        raise
+    db.close()
+    os.replace(tmp, path)
+    return {"compendium": len(compendium), "monsters": monsters, "seconds": round(time.perf_counter() - start, 3)}
+
+
+_backend: CompendiumBackend | None = None
+_backend_key: tuple | None = None
+_mirror_retry_at = 0.0
+_backend_lock = threading.Lock()
+MIRROR_RETRY_INTERVAL = 30.0  # seconds between checks for a mirror while falling back to Snowflake
+
+
+def _snowflake_backend() -> CompendiumBackend:
+    from snowflake_db import SnowflakeCompendium
+
+    return SnowflakeCompendium()
+
+
+def get_backend() -> CompendiumBackend:
+    """
+    Backend selected by COMPENDIUM_BACKEND. An unsynced SQLite mirror falls back to Snowflake
+    and is checked again every MIRROR_RETRY_INTERVAL seconds, so a first sync that finishes
+    while the server runs is picked up.
+    """
+    global _backend, _backend_key, _mirror_retry_at
+    kind = os.environ.get("COMPENDIUM_BACKEND", "snowflake").strip().lower()
+    path = os.environ.get("COMPENDIUM_MIRROR_PATH") or DEFAULT_MIRROR_PATH
+    key = (kind, path)
+    with _backend_lock:
+        falling_back = kind == "sqlite" and _backend is not None and _backend.name != "sqlite"
+        if _backend is not None and _backend_key == key and not (falling_back and time.monotonic() >= _mirror_retry_at):
+            return _backend
+        if kind == "sqlite":
+            mirror = SQLiteCompendium(path)
+            if mirror.available():
+                _backend = mirror
+            else:
+                if not falling_back:
+                    logger.warning("compendium mirror %s is not synced; using Snowflake", path)
+                    _backend = _snowflake_backend()
+                _mirror_retry_at = time.monotonic() + MIRROR_RETRY_INTERVAL
+        elif kind == "snowflake":
+            _backend = _snowflake_backend()
+        else:
+            raise ValueError(f"unknown COMPENDIUM_BACKEND: {kind!r}")
+        _backend_key = key
+        return _backend
+
+
+def reset_backend() -> None:
+    """Forget the selected backend (re-read COMPENDIUM_BACKEND on next use)."""
+    global _backend, _backend_key
+    with _backend_lock:
+        _backend, _backend_key = None, None
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compendium mirror tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync = sub.add_parser("sync", help="export COMPENDIUM and MONSTERS from Snowflake into the SQLite mirror")
+    sync.add_argument("--path", default=os.environ.get("COMPENDIUM_MIRROR_PATH") or DEFAULT_MIRROR_PATH)
+    info = sub.add_parser("info", help="show the mirror's sync metadata")
+    info.add_argument("--path", default=os.environ.get("COMPENDIUM_MIRROR_PATH") or DEFAULT_MIRROR_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "sync":
+        from dotenv import load_dotenv
+
+        load_dotenv(Path(__file__).resolve().parent / ".env")
+        result = sync_mirror(args.path, _snowflake_backend())
+        print(f"synced {result['compendium']} compendium rows and {result['monsters']} monsters "
+              f"into {args.path} in {result['seconds']}s")
+    else:
+        mirror = SQLiteCompendium(args.path)
+        if not os.path.exists(args.path) or not mirror.available():
+            print(f"{args.path}: not synced")
+            return 1
+        print(json.dumps(mirror.meta(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,168 @@
+"""
+Opt-in cache of parsed DM completions, keyed on the normalized prompt.
+
+Repeated actions ("look around", "check inventory") with the same player state and
+compendium context produce the same messages; with the cache on, only the first
+one goes to the model. Keys hash the model, temperature and the messages after
+whitespace/case normalization. Entries live in an in-memory LRU with a TTL and,
+if LLM_CACHE_PATH is set, in a SQLite file so they survive restarts.
+
+Env vars:
+  LLM_CACHE_ENABLED      1 to turn the cache on (default 0)
+  LLM_CACHE_TTL          seconds an entry stays valid (default 600)
+  LLM_CACHE_MAX_ENTRIES  in-memory LRU size (default 1024)
+  LLM_CACHE_PATH         optional SQLite file for the on-disk store
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import metrics
+from cache import MISSING, TTLCache
+
+_WS = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WS.sub(" ", text or "").strip().casefold()
+
+
+def make_key(model: str, temperature: float, messages: list[dict[str, str]]) -> str:
+    """Stable hash of model + temperature + normalized (role, content) pairs."""
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": [[m.get("role", ""), _normalize(m.get("content", ""))] for m in messages],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    Two-tier completion cache (memory LRU + optional SQLite). Values are JSON-serializable
+    dicts; each entry remembers how long the original model call took so hits can report
+    the latency they saved.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0, path: str | None = None):
+        self.ttl = ttl
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl, negative_ttl=0)
+        self._path = path
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        self._saved_seconds = 0.0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, latency REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Cached completion for key, or None on a miss."""
+        entry = self._memory.get(key)
+        disk_hit = False
+        if entry is MISSING and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, latency, expires_at FROM completions WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+            if row:
+                entry = (row[0], row[1])
+                self._memory.set(key, entry, ttl=row[2] - time.time())
+                disk_hit = True
+        with self._lock:
+            if entry is MISSING:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            if disk_hit:
+                self._counters["disk_hits"] += 1
+            self._saved_seconds += entry[1]
+        return json.loads(entry[0])
+
+    def set(self, key: str, value: dict[str, Any], latency: float) -> None:
+        """Store a completion and the wall time the model call took."""
+        text = json.dumps(value, ensure_ascii=False)
+        self._memory.set(key, (text, latency))
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, latency, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, text, latency, time.time() + self.ttl),
+                )
+                self._db.commit()
+        with self._lock:
+            self._counters["stores"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM completions")
+                self._db.commit()
+
+    def stats(self) -> dict[str, Any]:
+        """Hits, misses, hit ratio and total model latency saved by hits (seconds)."""
+        with self._lock:
+            out = dict(self._counters)
+            out["saved_seconds"] = round(self._saved_seconds, 3)
+        lookups = out["hits"] + out["misses"]
+        out["hit_ratio"] = out["hits"] / lookups if lookups else 0.0
+        out["size"] = len(self._memory)
+        return out
+
+
+_cache: CompletionCache | None = None
+_cache_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.environ.get("LLM_CACHE_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_cache() -> CompletionCache:
+    """Process-wide completion cache configured from LLM_CACHE_* env vars."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache(
+                    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024")),
+                    ttl=float(os.environ.get("LLM_CACHE_TTL", "600")),
+                    path=os.environ.get("LLM_CACHE_PATH") or None,
+                )
+    return _cache
+
+
+def _events() -> dict[tuple[str], int]:
+    if _cache is None:
+        return {}
+    s = _cache.stats()
+    return {(event,): s[event] for event in ("hits", "disk_hits", "misses", "bypassed", "stores")}
+
+
+metrics.gauge("llm_cache_events_total", "DM completion cache events", _events, ["event"], kind="counter")
+metrics.gauge("llm_cache_saved_seconds_total", "Model latency saved by completion cache hits (seconds)",
+              lambda: _cache.stats()["saved_seconds"] if _cache is not None else None, kind="counter")
+metrics.gauge("llm_cache_hit_ratio", "Completion cache hits / lookups",
+              lambda: _cache.stats()["hit_ratio"] if _cache is not None else None)
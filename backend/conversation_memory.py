@@ -0,0 +1,235 @@
+"""
+Bounded per-session conversation memory for the DM prompt.
+
+Each session keeps its last MEMORY_RECENT_TURNS turns verbatim. Older turns are
+folded into a rolling summary, MEMORY_SUMMARIZE_EVERY turns at a time, in a
+background thread. The fold calls a cheaper model (MEMORY_SUMMARY_MODEL) with
+the previous summary and the new turns. Without an API key, or if the call
+fails, the turns are appended as clipped one-liners instead. Turns waiting to be
+folded still appear in the context, so nothing goes missing while a summary is
+being written.
+
+context() renders summary + recent turns under a hard token cap (newest turns
+win), so the prompt stays the same size however long the campaign runs.
+
+Env vars:
+  MEMORY_ENABLED           0 to send no history (default 1)
+  MEMORY_RECENT_TURNS      turns kept verbatim (default 6)
+  MEMORY_SUMMARIZE_EVERY   older turns folded into the summary per update (default 4)
+  MEMORY_TOKEN_BUDGET      estimated tokens of history per prompt (default 800)
+  MEMORY_SUMMARY_CHARS     max characters of rolling summary (default 1600)
+  MEMORY_SUMMARY_MODEL     model for summaries (default google/gemini-2.5-flash; empty = no model)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, NamedTuple
+
+import llm_client
+import metrics
+from prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARIES = metrics.counter("memory_summaries_total", "Rolling summary updates", ["source"])
+SUMMARY_SECONDS = metrics.histogram("memory_summary_seconds", "Time to fold turns into a rolling summary")
+
+SUMMARY_INSTRUCTION = (
+    "You keep the running summary of a Dungeons & Dragons session. Merge the new turns into the "
+    "summary. Keep names, places, quests, promises, injuries, loot and unresolved threats; drop "
+    "flavour text. Write plain prose in the past tense, at most {chars} characters. Reply with the "
+    "summary only."
+)
+MESSAGE_CHARS = 300    # per player message in the verbatim window
+NARRATIVE_CHARS = 600  # per DM narrative in the verbatim window
+FOLD_CHARS = 160       # per turn when folding without a model
+
+
+class Turn(NamedTuple):
+    message: str
+    narrative: str
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def enabled() -> bool:
+    return os.environ.get("MEMORY_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(str(text or "").split())
+    if len(text) <= max_chars:
+        return text
+    return text[: max(0, max_chars - 1)].rstrip() + "…"
+
+
+def _clip_head(text: str, max_chars: int) -> str:
+    """Keep the end of text (the newest events of a summary)."""
+    if len(text) <= max_chars:
+        return text
+    return "…" + text[len(text) - max_chars + 1:].lstrip()
+
+
+def fold_turns(summary: str, turns: list[Turn], max_chars: int) -> str:
+    """Model-free fold: the previous summary plus one clipped line per turn, oldest text dropped first."""
+    lines = [summary] if summary else []
+    for turn in turns:
+        lines.append(f"Player: {_clip(turn.message, FOLD_CHARS // 2)} -> {_clip(turn.narrative, FOLD_CHARS)}")
+    return _clip_head(" ".join(lines), max_chars)
+
+
+def summarize(summary: str, turns: list[Turn], max_chars: int) -> str:
+    """Fold turns into summary with MEMORY_SUMMARY_MODEL; falls back to fold_turns() (logged) on any failure."""
+    model = os.environ.get("MEMORY_SUMMARY_MODEL", "google/gemini-2.5-flash").strip()
+    start = time.perf_counter()
+    if model and llm_client.api_key():
+        transcript = "\n".join(f"Player: {t.message}\nDM: {t.narrative}" for t in turns)
+        try:
+            response = llm_client.chat_completion(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTION.format(chars=max_chars)},
+                    {"role": "user", "content": f"SUMMARY SO FAR:\n{summary or '(none)'}\n\nNEW TURNS:\n{transcript}"},
+                ],
+                temperature=0.2,
+                max_tokens=max(64, max_chars // 3),
+            )
+            text = (response.choices[0].message.content or "").strip()
+            if text:
+                SUMMARIES.inc(source="model")
+                SUMMARY_SECONDS.observe(time.perf_counter() - start)
+                return _clip_head(" ".join(text.split()), max_chars)
+        except Exception:
+            logger.warning("memory summary call failed; folding turns without the model", exc_info=True)
+    SUMMARIES.inc(source="fold")
+    SUMMARY_SECONDS.observe(time.perf_counter() - start)
+    return fold_turns(summary, turns, max_chars)
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _submit(fn: Callable[[], None]) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+    _executor.submit(fn)
+
+
+class ConversationMemory:
+    """One session's memory: a verbatim window of recent turns plus a rolling summary of the rest. Thread-safe."""
+
+    def __init__(
+        self,
+        recent_turns: int = 6,
+        summarize_every: int = 4,
+        token_budget: int = 800,
+        summary_chars: int = 1600,
+        summarizer: Callable[[str, list[Turn], int], str] = summarize,
+        background: bool = True,
+    ):
+        self.recent_turns = max(1, recent_turns)
+        self.summarize_every = max(1, summarize_every)
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self._summarizer = summarizer
+        self._background = background
+        self._lock = threading.Lock()
+        self._recent: deque[Turn] = deque()
+        self._older: list[Turn] = []  # fell out of the window, not yet in the summary
+        self._summary = ""
+        self._folding = False
+        self.turns = 0
+
+    def record(self, message: str, narrative: str) -> None:
+        """Add a finished turn; may start a background summary update."""
+        with self._lock:
+            self.turns += 1
+            self._recent.append(Turn(message, narrative))
+            while len(self._recent) > self.recent_turns:
+                self._older.append(self._recent.popleft())
+            start = not self._folding and len(self._older) >= self.summarize_every
+            if start:
+                self._folding = True
+        if start:
+            if self._background:
+                _submit(self._fold)
+            else:
+                self._fold()
+
+    def _fold(self) -> None:
+        while True:
+            with self._lock:
+                batch = self._older[: self.summarize_every]
+                summary = self._summary
+                if len(batch) < self.summarize_every:
+                    self._folding = False
+                    return
+            try:
+                summary = self._summarizer(summary, batch, self.summary_chars)
+            except Exception:
+                logger.exception("memory summarizer failed")
+                summary = fold_turns(summary, batch, self.summary_chars)
+            with self._lock:
+                self._summary = summary
+                del self._older[: len(batch)]
+
+    def context(self, max_tokens: int | None = None) -> str:
+        """History section for the prompt: summary, then the newest turns that fit, within max_tokens."""
+        budget = self.token_budget if max_tokens is None else max_tokens
+        with self._lock:
+            summary = self._summary
+            turns = self._older + list(self._recent)
+        if budget <= 0 or (not summary and not turns):
+            return ""
+        parts = []
+        if summary:
+            # The summary may take at most half the budget; the rest goes to verbatim turns
+            summary_line = "STORY SO FAR: " + _clip_head(summary, budget * 2)
+            parts.append(summary_line)
+            budget -= estimate_tokens(summary_line) + 1
+        header = "RECENT TURNS (oldest first):"
+        budget -= estimate_tokens(header) + 1
+        lines: list[str] = []
+        for turn in reversed(turns):
+            line = f"Player: {_clip(turn.message, MESSAGE_CHARS)}\nDM: {_clip(turn.narrative, NARRATIVE_CHARS)}"
+            cost = estimate_tokens(line) + 1
+            if cost > budget:
+                break
+            lines.append(line)
+            budget -= cost
+        if lines:
+            parts.append(header + "\n" + "\n".join(reversed(lines)))
+        return "\n".join(parts)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "recent": len(self._recent),
+                "pending_fold": len(self._older),
+                "summary_chars": len(self._summary),
+            }
+
+
+def factory_from_env() -> Callable[[], ConversationMemory]:
+    """Constructor for new sessions' memories, with settings from the MEMORY_* env vars."""
+    return partial(
+        ConversationMemory,
+        recent_turns=_env_int("MEMORY_RECENT_TURNS", 6),
+        summarize_every=_env_int("MEMORY_SUMMARIZE_EVERY", 4),
+        token_budget=_env_int("MEMORY_TOKEN_BUDGET", 800),
+        summary_chars=_env_int("MEMORY_SUMMARY_CHARS", 1600),
+    )
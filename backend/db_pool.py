@@ -0,0 +1,305 @@
+"""
+Thread-safe connection pool shared by snowflake_db and game_engine.
+
+Connections are created by a factory callable (snowflake.connector.connect for the
+real app) and handed out wrapped in a PooledConnection. Calling close() on the
+wrapper returns the connection to the pool instead of logging out, so existing
+"open, query, close" code keeps working while paying only for the query round trip.
+
+Env vars (read by snowflake_db when it builds the shared pool):
+  SNOWFLAKE_POOL_MIN_SIZE               connections kept open when idle (default 1)
+  SNOWFLAKE_POOL_MAX_SIZE               hard cap on open connections (default 8)
+  SNOWFLAKE_POOL_ACQUIRE_TIMEOUT        seconds to wait for a free connection (default 10)
+  SNOWFLAKE_POOL_IDLE_TIMEOUT           close idle connections above min_size after this many seconds (default 300)
+  SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL  validate a connection idle for longer than this before reuse (default 60)
+  SNOWFLAKE_POOL_MAX_LIFETIME           recycle connections older than this many seconds, 0 = never (default 3600)
+"""
+
+import threading
+import time
+from typing import Any, Callable
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available within the acquire timeout."""
+
+
+class _Slot:
+    """A raw connection plus the bookkeeping the pool needs for it."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn: Any):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled connection. Behaves like the raw connection (cursor, commit,
+    rollback, ...); close() releases it back to the pool and discard() drops it.
+    Also usable as a context manager.
+    """
+
+    def __init__(self, pool: "ConnectionPool", slot: _Slot):
+        self._pool = pool
+        self._slot = slot
+
+    def __getattr__(self, name: str) -> Any:
+        slot = self.__dict__.get("_slot")
+        if slot is None:
+            raise AttributeError(f"connection already returned to pool ({name})")
+        return getattr(slot.conn, name)
+
+    def close(self) -> None:
+        """Return the connection to the pool (safe to call more than once)."""
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot)
+
+    def discard(self) -> None:
+        """Close the underlying connection instead of reusing it (e.g. after a network error)."""
+        slot, self._slot = self._slot, None
+        if slot is not None:
+            self._pool._release(slot, broken=True)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _default_validate(conn: Any) -> bool:
+    """Health check: run SELECT 1 on the connection."""
+    is_closed = getattr(conn, "is_closed", None)
+    if callable(is_closed) and is_closed():
+        return False
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        return True
+    finally:
+        cur.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable connections.
+
+    - acquire() hands out the most recently used idle connection, validating it first if it
+      sat idle longer than health_check_interval; opens a new one if under max_size; otherwise
+      waits up to acquire_timeout for a release.
+    - Idle connections above min_size are closed after idle_timeout; any connection older than
+      max_lifetime is recycled on release.
+    - stats() returns counters for monitoring.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 8,
+        acquire_timeout: float = 10.0,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 60.0,
+        max_lifetime: float = 3600.0,
+        validate: Callable[[Any], bool] | None = None,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._factory = factory
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.max_lifetime = max_lifetime
+        self._validate = validate or _default_validate
+        self._idle: list[_Slot] = []  # used as a stack: most recently released at the end
+        self._size = 0  # open connections (idle + in use + being created)
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+        self._counters = {
+            "created": 0,
+            "closed": 0,
+            "acquired": 0,
+            "reused": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_checks": 0,
+            "health_check_failures": 0,
+            "idle_evictions": 0,
+            "lifetime_recycles": 0,
+            "connect_errors": 0,
+        }
+
+    # ---- public API ----
+
+    def acquire(self, timeout: float | None = None) -> PooledConnection:
+        """Check out a connection. Raises PoolTimeout if none frees up in time."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            slot = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+                expired = self._take_expired_locked()
+                if self._idle:
+                    slot = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(f"no connection available after {timeout:.1f}s")
+                    if not waited:
+                        self._counters["waits"] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                    continue
+            _close_quietly(expired)
+            if create:
+                slot = self._open_slot()
+                with self._cond:
+                    self._counters["acquired"] += 1
+                return PooledConnection(self, slot)
+            if self._check_health(slot):
+                with self._cond:
+                    self._counters["acquired"] += 1
+                    self._counters["reused"] += 1
+                return PooledConnection(self, slot)
+            # Unhealthy: drop it and try again (may create a replacement)
+            self._close_slot(slot)
+
+    def fill(self) -> int:
+        """Open connections until min_size are available. Returns how many were opened."""
+        opened = 0
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return opened
+                self._size += 1
+            slot = self._open_slot()
+            with self._cond:
+                self._idle.insert(0, slot)
+                self._cond.notify()
+            opened += 1
+
+    def prune(self) -> int:
+        """Close idle connections past idle_timeout (keeping min_size). Returns how many were closed."""
+        with self._cond:
+            expired = self._take_expired_locked()
+        _close_quietly(expired)
+        return len(expired)
+
+    def close(self) -> None:
+        """Close every idle connection and refuse further acquires. In-use connections close on release."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for slot in idle:
+            self._close_slot(slot)
+
+    def stats(self) -> dict[str, Any]:
+        """Snapshot of pool size and counters."""
+        with self._cond:
+            out = dict(self._counters)
+            out.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+        return out
+
+    # ---- internals ----
+
+    def _open_slot(self) -> _Slot:
+        try:
+            conn = self._factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._counters["connect_errors"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["created"] += 1
+        return _Slot(conn)
+
+    def _check_health(self, slot: _Slot) -> bool:
+        if time.monotonic() - slot.last_used < self.health_check_interval:
+            return True
+        with self._cond:
+            self._counters["health_checks"] += 1
+        try:
+            ok = bool(self._validate(slot.conn))
+        except Exception:
+            ok = False
+        if not ok:
+            with self._cond:
+                self._counters["health_check_failures"] += 1
+        return ok
+
+    def _release(self, slot: _Slot, broken: bool = False) -> None:
+        now = time.monotonic()
+        recycle = self.max_lifetime > 0 and now - slot.created_at > self.max_lifetime
+        with self._cond:
+            if not broken and not recycle and not self._closed:
+                slot.last_used = now
+                self._idle.append(slot)
+                self._cond.notify()
+                return
+            if recycle and not broken:
+                self._counters["lifetime_recycles"] += 1
+        self._close_slot(slot)
+
+    def _close_slot(self, slot: _Slot) -> None:
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._counters["closed"] += 1
+            self._cond.notify()
+
+    def _take_expired_locked(self) -> list[_Slot]:
+        """
+        Remove idle connections past idle_timeout, oldest first, while above min_size.
+        Caller holds the lock and closes the returned slots after releasing it.
+        """
+        if self.idle_timeout <= 0 or not self._idle:
+            return []
+        now = time.monotonic()
+        evicted = []
+        # _idle is ordered oldest-release first
+        while self._idle and self._size - len(evicted) > self.min_size:
+            if now - self._idle[0].last_used <= self.idle_timeout:
+                break
+            evicted.append(self._idle.pop(0))
+        self._size -= len(evicted)
+        self._counters["closed"] += len(evicted)
+        self._counters["idle_evictions"] += len(evicted)
+        if evicted:
+            self._cond.notify_all()
+        return evicted
+
+
+def _close_quietly(slots: list[_Slot]) -> None:
+    for slot in slots:
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
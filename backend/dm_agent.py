@@ -4,22 +4,84 @@ DM Agent: frontend geminiService logic in Python.
 Flow: 1) Query Snowflake for monster/compendium data.
       2) Call OpenRouter (google/gemini-2.5-pro) with that context + player stats + message.
       3) Return narrative + updated stats to the frontend.
+
+Before step 2 each turn is routed: purely mechanical actions (inventory, stats,
+dice) are answered by rules_engine.py with no model call, a plain attack on a known
+AC is rolled by rules_engine.py and narrated by DM_LIGHT_MODEL, short simple actions
+go to DM_LIGHT_MODEL, and the rest to OPENROUTER_MODEL.
+
+Each stage is timed into dm_stage_seconds (see metrics.py); model token usage,
+fallback answers and swallowed errors are counted and logged.
 """
 
+import asyncio
+import contextvars
 import json
+import logging
 import os
 import re
-from typing import Any
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+
+import completion_cache
+import entity_matcher
+import inventory
+import llm_client
+import metrics
+import rules_engine
+from compendium_backend import name_key
+from json_stream import StringFieldStreamer
+from prompt_builder import build_prompt, build_scene_prompt
+from singleflight import SingleFlight
+from snowflake_db import (
+    fetch_compendium_bulk,
+    fetch_monsters_bulk,
+    load_entity_matcher,
+    queue_player_stats,
+    update_player_stats_bulk,
+)
+
+logger = logging.getLogger(__name__)
+
+TURN_SECONDS = metrics.histogram("dm_turn_seconds", "End-to-end run_turn latency", ["mode"])
+FALLBACKS = metrics.counter("dm_fallbacks_total", "Turns answered with a fallback result", ["reason"])
+ERRORS = metrics.counter("dm_errors_total", "Errors caught inside the turn pipeline", ["stage"])
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Model tokens reported by the API", ["direction"])
+
+OPENROUTER_MODEL = "google/gemini-2.5-pro"
+DM_TEMPERATURE = 0.7
 
-from openai import OpenAI
+# Max concurrent Snowflake lookups from run_turn_async (per event loop); keep <= SNOWFLAKE_POOL_MAX_SIZE
+SNOWFLAKE_MAX_CONCURRENCY = int(os.environ.get("SNOWFLAKE_MAX_CONCURRENCY", "8"))
 
-from snowflake_db import fetch_monster, fetch_monster_stats, update_player_stats
+# Share one model call between concurrent turns with identical (normalized) prompts
+LLM_SINGLEFLIGHT = os.environ.get("LLM_SINGLEFLIGHT", "").strip().lower() in ("1", "true", "yes", "on")
+_llm_flight = SingleFlight("llm")
 
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-OPENROUTER_MODEL = "google/gemini-2.5-pro"
+# Tiered routing: purely mechanical actions are answered by rules_engine, short simple narration
+# goes to DM_LIGHT_MODEL and everything else to OPENROUTER_MODEL. DM_ROUTING=0 sends every turn to the heavy model.
+DM_ROUTING = os.environ.get("DM_ROUTING", "1").strip().lower() not in ("0", "false", "no", "off")
+DM_LIGHT_MODEL = os.environ.get("DM_LIGHT_MODEL", "google/gemini-2.5-flash").strip()
+DM_LIGHT_MAX_CHARS = int(os.environ.get("DM_LIGHT_MAX_CHARS", "160"))
+TIER_RULES, TIER_LIGHT, TIER_HEAVY = "rules", "light", "heavy"
+ROUTES = metrics.counter("dm_route_total", "Turns by routing tier", ["tier"])
+TIER_SECONDS = metrics.histogram("dm_tier_seconds", "End-to-end turn latency by routing tier", ["tier"])
+
+# Most concurrent model calls for one party round (run_party_turn)
+PARTY_MAX_PARALLEL = int(os.environ.get("PARTY_MAX_PARALLEL", "8"))
 
+# Most entities looked up per turn when the entity matcher is loaded
+MAX_ENTITIES_PER_TURN = 10
 
-DM_SYSTEM_INSTRUCTION = """
+# Write PLAYER_STATS off the request path (coalesced, batched); set to 0 for synchronous MERGEs
+PLAYER_STATS_WRITE_BEHIND = os.environ.get("PLAYER_STATS_WRITE_BEHIND", "1").strip().lower() not in (
+    "0", "false", "no", "off",
+)
+
+
+_DM_RULES = """
 You are a World-Class Dungeon Master (DM) for a Dungeons & Dragons game.
 Your goal is to provide an immersive, rules-consistent narrative experience.
 
@@ -28,7 +90,9 @@ RULES:
 2. USE COMPENDIUM: When compendium data is provided below, use it for monster stats, items, or lore. Be accurate to that data.
 3. NARRATION: Be descriptive and dramatic. Don't just say "You see a goblin." Say "From the flickering shadows of the damp cavern, a small, green-skinned figure emerges, clutching a jagged rusted blade."
 4. D&D 5E RULES: Use standard 5th Edition rules for combat and checks.
+"""
 
+DM_SYSTEM_INSTRUCTION = _DM_RULES + """
 Respond with ONLY valid JSON in this exact shape (no other text):
 {"narrative": "2-5 sentences of what happens next.", "hp_change": 0, "xp_change": 0, "gold_change": 0, "new_items": []}
 
@@ -37,6 +101,17 @@ Respond with ONLY valid JSON in this exact shape (no other text):
 - new_items: list of new item names (strings) to add to inventory, or [].
 """
 
+# Party rounds resolved as one scene (run_party_turn with scene=True)
+SCENE_SYSTEM_INSTRUCTION = _DM_RULES + """
+Several players act in the same round. Resolve their actions together as one scene, then answer
+each player separately. Respond with ONLY valid JSON in this exact shape (no other text):
+{"players": [{"player_id": "...", "narrative": "2-5 sentences of what happens to this player.", "hp_change": 0, "xp_change": 0, "gold_change": 0, "new_items": []}]}
+
+- players: one entry per party member, in the order given, with their player_id.
+- hp_change, xp_change, gold_change: integers (negative or positive).
+- new_items: list of new item names (strings) to add to that player's inventory, or [].
+"""
+
 
 def _extract_search_terms(message: str) -> list[str]:
     """Extract possible compendium search terms from the player message."""
@@ -53,186 +128,777 @@ def _extract_search_terms(message: str) -> list[str]:
     return terms[:5]  # Limit to a few lookups per turn
 
 
-def _get_monster_stats_for_message(message: str) -> dict[str, Any] | None:
+def _search_terms(message: str) -> tuple[list[str], list[str]]:
+    """
+    (COMPENDIUM terms, MONSTERS terms) for the message: the known names the entity matcher
+    finds in it, so nothing unknown is queried. The matcher is built on first use; only if that
+    fails are both the guessed words from _extract_search_terms.
+    """
+    matcher = load_entity_matcher()
+    if matcher is None:
+        terms = _extract_search_terms(message)
+        return terms, terms
+    compendium, monsters = [], []
+    for match in matcher.find(message):
+        terms = compendium if match.kind == entity_matcher.COMPENDIUM else monsters
+        if match.name not in terms:
+            terms.append(match.name)
+    return compendium[:MAX_ENTITIES_PER_TURN], monsters[:MAX_ENTITIES_PER_TURN]
+
+
+def _get_monster_stats_for_message(terms: list[str]) -> dict[str, Any] | None:
     """
-    Scan the player message for monster names; for the first candidate, call fetch_monster_stats.
-    Returns dict with name, hp, ac (and optionally type, abilities) or None if none found.
+    Look up all candidate terms in MONSTERS with one batched query; return the stats of the
+    first term (in message order) that has HP or AC, or None if none found.
     """
-    terms = _extract_search_terms(message)
+    terms = [t for t in terms if t and len(t) >= 2]
+    if not terms:
+        return None
+    with metrics.timed("monster_lookup"):
+        rows = fetch_monsters_bulk(terms)
+    return _pick_monster_stats(terms, rows)
+
+
+def _pick_monster_stats(terms: list[str], rows: dict[str, Any]) -> dict[str, Any] | None:
+    """Stats of the first term (in message order) whose MONSTERS row has HP or AC."""
     for term in terms:
-        if not term or len(term) < 2:
-            continue
-        row = fetch_monster_stats(term)
+        row = rows.get(term)
         if row and (row.get("hp") is not None or row.get("ac") is not None):
             return row
     return None
 
 
-def _query_compendium(message: str) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
+def _query_compendium(terms: list[str]) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
     """
-    Query Snowflake for monster/compendium data first.
-    Returns (list of compendium entries found, first monster dict or None).
+    Query Snowflake COMPENDIUM for all candidate terms with one batched query.
+    Returns (list of compendium entries found in term order, first monster dict or None).
     """
-    terms = _extract_search_terms(message)
-    entries = []
+    with metrics.timed("compendium_lookup"):
+        rows = fetch_compendium_bulk(terms)
+    return _compendium_context([row for row in rows.values() if row])
+
+
+def _compendium_context(entries: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
+    """(entries, the entry to return as "monster": the first monster/creature, else the first entry)."""
     first_monster = None
-    seen = set()
-    for term in terms:
-        if not term or term.upper() in seen:
-            continue
-        seen.add(term.upper())
-        row = fetch_monster(term)
-        if row:
-            entries.append(row)
-            if first_monster is None and (row.get("type") or "").lower() in ("monster", "creature", ""):
-                first_monster = row
+    for row in entries:
+        if (row.get("type") or "").lower() in ("monster", "creature", ""):
+            first_monster = row
+            break
     if first_monster is None and entries:
         first_monster = entries[0]
     return entries, first_monster
 
 
+NO_API_KEY_NARRATIVE = "Set OPENROUTER_API_KEY or API_KEY to enable the Dungeon Master."
+ERROR_NARRATIVE = "The DM could not process that action."
+
+
+def _fallback_result(narrative: str, reason: str | None = None) -> dict[str, Any]:
+    """DM result with no stat changes (used when the model can't be called or parsed); counted under reason."""
+    if reason:
+        FALLBACKS.inc(reason=reason)
+    return {
+        "narrative": narrative,
+        "hp_change": 0,
+        "xp_change": 0,
+        "gold_change": 0,
+        "new_items": [],
+    }
+
+
+def _get_api_key() -> str:
+    return llm_client.api_key()
+
+
+def _build_messages(
+    message: str,
+    stats: dict[str, Any],
+    compendium_entries: list[dict[str, Any]],
+    monster_stats: dict[str, Any] | None = None,
+    history: str = "",
+) -> list[dict[str, str]]:
+    """
+    Chat messages for one turn: the static DM instruction as system (identical every turn, so
+    provider prefix caching applies), then compendium, encounter stats, conversation history,
+    player state and message as user, within PROMPT_TOKEN_BUDGET. See prompt_builder.py.
+    """
+    with metrics.timed("build_prompt"):
+        messages, _ = build_prompt(
+            DM_SYSTEM_INSTRUCTION, message, stats, compendium_entries, monster_stats, history=history
+        )
+    return messages
+
+
+def _parse_dm_response(text: str) -> dict[str, Any]:
+    """Strip an optional ``` fence from the model output and parse the JSON object."""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        text = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
+    return json.loads(text)
+
+
+def _record_usage(response: Any) -> None:
+    """Add the response's prompt/completion token counts (when the API reports them) to llm_tokens_total."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, direction="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, direction="completion")
+
+
+def _parse_completion(text: str) -> dict[str, Any] | None:
+    """_parse_dm_response, timed; None (counted and logged) if the model output isn't valid JSON."""
+    try:
+        with metrics.timed("parse"):
+            return _parse_dm_response(text)
+    except Exception:
+        ERRORS.inc(stage="parse")
+        logger.warning("could not parse DM response (%d chars)", len(text or ""), exc_info=True)
+        return None
+
+
+def _completion_kwargs(messages: list[dict[str, str]], model: str = OPENROUTER_MODEL) -> dict[str, Any]:
+    return {
+        "model": model,
+        "messages": messages,
+        "response_format": {"type": "json_object"},
+        "temperature": DM_TEMPERATURE,
+    }
+
+
+def _request_completion(messages: list[dict[str, str]], model: str = OPENROUTER_MODEL) -> str:
+    response = llm_client.chat_completion(**_completion_kwargs(messages, model))
+    _record_usage(response)
+    return response.choices[0].message.content or ""
+
+
+async def _arequest_completion(messages: list[dict[str, str]], model: str = OPENROUTER_MODEL) -> str:
+    response = await llm_client.achat_completion(**_completion_kwargs(messages, model))
+    _record_usage(response)
+    return response.choices[0].message.content or ""
+
+
+def _flight_key(messages: list[dict[str, str]], cache_key: str | None, model: str = OPENROUTER_MODEL) -> str:
+    return cache_key or completion_cache.make_key(model, DM_TEMPERATURE, messages)
+
+
+def _cache_lookup(
+    messages: list[dict[str, str]], use_cache: bool, model: str = OPENROUTER_MODEL
+) -> tuple[str | None, dict[str, Any] | None]:
+    """(cache key, cached result) when the completion cache is on; key is None when caching is off or bypassed."""
+    if not completion_cache.enabled():
+        return None, None
+    cache = completion_cache.get_cache()
+    if not use_cache:
+        cache.record_bypass()
+        return None, None
+    key = completion_cache.make_key(model, DM_TEMPERATURE, messages)
+    return key, cache.get(key)
+
+
 def _call_openrouter(
     message: str,
     stats: dict[str, Any],
     compendium_entries: list[dict[str, Any]],
     monster_stats: dict[str, Any] | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    model: str = OPENROUTER_MODEL,
 ) -> dict[str, Any]:
-    """Call OpenRouter (google/gemini-2.5-pro) with DM instruction + compendium context + stats + message; return parsed JSON."""
-    api_key = os.environ.get("OPENROUTER_API_KEY") or os.environ.get("API_KEY", "")
+    """
+    Call OpenRouter (model: google/gemini-2.5-pro unless routed to DM_LIGHT_MODEL) with DM instruction +
+    compendium context + stats + message; return parsed JSON.
+    With LLM_CACHE_ENABLED, identical (normalized) prompts are answered from the completion cache unless use_cache is False.
+    """
+    api_key = _get_api_key()
     if not api_key:
-        return {
-            "narrative": "Set OPENROUTER_API_KEY or API_KEY to enable the Dungeon Master.",
-            "hp_change": 0,
-            "xp_change": 0,
-            "gold_change": 0,
-            "new_items": [],
-        }
+        return _fallback_result(NO_API_KEY_NARRATIVE, "no_api_key")
+    messages = _build_messages(message, stats, compendium_entries, monster_stats, history)
+    cache_key, cached = _cache_lookup(messages, use_cache, model)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        with metrics.timed("llm_call"):
+            if LLM_SINGLEFLIGHT:
+                text = _llm_flight.do(
+                    _flight_key(messages, cache_key, model), lambda: _request_completion(messages, model)
+                )
+            else:
+                text = _request_completion(messages, model)
+    except Exception:
+        ERRORS.inc(stage="llm_call")
+        logger.warning("OpenRouter call failed", exc_info=True)
+        return _fallback_result(ERROR_NARRATIVE, "llm_error")
+    result = _parse_completion(text)
+    if result is None:
+        return _fallback_result(ERROR_NARRATIVE, "parse_error")
+    if cache_key:
+        completion_cache.get_cache().set(cache_key, result, time.perf_counter() - start)
+    return result
+
+
+def _stream_openrouter(
+    message: str,
+    stats: dict[str, Any],
+    compendium_entries: list[dict[str, Any]],
+    monster_stats: dict[str, Any] | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    model: str = OPENROUTER_MODEL,
+) -> Iterator[tuple[str, Any]]:
+    """
+    Streaming variant of _call_openrouter. Yields ("narrative", text) as narrative tokens
+    arrive, then exactly one ("result", parsed JSON dict). A completion cache hit is sent
+    as a single narrative chunk.
+    """
+    api_key = _get_api_key()
+    if not api_key:
+        result = _fallback_result(NO_API_KEY_NARRATIVE, "no_api_key")
+        yield "narrative", result["narrative"]
+        yield "result", result
+        return
+    messages = _build_messages(message, stats, compendium_entries, monster_stats, history)
+    cache_key, cached = _cache_lookup(messages, use_cache, model)
+    if cached is not None:
+        yield "narrative", cached.get("narrative", "")
+        yield "result", cached
+        return
+
+    streamer = StringFieldStreamer("narrative")
+    chunks = []
+    start = time.perf_counter()
+    try:
+        stream = llm_client.chat_completion(**_completion_kwargs(messages, model), stream=True)
+        for chunk in stream:
+            _record_usage(chunk)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            chunks.append(delta)
+            text = streamer.feed(delta)
+            if text:
+                yield "narrative", text
+    except Exception:
+        ERRORS.inc(stage="llm_call")
+        logger.warning("OpenRouter stream failed after %d chunks", len(chunks), exc_info=True)
+    metrics.record_stage("llm_call", time.perf_counter() - start)
+
+    try:
+        with metrics.timed("parse"):
+            result = _parse_dm_response("".join(chunks))
+    except Exception:
+        ERRORS.inc(stage="parse")
+        logger.warning("could not parse streamed DM response (%d chunks)", len(chunks), exc_info=True)
+        # Keep whatever narrative already reached the player; apply no stat changes
+        result = _fallback_result(streamer.value or ERROR_NARRATIVE, "parse_error")
+        if not streamer.value:
+            yield "narrative", result["narrative"]
+    else:
+        if cache_key:
+            completion_cache.get_cache().set(cache_key, result, time.perf_counter() - start)
+    yield "result", result
+
+
+async def _call_openrouter_async(
+    message: str,
+    stats: dict[str, Any],
+    compendium_entries: list[dict[str, Any]],
+    monster_stats: dict[str, Any] | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    model: str = OPENROUTER_MODEL,
+) -> dict[str, Any]:
+    """Async variant of _call_openrouter (shared AsyncOpenAI client); waits on the model without holding a thread."""
+    api_key = _get_api_key()
+    if not api_key:
+        return _fallback_result(NO_API_KEY_NARRATIVE, "no_api_key")
+    messages = _build_messages(message, stats, compendium_entries, monster_stats, history)
+    cache_key, cached = _cache_lookup(messages, use_cache, model)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        with metrics.timed("llm_call"):
+            if LLM_SINGLEFLIGHT:
+                text = await _llm_flight.ado(
+                    _flight_key(messages, cache_key, model), lambda: _arequest_completion(messages, model)
+                )
+            else:
+                text = await _arequest_completion(messages, model)
+    except Exception:
+        ERRORS.inc(stage="llm_call")
+        logger.warning("OpenRouter call failed", exc_info=True)
+        return _fallback_result(ERROR_NARRATIVE, "llm_error")
+    result = _parse_completion(text)
+    if result is None:
+        return _fallback_result(ERROR_NARRATIVE, "parse_error")
+    if cache_key:
+        completion_cache.get_cache().set(cache_key, result, time.perf_counter() - start)
+    return result
+
+
+def _normalize_stats(stats: dict[str, Any]) -> dict[str, Any]:
+    """Copy of stats with the inventory as a counted multiset ({name: count}, see inventory.py)."""
+    stats = dict(stats)
+    stats["inventory"] = inventory.counts(stats.get("inventory"))
+    return stats
+
+
+def _prepare_turn(message: str, stats: dict[str, Any]) -> dict[str, Any]:
+    """Normalize stats and look up compendium context for the message (at most one query per table)."""
+    stats = _normalize_stats(stats)
+
+    # find candidate names once; each lookup below is a single batched query (or a cache hit)
+    with metrics.timed("extract_terms"):
+        compendium_terms, monster_terms = _search_terms(message)
+
+    # scan message for monster names; if found, fetch exact HP/AC from Snowflake
+    monster_stats = _get_monster_stats_for_message(monster_terms)
+
+    # query Snowflake for monster/compendium data (for general context)
+    compendium_entries, first_monster = _query_compendium(compendium_terms)
+
+    return {
+        "stats": stats,
+        "monster_stats": monster_stats,
+        "compendium_entries": compendium_entries,
+        "first_monster": first_monster,
+    }
+
+
+def _apply_result(
+    turn: dict[str, Any],
+    result: dict[str, Any],
+    player_id: str | None = None,
+    delta: bool = False,
+) -> dict[str, Any]:
+    """Apply the model's stat deltas, persist the new stats and build the run_turn response."""
+    out = _turn_response(turn, result, player_id)
+    _persist_stats([_stats_row(out, delta)])
+    return out
+
+
+def _turn_response(turn: dict[str, Any], result: dict[str, Any], player_id: str | None = None) -> dict[str, Any]:
+    """
+    The run_turn response for a model result: narrative, stats with the deltas applied, monster if
+    any, and "changes": only the fields this turn changed (hp/xp/gold as new values, inventory
+    as {item: new count}, 0 = gone).
+    """
+    stats = turn["stats"]
+    items = stats["inventory"]
     hp = stats.get("hp", 100)
     xp = stats.get("xp", 0)
     gold = stats.get("gold", 0)
-    inv = stats.get("inventory") or []
-    inv_str = ", ".join(inv) if inv else "none"
-    compendium_blob = "No compendium data for this turn."
-    if compendium_entries:
-        compendium_blob = "\n".join(
-            json.dumps(e, ensure_ascii=False) for e in compendium_entries
-        )
-    user_content = f"""COMPENDIUM DATA (from Snowflake):
-{compendium_blob}
 
-CURRENT PLAYER STATE: HP={hp}, XP={xp}, Gold={gold}, Inventory=[{inv_str}]
+    narrative = result.get("narrative", "")
+    hp_change = result.get("hp_change", 0)
+    xp_change = result.get("xp_change", 0)
+    gold_change = result.get("gold_change", 0)
+    new_items = result.get("new_items")
+    if not isinstance(new_items, list):
+        new_items = []
+
+    new_inventory = inventory.add(items, [i for i in new_items if isinstance(i, (str, dict))])
+    new_stats = {
+        "hp": max(0, hp + hp_change),
+        "xp": max(0, xp + xp_change),
+        "gold": max(0, gold + gold_change),
+        "inventory": inventory.render(new_inventory),
+    }
+    changes: dict[str, Any] = {k: new_stats[k] for k in ("hp", "xp", "gold") if new_stats[k] != stats.get(k)}
+    changed_items = inventory.changes(items, new_inventory)
+    if changed_items:
+        changes["inventory"] = changed_items
+    if player_id:
+        new_stats["player_id"] = player_id
+
+    out = {"narrative": narrative, "stats": new_stats, "changes": changes}
+    first_monster = turn["first_monster"]
+    if first_monster is not None:
+        out["monster"] = first_monster
+    return out
 
-PLAYER MESSAGE: {message}
 
-Respond with ONLY the JSON object (narrative, hp_change, xp_change, gold_change, new_items). No markdown."""
+def _stats_row(out: dict[str, Any], delta: bool = False) -> dict[str, Any]:
+    """
+    PLAYER_STATS row for a turn response: the new stats, plus the columns the turn changed if
+    the turn started from the server's state (delta protocol). Stats a client sent may differ
+    from the stored row anywhere, so those rows carry no "changed" and every column is written.
+    """
+    row = dict(out["stats"])
+    if delta:
+        row["changed"] = list(out["changes"])
+    return row
 
-    system_content = DM_SYSTEM_INSTRUCTION
-    if monster_stats:
-        m_name = monster_stats.get("name", "Unknown")
-        m_hp = monster_stats.get("hp")
-        m_ac = monster_stats.get("ac")
-        parts = [f"ENCOUNTER MONSTER: {m_name}."]
-        if m_hp is not None:
-            parts.append(f"HP = {m_hp}.")
-        if m_ac is not None:
-            parts.append(f"AC = {m_ac}.")
-        system_content += "\n\n" + " ".join(parts)
-        system_content += " You MUST use these exact stats for the encounter. Do not hallucinate different HP or AC values."
 
+def _persist_stats(rows: list[dict[str, Any]]) -> None:
+    """
+    Persist updated stats to Snowflake (equivalent of updateCharacterStats tool): queued for the
+    write-behind writer, or one multi-row MERGE with PLAYER_STATS_WRITE_BEHIND=0. Rows with a
+    "changed" list write only those columns (see update_player_stats_bulk). Errors are logged.
+    """
     try:
-        client = OpenAI(
-            base_url=OPENROUTER_BASE_URL,
-            api_key=api_key,
-        )
-        response = client.chat.completions.create(
-            model=OPENROUTER_MODEL,
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content},
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7,
-        )
-        text = (response.choices[0].message.content or "").strip()
-        if text.startswith("```"):
-            lines = text.split("\n")
-            text = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
-        return json.loads(text)
+        with metrics.timed("persist_stats"):
+            if PLAYER_STATS_WRITE_BEHIND:
+                for stats in rows:
+                    queue_player_stats(stats)
+            else:
+                update_player_stats_bulk(rows)
     except Exception:
-        return {
-            "narrative": "The DM could not process that action.",
-            "hp_change": 0,
-            "xp_change": 0,
-            "gold_change": 0,
-            "new_items": [],
-        }
+        ERRORS.inc(stage="persist_stats")
+        logger.exception("could not persist stats for players %s", [r.get("player_id") or "default" for r in rows])
+
+
+# Words that call for the heavy model: social play, magic, reasoning, open questions
+_HEAVY_HINTS = re.compile(
+    r"\b(persuade|convince|negotiate|bargain|deceive|lie|intimidate|threaten|bribe|ask|tell|talk|speak|say|"
+    r"shout|cast|spell|ritual|pray|plan|why|who|how|explain|remember|investigate|decipher|riddle|puzzle)\b"
+)
+
+
+def _classify(message: str, turn: dict[str, Any]) -> str:
+    """TIER_LIGHT for a short, single, plain action outside combat; TIER_HEAVY otherwise."""
+    text = message.strip()
+    if (
+        not DM_LIGHT_MODEL
+        or len(text) > DM_LIGHT_MAX_CHARS
+        or turn["monster_stats"]
+        or '"' in text
+        or len(re.findall(r"[.!?](?:\s|$)", text)) > 1
+        or _HEAVY_HINTS.search(text.lower())
+    ):
+        return TIER_HEAVY
+    return TIER_LIGHT
+
+
+def _route(message: str, turn: dict[str, Any]) -> tuple[str, dict[str, Any] | None]:
+    """
+    (tier, result): result is the rules engine's answer for TIER_RULES, else None (call _tier_model(tier)
+    with _model_message(message, turn)). A plain attack is rolled here (turn["attack_roll"]) and
+    narrated by the light model, which follows the monster's HP across turns.
+    """
+    if not DM_ROUTING:
+        tier, result = TIER_HEAVY, None
+    else:
+        with metrics.timed("route"):
+            result = rules_engine.resolve(message, turn["stats"])
+            if result is not None:
+                tier = TIER_RULES
+            else:
+                turn["attack_roll"] = rules_engine.attack_roll(message, turn["stats"], turn["monster_stats"])
+                if turn["attack_roll"]:
+                    tier = TIER_LIGHT if DM_LIGHT_MODEL else TIER_HEAVY
+                else:
+                    tier = _classify(message, turn)
+    ROUTES.inc(tier=tier)
+    return tier, result
+
+
+def _model_message(message: str, turn: dict[str, Any]) -> str:
+    """The player message for the model, with the rules engine's attack roll when there is one."""
+    rolled = turn.get("attack_roll")
+    if not rolled:
+        return message
+    return (
+        f"{message}\nATTACK ROLL (already resolved by the rules engine; narrate exactly this outcome): {rolled} "
+        "Apply any damage to the monster's remaining HP as of the earlier turns. If that drops to 0 the "
+        "monster dies: set xp_change for the kill. Otherwise it reacts and may strike back (hp_change)."
+    )
+
+
+def _tier_model(tier: str) -> str:
+    return DM_LIGHT_MODEL if tier == TIER_LIGHT else OPENROUTER_MODEL
 
 
 def run_turn(
     message: str,
     stats: dict[str, Any],
     player_id: str | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    delta: bool = False,
 ) -> dict[str, Any]:
     """
-    Run one DM turn: 1) Query Snowflake for monster data, 2) Call OpenRouter (Gemini), 3) Apply updates and persist to Snowflake.
+    Run one DM turn: 1) Query Snowflake for monster data (at most one query per table), 2) Call OpenRouter (Gemini), 3) Apply updates and persist to Snowflake
+    (queued for the background writer unless PLAYER_STATS_WRITE_BEHIND=0).
 
     Args:
         message: Player message (e.g. "I attack the dragon").
         stats: Current stats dict with hp, xp, gold, inventory.
         player_id: Optional player id for Snowflake.
+        use_cache: False to skip the completion cache for this turn (only matters with LLM_CACHE_ENABLED).
+        history: Earlier turns for context (conversation_memory.ConversationMemory.context()); already token-capped.
+        delta: stats is the player's state from the server (delta protocol), so only the columns this
+            turn changed need writing to PLAYER_STATS; otherwise every column is written.
 
     Returns:
         {
             "narrative": str,
             "stats": { "hp", "xp", "gold", "inventory" },
+            "changes": { only the fields this turn changed },
             "monster": { ... } or null if no compendium hit,
         }
     """
-    stats = dict(stats)
-    inventory = stats.get("inventory")
-    if not isinstance(inventory, list):
-        inventory = list(inventory) if inventory else []
-    stats["inventory"] = inventory
-    hp = stats.get("hp", 100)
-    xp = stats.get("xp", 0)
-    gold = stats.get("gold", 0)
+    start = time.perf_counter()
+    turn = _prepare_turn(message, stats)
+
+    # mechanical actions are resolved locally; the rest go to the model for their tier
+    tier, result = _route(message, turn)
+    if result is None:
+        # call OpenRouter with compendium + monster stats (HP/AC in system prompt) + message
+        result = _call_openrouter(
+            _model_message(message, turn), turn["stats"], turn["compendium_entries"],
+            monster_stats=turn["monster_stats"], use_cache=use_cache, history=history, model=_tier_model(tier),
+        )
+    out = _apply_result(turn, result, player_id, delta)
+    elapsed = time.perf_counter() - start
+    TURN_SECONDS.observe(elapsed, mode="sync")
+    TIER_SECONDS.observe(elapsed, tier=tier)
+    return out
 
-    # scan message for monster names; if found, fetch exact HP/AC from Snowflake
-    monster_stats = _get_monster_stats_for_message(message)
 
-    # query Snowflake for monster/compendium data (for general context)
-    compendium_entries, first_monster = _query_compendium(message)
+def run_turn_stream(
+    message: str,
+    stats: dict[str, Any],
+    player_id: str | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    delta: bool = False,
+) -> Iterator[tuple[str, Any]]:
+    """
+    Streaming run_turn. Yields ("narrative", text) chunks as the model writes the narrative,
+    then one ("done", response) where response has the same shape as run_turn's return value.
+    """
+    start = time.perf_counter()
+    turn = _prepare_turn(message, stats)
+    tier, result = _route(message, turn)
+    if result is not None:
+        yield "narrative", result["narrative"]
+    else:
+        for kind, value in _stream_openrouter(
+            _model_message(message, turn), turn["stats"], turn["compendium_entries"],
+            monster_stats=turn["monster_stats"], use_cache=use_cache, history=history, model=_tier_model(tier),
+        ):
+            if kind == "narrative":
+                yield kind, value
+            else:
+                result = value
+    out = _apply_result(turn, result or _fallback_result(""), player_id, delta)
+    elapsed = time.perf_counter() - start
+    TURN_SECONDS.observe(elapsed, mode="stream")
+    TIER_SECONDS.observe(elapsed, tier=tier)
+    yield "done", out
+
+
+def _prepare_party(members: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    _prepare_turn for every party member, with one MONSTERS and one COMPENDIUM query for the
+    union of everyone's terms; each member then gets the rows for their own terms.
+    """
+    with metrics.timed("extract_terms"):
+        terms = [_search_terms(m["message"]) for m in members]
+    compendium_union = list(dict.fromkeys(t for c, _ in terms for t in c))
+    monster_union = list(dict.fromkeys(t for _, m in terms for t in m if t and len(t) >= 2))
+
+    monster_rows: dict[str, Any] = {}
+    if monster_union:
+        with metrics.timed("monster_lookup"):
+            monster_rows = {name_key(t): row for t, row in fetch_monsters_bulk(monster_union).items()}
+    with metrics.timed("compendium_lookup"):
+        compendium_rows = {name_key(t): row for t, row in fetch_compendium_bulk(compendium_union).items()}
+
+    turns = []
+    for member, (compendium_terms, monster_terms) in zip(members, terms):
+        monster_terms = [t for t in monster_terms if t and len(t) >= 2]
+        monster_stats = _pick_monster_stats(monster_terms, {t: monster_rows.get(name_key(t)) for t in monster_terms})
+        entries = [compendium_rows[k] for k in dict.fromkeys(map(name_key, compendium_terms)) if compendium_rows.get(k)]
+        entries, first_monster = _compendium_context(entries)
+        turns.append({
+            "stats": _normalize_stats(member.get("stats") or {}),
+            "monster_stats": monster_stats,
+            "compendium_entries": entries,
+            "first_monster": first_monster,
+        })
+    return turns
+
+
+def _call_parallel(members: list[dict[str, Any]], turns: list[dict[str, Any]], use_cache: bool) -> list[dict[str, Any]]:
+    """Each member routed like run_turn; model calls run concurrently (at most PARTY_MAX_PARALLEL at a time)."""
+    def call(member: dict[str, Any], turn: dict[str, Any]) -> dict[str, Any]:
+        tier, result = _route(member["message"], turn)
+        if result is not None:
+            return result
+        return _call_openrouter(
+            _model_message(member["message"], turn), turn["stats"], turn["compendium_entries"],
+            monster_stats=turn["monster_stats"], use_cache=use_cache, history=member.get("history") or "",
+            model=_tier_model(tier),
+        )
 
-    # call OpenRouter with compendium + monster stats (HP/AC in system prompt) + message
-    result = _call_openrouter(message, stats, compendium_entries, monster_stats=monster_stats)
-    narrative = result.get("narrative", "")
-    hp_change = result.get("hp_change", 0)
-    xp_change = result.get("xp_change", 0)
-    gold_change = result.get("gold_change", 0)
-    new_items = result.get("new_items")
-    if not isinstance(new_items, list):
-        new_items = []
+    if len(members) == 1:
+        return [call(members[0], turns[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(members), PARTY_MAX_PARALLEL)),
+                            thread_name_prefix="party-turn") as pool:
+        # Each worker runs in a copy of this context so stage timings reach the request's Server-Timing
+        futures = [pool.submit(contextvars.copy_context().run, call, m, t) for m, t in zip(members, turns)]
+        return [f.result() for f in futures]
+
+
+def _split_scene(parsed: dict[str, Any] | None, player_ids: list[str]) -> list[dict[str, Any]] | None:
+    """Per-player results from a scene completion, in player_ids order; None unless every player is answered."""
+    entries = parsed.get("players") if isinstance(parsed, dict) else None
+    if not isinstance(entries, list):
+        return None
+    entries = [e for e in entries if isinstance(e, dict)]
+    by_id = {str(e.get("player_id")): e for e in entries if e.get("player_id") is not None}
+    out = []
+    for i, player_id in enumerate(player_ids):
+        entry = by_id.get(str(player_id))
+        if entry is None and not by_id and i < len(entries):
+            entry = entries[i]  # no ids in the answer: fall back to order
+        if entry is None:
+            return None
+        out.append(entry)
+    return out
 
-    new_hp = max(0, hp + hp_change)
-    new_xp = max(0, xp + xp_change)
-    new_gold = max(0, gold + gold_change)
-    new_inventory = inventory + new_items
-    new_stats = {
-        "hp": new_hp,
-        "xp": new_xp,
-        "gold": new_gold,
-        "inventory": new_inventory,
-    }
-    if player_id:
-        new_stats["player_id"] = player_id
 
-    # persist updated stats to Snowflake (equivalent of updateCharacterStats tool)
+def _call_scene(members: list[dict[str, Any]], turns: list[dict[str, Any]], use_cache: bool) -> list[dict[str, Any]]:
+    """One model call for the whole party (SCENE_SYSTEM_INSTRUCTION); same caching and fallbacks as _call_openrouter."""
+    if not _get_api_key():
+        return [_fallback_result(NO_API_KEY_NARRATIVE, "no_api_key") for _ in members]
+    player_ids = [str(m.get("player_id")) for m in members]
+    entries = [e for turn in turns for e in turn["compendium_entries"]]
+    monster_stats = next((t["monster_stats"] for t in turns if t["monster_stats"]), None)
+    with metrics.timed("build_prompt"):
+        messages, _ = build_scene_prompt(
+            SCENE_SYSTEM_INSTRUCTION,
+            [(pid, turn["stats"], m["message"]) for pid, m, turn in zip(player_ids, members, turns)],
+            entries,
+            monster_stats,
+        )
+    cache_key, cached = _cache_lookup(messages, use_cache)
+    if cached is not None:
+        results = _split_scene(cached, player_ids)
+        if results is not None:
+            return results
+
+    start = time.perf_counter()
     try:
-        update_player_stats(new_stats)
+        with metrics.timed("llm_call"):
+            text = _request_completion(messages)
     except Exception:
-        pass
+        ERRORS.inc(stage="llm_call")
+        logger.warning("OpenRouter scene call failed for %d players", len(members), exc_info=True)
+        return [_fallback_result(ERROR_NARRATIVE, "llm_error") for _ in members]
+    parsed = _parse_completion(text)
+    results = _split_scene(parsed, player_ids)
+    if results is None:
+        if parsed is not None:
+            ERRORS.inc(stage="parse")
+            logger.warning("scene response did not answer every player (%d expected)", len(members))
+        return [_fallback_result(ERROR_NARRATIVE, "parse_error") for _ in members]
+    if cache_key:
+        completion_cache.get_cache().set(cache_key, parsed, time.perf_counter() - start)
+    return results
+
+
+def run_party_turn(
+    members: list[dict[str, Any]],
+    scene: bool = False,
+    use_cache: bool = True,
+) -> list[dict[str, Any]]:
+    """
+    Resolve one round for a party. members: [{"player_id", "message", "stats", "history"?, "delta"?}]
+    ("delta" as in run_turn).
 
-    out = {"narrative": narrative, "stats": new_stats}
-    if first_monster is not None:
-        out["monster"] = first_monster
+    Compendium context for everyone comes from one query per table. By default each member
+    gets their own model call, all sent concurrently; with scene=True the whole party is one
+    prompt answered per player. All new stats are persisted together (one multi-row MERGE).
+    Returns one run_turn-style response per member, in order.
+    """
+    start = time.perf_counter()
+    turns = _prepare_party(members)
+    if scene:
+        results = _call_scene(members, turns, use_cache)
+    else:
+        results = _call_parallel(members, turns, use_cache)
+    outs = [_turn_response(turn, result, m.get("player_id")) for m, turn, result in zip(members, turns, results)]
+    _persist_stats([_stats_row(out, bool(m.get("delta"))) for m, out in zip(members, outs)])
+    TURN_SECONDS.observe(time.perf_counter() - start, mode="scene" if scene else "party")
+    return outs
+
+
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _snowflake_semaphore() -> asyncio.Semaphore:
+    """Per-event-loop semaphore capping in-flight Snowflake work from run_turn_async."""
+    loop = asyncio.get_running_loop()
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = _semaphores[loop] = asyncio.Semaphore(max(1, SNOWFLAKE_MAX_CONCURRENCY))
+    return sem
+
+
+async def _in_db_thread(fn, *args):
+    """Run a blocking Snowflake call in a worker thread, bounded by the Snowflake semaphore."""
+    async with _snowflake_semaphore():
+        return await asyncio.to_thread(fn, *args)
+
+
+async def _prepare_turn_async(message: str, stats: dict[str, Any]) -> dict[str, Any]:
+    """_prepare_turn with the MONSTERS and COMPENDIUM lookups running concurrently."""
+    stats = _normalize_stats(stats)
+
+    if entity_matcher.get_matcher() is None:
+        # Build it off the event loop; _search_terms then finds it installed (or in its retry backoff)
+        await asyncio.to_thread(load_entity_matcher)
+    with metrics.timed("extract_terms"):
+        compendium_terms, monster_terms = _search_terms(message)
+    monster_stats, (compendium_entries, first_monster) = await asyncio.gather(
+        _in_db_thread(_get_monster_stats_for_message, monster_terms),
+        _in_db_thread(_query_compendium, compendium_terms),
+    )
+    return {
+        "stats": stats,
+        "monster_stats": monster_stats,
+        "compendium_entries": compendium_entries,
+        "first_monster": first_monster,
+    }
+
+
+async def run_turn_async(
+    message: str,
+    stats: dict[str, Any],
+    player_id: str | None = None,
+    use_cache: bool = True,
+    history: str = "",
+    delta: bool = False,
+) -> dict[str, Any]:
+    """
+    asyncio version of run_turn (same arguments and return value). The two compendium lookups
+    run concurrently in worker threads (capped by SNOWFLAKE_MAX_CONCURRENCY) and the model is
+    called with the shared AsyncOpenAI client, so many turns can wait on the LLM without one thread each.
+    """
+    start = time.perf_counter()
+    turn = await _prepare_turn_async(message, stats)
+    tier, result = _route(message, turn)
+    if result is None:
+        result = await _call_openrouter_async(
+            _model_message(message, turn), turn["stats"], turn["compendium_entries"],
+            monster_stats=turn["monster_stats"], use_cache=use_cache, history=history, model=_tier_model(tier),
+        )
+    if PLAYER_STATS_WRITE_BEHIND:
+        out = _apply_result(turn, result, player_id, delta)
+    else:
+        out = await _in_db_thread(_apply_result, turn, result, player_id, delta)
+    elapsed = time.perf_counter() - start
+    TURN_SECONDS.observe(elapsed, mode="async")
+    TIER_SECONDS.observe(elapsed, tier=tier)
     return out
@@ -0,0 +1,164 @@
+"""
+Recognize known compendium/monster names in a player message.
+
+EntityMatcher compiles every name into a token trie (case-folded, with plural
+forms of the last word), then scans a message once, left to right, taking the
+longest known name at each position: "two adult red dragons and a goblin" ->
+Adult Red Dragon (monster), Goblin (monster, compendium). Words that aren't part
+of a known name are never looked up.
+
+The head noun of a multi-word monster name ("dragon", "spider") is also
+recognized on its own, as a monster search term, so "I attack the dragon" still
+finds a dragon's stats; a full name always wins over it.
+
+snowflake_db.warm_compendium_cache() builds the matcher from the rows it loads
+(no extra queries); otherwise snowflake_db.load_entity_matcher() builds it from
+the compendium backend on the first turn. dm_agent only falls back to word-based
+guessing while that build is failing.
+"""
+
+import re
+import threading
+from typing import Any, Iterable, NamedTuple
+
+import metrics
+
+COMPENDIUM = "compendium"
+MONSTER = "monster"
+
+MATCHES = metrics.counter("entity_matches_total", "Known entities recognized in player messages", ["kind"])
+
+_TOKEN = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+_END = ""  # trie key for "a name ends here"; tokens are never empty
+_IRREGULAR = {
+    "mouse": "mice", "goose": "geese", "ox": "oxen", "child": "children",
+    "person": "people", "foot": "feet", "tooth": "teeth", "louse": "lice",
+}
+# Head nouns too generic to stand for a monster on their own
+_GENERIC_HEADS = {"of", "the", "and", "boss", "king", "queen", "lord", "chief", "captain", "swarm", "form"}
+
+
+class EntityMatch(NamedTuple):
+    name: str    # canonical name as stored in the table
+    kind: str    # COMPENDIUM or MONSTER
+    text: str    # the words that matched in the message
+    start: int   # character offsets in the message
+    end: int
+
+
+def _tokens(text: str) -> list[tuple[str, int, int]]:
+    """(case-folded word, start, end); a trailing possessive 's is dropped ("goblin's" -> "goblin")."""
+    out = []
+    for m in _TOKEN.finditer(text):
+        word = m.group(0).casefold()
+        if word.endswith("'s") and len(word) > 2:
+            word = word[:-2]
+        out.append((word, m.start(), m.end()))
+    return out
+
+
+def plurals(word: str) -> set[str]:
+    """Likely plural spellings of an English word (regular rules plus a few irregulars)."""
+    out = {word + "s"}
+    if word.endswith(("s", "x", "z", "ch", "sh")):
+        out.add(word + "es")
+    if len(word) > 1 and word.endswith("y") and word[-2] not in "aeiou":
+        out.add(word[:-1] + "ies")
+    if word.endswith("f"):
+        out.add(word[:-1] + "ves")
+    if word.endswith("fe"):
+        out.add(word[:-2] + "ves")
+    if word.endswith("man"):
+        out.add(word[:-3] + "men")
+    if word in _IRREGULAR:
+        out.add(_IRREGULAR[word])
+    return out
+
+
+class EntityMatcher:
+    """Token trie over known names; find() is one pass over the message with longest-match semantics."""
+
+    def __init__(self):
+        self._root: dict[str, Any] = {}
+        self.names = 0
+
+    @classmethod
+    def from_rows(
+        cls,
+        compendium: Iterable[dict[str, Any]] = (),
+        monsters: Iterable[dict[str, Any]] = (),
+    ) -> "EntityMatcher":
+        """Build from COMPENDIUM and MONSTERS rows (dicts with a "name")."""
+        matcher = cls()
+        for row in compendium:
+            matcher.add(row.get("name"), COMPENDIUM)
+        heads = []
+        for row in monsters:
+            name = row.get("name")
+            matcher.add(name, MONSTER)
+            words = [w for w, _, _ in _tokens(str(name or ""))]
+            if len(words) > 1 and len(words[-1]) > 2 and words[-1] not in _GENERIC_HEADS and words[-1].isalpha():
+                heads.append(words[-1])
+        for head in heads:
+            # Aliases never replace a real name on the same words
+            matcher.add(head, MONSTER, alias=True)
+        return matcher
+
+    def add(self, name: Any, kind: str, alias: bool = False) -> None:
+        """Register name (and its plural forms) as an entity of the given kind."""
+        words = [w for w, _, _ in _tokens(str(name or ""))]
+        if not words:
+            return
+        canonical = str(name).strip()
+        for last in {words[-1]} | plurals(words[-1]):
+            node = self._root
+            for word in words[:-1] + [last]:
+                node = node.setdefault(word, {})
+            entries = node.setdefault(_END, {})
+            # kind -> (canonical name, is_alias); a real name beats an alias, the first real name wins
+            current = entries.get(kind)
+            if current is None or (current[1] and not alias):
+                entries[kind] = (canonical, alias)
+        if not alias:
+            self.names += 1
+
+    def find(self, message: str) -> list[EntityMatch]:
+        """Known entities in message order. Overlapping names resolve to the longest one starting first."""
+        tokens = _tokens(message or "")
+        out = []
+        i = 0
+        while i < len(tokens):
+            node = self._root
+            best_end, best = 0, None
+            j = i
+            while j < len(tokens) and tokens[j][0] in node:
+                node = node[tokens[j][0]]
+                j += 1
+                if _END in node:
+                    best_end, best = j, node[_END]
+            if best is None:
+                i += 1
+                continue
+            start, end = tokens[i][1], tokens[best_end - 1][2]
+            for kind, (name, _) in best.items():
+                out.append(EntityMatch(name, kind, message[start:end], start, end))
+                MATCHES.inc(kind=kind)
+            i = best_end
+        return out
+
+
+_matcher: EntityMatcher | None = None
+_lock = threading.Lock()
+
+metrics.gauge("entity_matcher_names", "Names compiled into the entity matcher", lambda: _matcher.names if _matcher else 0)
+
+
+def get_matcher() -> EntityMatcher | None:
+    """The installed matcher, or None if it hasn't been built yet."""
+    return _matcher
+
+
+def set_matcher(matcher: EntityMatcher | None) -> None:
+    global _matcher
+    with _lock:
+        _matcher = matcher
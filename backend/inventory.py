@@ -0,0 +1,107 @@
+"""
+Inventories as counted multisets.
+
+An inventory is {item name: count}, in the order items were first gained, so picking up
+more rations bumps a count instead of appending another "Rations" string. Names match
+case-insensitively; the first spelling seen is kept.
+
+Clients, the model and the character sheet still speak in strings: counts(), add() and
+the other helpers accept lists like ["Longsword", "Rations (5)", "Arrows x20", "2x Torch"]
+(or a {name: count} dict), and render() turns an inventory back into that list form.
+"""
+
+import re
+from typing import Any, Iterable
+
+MAX_COUNT = 9999
+
+_COUNTED = re.compile(
+    r"(?P<name>.+?)\s*(?:\((?P<paren>\d+)\)|[x×]\s*(?P<suffix>\d+))"
+    r"|(?P<prefix>\d+)\s*[x×]\s+(?P<name2>.+)",
+    re.I,
+)
+
+
+def parse_item(text: Any) -> tuple[str, int] | None:
+    """'Rations (5)' / 'Rations x5' / '5x Rations' -> ('Rations', 5); 'Torch' -> ('Torch', 1); blank -> None."""
+    text = " ".join(str(text or "").split())
+    if not text:
+        return None
+    m = _COUNTED.fullmatch(text)
+    if m:
+        name = m.group("name") or m.group("name2")
+        count = int(m.group("paren") or m.group("suffix") or m.group("prefix"))
+        return name.strip(), count
+    return text, 1
+
+
+def _key(inventory: dict[str, int], name: str) -> str:
+    """The spelling already used for name in inventory, or name itself."""
+    folded = name.casefold()
+    return next((k for k in inventory if k.casefold() == folded), name)
+
+
+def _entries(items: Any) -> Iterable[tuple[str, int]]:
+    if not items:
+        return
+    if isinstance(items, dict):
+        for name, count in items.items():
+            try:
+                count = int(count)
+            except (TypeError, ValueError):
+                count = 1
+            if str(name).strip():
+                yield str(name).strip(), count
+        return
+    if isinstance(items, (str, bytes)):
+        items = [items]
+    for item in items:
+        if isinstance(item, dict) and item.get("name"):
+            # {"name": ..., "count"/"qty": n}
+            yield from _entries({item["name"]: item.get("count", item.get("qty", 1))})
+            continue
+        parsed = parse_item(item)
+        if parsed:
+            yield parsed
+
+
+def add(inventory: dict[str, int], items: Any) -> dict[str, int]:
+    """A new inventory with items (list of strings or {name: count}) added; negative counts remove."""
+    out = dict(inventory)
+    for name, count in _entries(items):
+        key = _key(out, name)
+        total = min(MAX_COUNT, out.get(key, 0) + count)
+        if total > 0:
+            out[key] = total
+        else:
+            out.pop(key, None)
+    return out
+
+
+def counts(items: Any) -> dict[str, int]:
+    """Inventory from a list of item strings (duplicates merged), a {name: count} dict, or None."""
+    return add({}, items)
+
+
+def render(inventory: dict[str, int]) -> list[str]:
+    """['Longsword', 'Rations (5)']: the list form used by the character sheet and the prompt."""
+    return [name if count == 1 else f"{name} ({count})" for name, count in inventory.items()]
+
+
+def changes(old: dict[str, int], new: dict[str, int]) -> dict[str, int]:
+    """Items whose count differs, as {name: new count}; 0 means the item is gone."""
+    out = {name: count for name, count in new.items() if old.get(name) != count}
+    out.update({name: 0 for name in old if name not in new})
+    return out
+
+
+def apply(inventory: dict[str, int], changed: dict[str, int]) -> dict[str, int]:
+    """inventory with changes() output applied: each named item set to its new count (0 removes)."""
+    out = dict(inventory)
+    for name, count in changed.items():
+        key = _key(out, name)
+        if count > 0:
+            out[key] = min(MAX_COUNT, int(count))
+        else:
+            out.pop(key, None)
+    return out
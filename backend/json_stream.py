@@ -0,0 +1,110 @@
+"""
+Incremental extraction of one string field from a JSON object that arrives in chunks.
+
+The DM model answers with {"narrative": "...", "hp_change": ..., ...}. While the
+completion streams in, StringFieldStreamer pulls the decoded narrative text out
+token by token so it can be forwarded to the browser before the JSON is complete.
+The full text is still parsed with json.loads once the stream ends.
+"""
+
+import re
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class StringFieldStreamer:
+    """
+    Feed raw completion chunks; get back newly decoded characters of `field`'s string value.
+
+    Handles escapes (including \\uXXXX and surrogate pairs) split across chunks. Text before
+    the field (code fences, other keys) is ignored; once the closing quote is seen, done is
+    True and later chunks yield nothing.
+    """
+
+    def __init__(self, field: str = "narrative"):
+        self._key_re = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buf = ""  # undecoded input
+        self._started = False
+        self._pending_high: str | None = None  # high surrogate waiting for its pair
+        self.done = False
+        self.value = ""  # everything decoded so far
+
+    def feed(self, chunk: str) -> str:
+        if self.done or not chunk:
+            return ""
+        self._buf += chunk
+        if not self._started:
+            m = self._key_re.search(self._buf)
+            if not m:
+                # Keep only a tail long enough to hold a split key
+                self._buf = self._buf[-(len(self._key_re.pattern) + 16):]
+                return ""
+            self._started = True
+            self._buf = self._buf[m.end():]
+        out = self._decode()
+        self.value += out
+        return out
+
+    def _decode(self) -> str:
+        out = []
+        buf = self._buf
+        i = 0
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                # Copy a run of plain characters at once
+                j = i + 1
+                while j < n and buf[j] not in '"\\':
+                    j += 1
+                out.append(self._flush_surrogate() + buf[i:j])
+                i = j
+                continue
+            if i + 1 >= n:
+                break  # escape split across chunks
+            esc = buf[i + 1]
+            if esc == "u":
+                if i + 6 > n:
+                    break
+                try:
+                    code = int(buf[i + 2:i + 6], 16)
+                except ValueError:
+                    code = 0xFFFD
+                i += 6
+                if 0xD800 <= code <= 0xDBFF:
+                    out.append(self._flush_surrogate())
+                    self._pending_high = chr(code)
+                    continue
+                if 0xDC00 <= code <= 0xDFFF and self._pending_high is not None:
+                    high = ord(self._pending_high)
+                    self._pending_high = None
+                    out.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))
+                    continue
+                out.append(self._flush_surrogate() + chr(code))
+                continue
+            out.append(self._flush_surrogate() + _SIMPLE_ESCAPES.get(esc, esc))
+            i += 2
+        self._buf = buf[i:]
+        if self.done:
+            out.append(self._flush_surrogate())
+            self._buf = ""
+        return "".join(out)
+
+    def _flush_surrogate(self) -> str:
+        if self._pending_high is None:
+            return ""
+        self._pending_high = None
+        return "�"
@@ -0,0 +1,394 @@
+"""
+Shared OpenRouter (OpenAI-compatible) clients for dm_agent.
+
+One long-lived OpenAI / AsyncOpenAI client keeps its HTTP connection pool and TLS
+sessions across turns. Calls get connect/read timeouts and jittered retries on
+429/5xx/connection errors, and can optionally be hedged: if the first request
+hasn't answered by the hedge threshold (fixed, or the observed p95 latency), a
+second identical request is sent and whichever finishes first wins.
+
+The OpenAI SDK (and httpx) are imported when the first client is built, not with this
+module; prime() does that ahead of the first turn and opens the pooled connection.
+
+Env vars:
+  OPENROUTER_BASE_URL          API base URL (default https://openrouter.ai/api/v1; point at a local fake to test)
+  OPENROUTER_CONNECT_TIMEOUT   seconds to establish a connection (default 5)
+  OPENROUTER_READ_TIMEOUT      seconds to wait for response data (default 90)
+  OPENROUTER_MAX_RETRIES       retries after the first attempt (default 2)
+  OPENROUTER_RETRY_BASE_DELAY  base for exponential backoff with full jitter (default 0.5)
+  OPENROUTER_RETRY_MAX_DELAY   cap for a single backoff sleep (default 8)
+  OPENROUTER_POOL_MAX_CONNECTIONS / OPENROUTER_POOL_MAX_KEEPALIVE  HTTP pool size (default 100 / 20)
+  OPENROUTER_HEDGE             1 to enable hedged requests (default 0)
+  OPENROUTER_HEDGE_AFTER       fixed hedge threshold in seconds; 0 = use observed p95 (default 0)
+  OPENROUTER_HEDGE_MIN_SAMPLES latencies needed before the p95 threshold is trusted (default 20)
+  OPENROUTER_HEDGE_MAX_INFLIGHT most hedge requests outstanding at once; past that, calls wait on
+                               their first request instead of hedging (default 32)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import TYPE_CHECKING, Any, Callable
+
+import metrics
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+RETRY_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def base_url() -> str:
+    return os.environ.get("OPENROUTER_BASE_URL") or DEFAULT_BASE_URL
+
+
+def api_key() -> str:
+    return os.environ.get("OPENROUTER_API_KEY") or os.environ.get("API_KEY", "")
+
+
+def _timeout() -> "httpx.Timeout":
+    import httpx
+
+    read = _env_float("OPENROUTER_READ_TIMEOUT", 90)
+    return httpx.Timeout(read, connect=_env_float("OPENROUTER_CONNECT_TIMEOUT", 5), pool=read)
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=int(_env_float("OPENROUTER_POOL_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(_env_float("OPENROUTER_POOL_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=60,
+    )
+
+
+class _LatencyTracker:
+    """Rolling window of successful call latencies (seconds) for the p95 hedge threshold."""
+
+    def __init__(self, size: int = 256):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[idx]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+_latency = _LatencyTracker()
+_lock = threading.Lock()
+_client: "tuple[tuple, OpenAI, httpx.Client] | None" = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[tuple, AsyncOpenAI, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_hedge_slots: threading.BoundedSemaphore | None = None
+_counters = {
+    "calls": 0,
+    "attempts": 0,
+    "retries": 0,
+    "errors": 0,
+    "hedges": 0,
+    "hedge_wins": 0,
+    "hedges_skipped": 0,
+}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+def _client_key() -> tuple:
+    return (base_url(), api_key())
+
+
+def _sync_entry() -> "tuple[tuple, OpenAI, httpx.Client]":
+    global _client
+    key = _client_key()
+    with _lock:
+        if _client is None or _client[0] != key:
+            import httpx
+            from openai import OpenAI
+
+            http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+            # Retries are done here (with jitter and hedging), not inside the SDK
+            client = OpenAI(base_url=key[0], api_key=key[1], max_retries=0, http_client=http_client)
+            _client = (key, client, http_client)
+        return _client
+
+
+def _async_entry() -> "tuple[tuple, AsyncOpenAI, httpx.AsyncClient]":
+    loop = asyncio.get_running_loop()
+    key = _client_key()
+    with _lock:
+        entry = _async_clients.get(loop)
+        if entry is None or entry[0] != key:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+            client = AsyncOpenAI(base_url=key[0], api_key=key[1], max_retries=0, http_client=http_client)
+            entry = (key, client, http_client)
+            _async_clients[loop] = entry
+        return entry
+
+
+def get_client() -> "OpenAI":
+    """Process-wide OpenAI client (rebuilt only if the base URL or API key changes)."""
+    return _sync_entry()[1]
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """AsyncOpenAI client for the running event loop (httpx async pools can't be shared across loops)."""
+    return _async_entry()[1]
+
+
+def _models_url() -> str:
+    return base_url().rstrip("/") + "/models"
+
+
+def prime() -> None:
+    """
+    Build the shared client and open a pooled connection (TCP + TLS) to the API with a HEAD
+    request, so the first turn doesn't pay for either. Any HTTP status counts; network errors raise.
+    """
+    _sync_entry()[2].head(_models_url()).close()
+
+
+async def aprime() -> None:
+    """prime() for the running event loop's AsyncOpenAI client."""
+    response = await _async_entry()[2].head(_models_url())
+    await response.aclose()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRY_STATUS_CODES
+    return False
+
+
+def _backoff(attempt: int, exc: BaseException) -> float:
+    """Full-jitter exponential backoff, honouring a short Retry-After from the server."""
+    cap = _env_float("OPENROUTER_RETRY_MAX_DELAY", 8)
+    delay = random.uniform(0, min(cap, _env_float("OPENROUTER_RETRY_BASE_DELAY", 0.5) * (2 ** attempt)))
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(cap, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
+
+
+def _hedge_after() -> float | None:
+    """Seconds to wait before sending a hedge request, or None if hedging is off / not calibrated."""
+    if not _env_flag("OPENROUTER_HEDGE"):
+        return None
+    fixed = _env_float("OPENROUTER_HEDGE_AFTER", 0)
+    if fixed > 0:
+        return fixed
+    if len(_latency) < int(_env_float("OPENROUTER_HEDGE_MIN_SAMPLES", 20)):
+        return None
+    return _latency.percentile(0.95)
+
+
+def _take_hedge_slot() -> bool:
+    """Reserve one of OPENROUTER_HEDGE_MAX_INFLIGHT hedge slots without waiting; False (and counted) if all are taken."""
+    global _hedge_slots
+    with _lock:
+        if _hedge_slots is None:
+            _hedge_slots = threading.BoundedSemaphore(max(1, int(_env_float("OPENROUTER_HEDGE_MAX_INFLIGHT", 32))))
+        slots = _hedge_slots
+    if slots.acquire(blocking=False):
+        return True
+    _count("hedges_skipped")
+    return False
+
+
+def _release_hedge_slot() -> None:
+    _hedge_slots.release()
+
+
+def _in_thread(fn: Callable[[], Any], name: str, done: Callable[[], None] | None = None) -> Future:
+    """Run fn on a thread of its own (nothing to queue behind); done() runs when it finishes."""
+    fut: Future = Future()
+    fut.set_running_or_notify_cancel()
+
+    def run() -> None:
+        try:
+            fut.set_result(fn())
+        except BaseException as exc:
+            fut.set_exception(exc)
+        finally:
+            if done is not None:
+                done()
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return fut
+
+
+def _timed(fn: Callable[[], Any], record: bool = True) -> Any:
+    _count("attempts")
+    start = time.perf_counter()
+    out = fn()
+    if record:
+        _latency.add(time.perf_counter() - start)
+    return out
+
+
+def _hedged(fn: Callable[[], Any]) -> Any:
+    hedge_after = _hedge_after()
+    if hedge_after is None:
+        return _timed(fn)
+    # The first request gets its own thread so the hedge clock starts when it is sent
+    first = _in_thread(lambda: _timed(fn), "llm-call")
+    done, _ = wait([first], timeout=hedge_after)
+    if done or not _take_hedge_slot():
+        return first.result()
+    _count("hedges")
+    second = _in_thread(lambda: _timed(fn), "llm-hedge", _release_hedge_slot)
+    pending = {first, second}
+    error: BaseException | None = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                # The slower request keeps running in its thread; its result is dropped
+                if fut is second:
+                    _count("hedge_wins")
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+def chat_completion(**kwargs: Any) -> Any:
+    """client.chat.completions.create(**kwargs) with timeouts, jittered retries and optional hedging."""
+    client = get_client()
+    _count("calls")
+    hedge = not kwargs.get("stream")
+    max_retries = int(_env_float("OPENROUTER_MAX_RETRIES", 2))
+    attempt = 0
+    while True:
+        try:
+            call = lambda: client.chat.completions.create(**kwargs)  # noqa: E731
+            # Streams return after the headers; their latency isn't comparable, so don't record it
+            return _hedged(call) if hedge else _timed(call, record=False)
+        except Exception as exc:
+            if attempt >= max_retries or not _is_retryable(exc):
+                _count("errors")
+                raise
+            time.sleep(_backoff(attempt, exc))
+            attempt += 1
+            _count("retries")
+
+
+async def _atimed(coro_fn: Callable[[], Any], record: bool = True) -> Any:
+    _count("attempts")
+    start = time.perf_counter()
+    out = await coro_fn()
+    if record:
+        _latency.add(time.perf_counter() - start)
+    return out
+
+
+async def _ahedged(coro_fn: Callable[[], Any]) -> Any:
+    hedge_after = _hedge_after()
+    if hedge_after is None:
+        return await _atimed(coro_fn)
+    first = asyncio.ensure_future(_atimed(coro_fn))
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done or not _take_hedge_slot():
+        return await first
+    _count("hedges")
+    second = asyncio.ensure_future(_atimed(coro_fn))
+    second.add_done_callback(lambda _task: _release_hedge_slot())
+    pending = {first, second}
+    error: BaseException | None = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def achat_completion(**kwargs: Any) -> Any:
+    """Async chat_completion: same timeouts, retries and hedging, on the shared AsyncOpenAI client."""
+    client = get_async_client()
+    _count("calls")
+    max_retries = int(_env_float("OPENROUTER_MAX_RETRIES", 2))
+    attempt = 0
+    while True:
+        try:
+            call = lambda: client.chat.completions.create(**kwargs)  # noqa: E731
+            if kwargs.get("stream"):
+                return await _atimed(call, record=False)
+            return await _ahedged(call)
+        except Exception as exc:
+            if attempt >= max_retries or not _is_retryable(exc):
+                _count("errors")
+                raise
+            await asyncio.sleep(_backoff(attempt, exc))
+            attempt += 1
+            _count("retries")
+
+
+def stats() -> dict[str, Any]:
+    """Call/retry/hedge counters plus observed p50/p95 latency (seconds)."""
+    with _lock:
+        out = dict(_counters)
+    out["latency_p50"] = _latency.percentile(0.50)
+    out["latency_p95"] = _latency.percentile(0.95)
+    out["hedge_after"] = _hedge_after()
+    return out
+
+
+def _events() -> dict[tuple[str], int]:
+    with _lock:
+        return {(name,): value for name, value in _counters.items()}
+
+
+metrics.gauge("llm_client_events_total", "OpenRouter calls, attempts, retries, errors and hedges", _events, ["event"],
+              kind="counter")
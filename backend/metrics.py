@@ -0,0 +1,256 @@
+"""
+In-process metrics for the DM backend, rendered in Prometheus text format.
+
+Counters and histograms are registered once at import time by the modules that
+update them and can carry labels, e.g.
+
+    TURN_ERRORS = metrics.counter("dm_errors_total", "Errors swallowed by run_turn", ["stage"])
+    TURN_ERRORS.inc(stage="llm_call")
+
+    with metrics.timed("llm_call"):      # dm_stage_seconds{stage="llm_call"}
+        ...
+
+timed() also records the duration in the current request's timing list (if one
+was started with start_request()), which app.py turns into a Server-Timing header
+when METRICS_SERVER_TIMING=1. GET /api/metrics serves render().
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: list[str] | tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: expected labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: list[str] | tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_str(self.labels, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: list[str] | tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {_fmt(round(total, 6))}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Value read from a callback at render time: fn() -> number, or {label values tuple: number}.
+    kind="counter" exposes a cumulative count kept elsewhere (e.g. a module's stats() dict).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        fn: Callable[[], Any],
+        labels: list[str] | tuple[str, ...] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, help_text, labels)
+        self._fn = fn
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        try:
+            value = self._fn()
+        except Exception:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        lines = self.header()
+        for key, v in sorted(items):
+            if v is not None:
+                lines.append(f"{self.name}{_label_str(self.labels, tuple(key))} {_fmt(v)}")
+        return lines
+
+
+_registry: dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric: _Metric) -> Any:
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            # Re-imports (e.g. module reloads) get the already-registered metric
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, help_text: str, labels: list[str] | tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, help_text, labels))
+
+
+def histogram(
+    name: str,
+    help_text: str,
+    labels: list[str] | tuple[str, ...] = (),
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def gauge(
+    name: str,
+    help_text: str,
+    fn: Callable[[], Any],
+    labels: list[str] | tuple[str, ...] = (),
+    kind: str = "gauge",
+) -> Gauge:
+    return _register(Gauge(name, help_text, fn, labels, kind))
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines: list[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = histogram("dm_stage_seconds", "Time spent per turn stage", ["stage"])
+
+# Per-request (stage, seconds) list for Server-Timing; None outside a request
+_request_timings: contextvars.ContextVar[list[tuple[str, float]] | None] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Observe a stage duration (dm_stage_seconds) and add it to the current request's timings."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the block as `stage` (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def start_request() -> contextvars.Token:
+    """Start collecting stage timings for the current request (thread / task)."""
+    return _request_timings.set([])
+
+
+def end_request(token: contextvars.Token) -> list[tuple[str, float]]:
+    """Stop collecting and return the request's (stage, seconds) list."""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing(timings: list[tuple[str, float]], total: float | None = None) -> str:
+    """Server-Timing header value; repeated stages are summed, durations in milliseconds."""
+    merged: dict[str, float] = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,278 @@
+"""
+Token-budgeted prompt assembly for DM turns.
+
+Layout is cache-friendly: the system message is byte-for-byte the same on every
+turn (so provider-side prefix caching can reuse it), and everything that changes
+per turn goes in the user message, ordered compendium -> encounter -> history
+-> player state -> player message. History (conversation_memory.py) arrives
+already capped at its own token budget. Compendium rows are serialized compactly (only the
+fields the DM needs, deduplicated by name, long text truncated) and dropped
+lowest-priority first when the estimated size passes the budget.
+
+Env vars:
+  PROMPT_TOKEN_BUDGET        estimated input tokens per turn (default 3000)
+  PROMPT_DESCRIPTION_CHARS   max characters of description kept per entry (default 240)
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+import inventory
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+MAX_INVENTORY_CHARS = 600
+RESPONSE_REMINDER = (
+    "Respond with ONLY the JSON object (narrative, hp_change, xp_change, gold_change, new_items). No markdown."
+)
+SCENE_REMINDER = (
+    'Respond with ONLY a JSON object {"players": [...]} holding one object per party member, in the order '
+    "given, each with player_id, narrative, hp_change, xp_change, gold_change, new_items. No markdown."
+)
+ENCOUNTER_RULE = "You MUST use these exact stats for the encounter. Do not hallucinate different HP or AC values."
+SECTIONS = ("system", "compendium", "encounter", "history", "state", "message")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token); good enough for budgeting."""
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = " ".join(str(text or "").split())
+    if len(text) <= max_chars:
+        return text
+    return text[: max(0, max_chars - 1)].rstrip() + "…"
+
+
+def _ability_names(abilities: Any) -> list[str]:
+    """Names from a MONSTERS special_abilities VARIANT (list of {name, desc} or its JSON text)."""
+    if isinstance(abilities, str):
+        try:
+            abilities = json.loads(abilities)
+        except ValueError:
+            return []
+    if not isinstance(abilities, list):
+        return []
+    return [str(a.get("name")) for a in abilities if isinstance(a, dict) and a.get("name")]
+
+
+def compact_entry(entry: dict[str, Any], description_chars: int) -> str:
+    """One compendium row as a short single line, e.g. `Goblin (monster) HP 7 AC 15: small, cunning...`."""
+    head = str(entry.get("name") or "Unknown")
+    if entry.get("type"):
+        head += f" ({entry['type']})"
+    if entry.get("hp") is not None:
+        head += f" HP {entry['hp']}"
+    if entry.get("ac") is not None:
+        head += f" AC {entry['ac']}"
+    abilities = _ability_names(entry.get("abilities"))
+    if abilities:
+        head += " | abilities: " + ", ".join(abilities[:6])
+    description = entry.get("description")
+    if description and description_chars > 0:
+        head += ": " + _truncate(description, description_chars)
+    return head
+
+
+_totals_lock = threading.Lock()
+_totals: dict[str, Any] = {"prompts": 0, "dropped_entries": 0, "over_budget": 0, "tokens": dict.fromkeys(SECTIONS, 0)}
+_last_report: dict[str, Any] | None = None
+
+
+def _state_fields(stats: dict[str, Any], report: dict[str, Any]) -> str:
+    """`HP=.., XP=.., Gold=.., Inventory=[..]` for one character (long inventories are shortened)."""
+    hp = stats.get("hp", 100)
+    xp = stats.get("xp", 0)
+    gold = stats.get("gold", 0)
+    inv = inventory.render(inventory.counts(stats.get("inventory")))
+    inv_str = ", ".join(str(i) for i in inv) if inv else "none"
+    if len(inv_str) > MAX_INVENTORY_CHARS:
+        shown = _truncate(inv_str, MAX_INVENTORY_CHARS).rsplit(",", 1)[0]
+        inv_str = f"{shown}, ... +{len(inv) - shown.count(',') - 1} more"
+        report["truncated"] = True
+    return f"HP={hp}, XP={xp}, Gold={gold}, Inventory=[{inv_str}]"
+
+
+def _encounter_section(monster_stats: dict[str, Any] | None) -> str:
+    if not monster_stats:
+        return ""
+    parts = [f"ENCOUNTER MONSTER: {monster_stats.get('name', 'Unknown')}."]
+    if monster_stats.get("hp") is not None:
+        parts.append(f"HP = {monster_stats['hp']}.")
+    if monster_stats.get("ac") is not None:
+        parts.append(f"AC = {monster_stats['ac']}.")
+    return " ".join(parts) + " " + ENCOUNTER_RULE
+
+
+def _compendium_section(
+    compendium_entries: list[dict[str, Any]], remaining: int, description_chars: int, report: dict[str, Any]
+) -> str:
+    """Compendium rows within `remaining` tokens: full lines, then stats-only lines, then dropped."""
+    remaining -= estimate_tokens("COMPENDIUM DATA (from Snowflake):\n")
+    lines = []
+    seen = set()
+    for entry in compendium_entries:
+        name_key = str(entry.get("name") or "").strip().upper()
+        if name_key in seen:
+            continue
+        seen.add(name_key)
+        line = compact_entry(entry, description_chars)
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            line = compact_entry(entry, 0)
+            cost = estimate_tokens(line) + 1
+            report["truncated"] = True
+        if cost > remaining:
+            report["dropped_entries"] += 1
+            continue
+        lines.append(line)
+        remaining -= cost
+    return "COMPENDIUM DATA (from Snowflake):\n" + ("\n".join(lines) if lines else "No compendium data for this turn.")
+
+
+def _finish(
+    system_content: str, sections: list[str], report: dict[str, Any]
+) -> tuple[list[dict[str, str]], dict[str, Any]]:
+    report["total"] = sum(report[k] for k in SECTIONS)
+    messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": "\n\n".join(s for s in sections if s)},
+    ]
+    _record(report)
+    return messages, report
+
+
+def _settings(budget: int | None) -> tuple[int, int]:
+    if budget is None:
+        budget = int(os.environ.get("PROMPT_TOKEN_BUDGET", "3000"))
+    return budget, int(os.environ.get("PROMPT_DESCRIPTION_CHARS", "240"))
+
+
+def build_prompt(
+    system_instruction: str,
+    message: str,
+    stats: dict[str, Any],
+    compendium_entries: list[dict[str, Any]],
+    monster_stats: dict[str, Any] | None = None,
+    budget: int | None = None,
+    history: str = "",
+) -> tuple[list[dict[str, str]], dict[str, Any]]:
+    """
+    Build the chat messages for one turn within a token budget.
+
+    The system message is system_instruction + RESPONSE_REMINDER and never changes between
+    turns. Player state and message are always included (very long messages are truncated to
+    half the budget); the encounter monster and conversation history (pre-capped by the
+    caller) are next; compendium rows fill what is left, first
+    with truncated descriptions, then as stats-only lines, then dropped.
+    Returns (messages, report) where report has estimated tokens per section.
+    """
+    budget, description_chars = _settings(budget)
+
+    system_content = system_instruction.rstrip() + "\n\n" + RESPONSE_REMINDER
+    report: dict[str, Any] = {"budget": budget, "dropped_entries": 0, "truncated": False}
+    report["system"] = estimate_tokens(system_content)
+
+    state = "CURRENT PLAYER STATE: " + _state_fields(stats, report)
+    max_message_chars = max(200, budget * CHARS_PER_TOKEN // 2)
+    if len(message) > max_message_chars:
+        message = message[:max_message_chars]
+        report["truncated"] = True
+    message_section = f"PLAYER MESSAGE: {message}"
+    report["state"] = estimate_tokens(state)
+    report["message"] = estimate_tokens(message_section)
+
+    encounter = _encounter_section(monster_stats)
+    report["encounter"] = estimate_tokens(encounter)
+    history = (history or "").strip()
+    report["history"] = estimate_tokens(history)
+
+    used = sum(report[k] for k in ("system", "state", "message", "encounter", "history"))
+    compendium = _compendium_section(compendium_entries, budget - used, description_chars, report)
+    report["compendium"] = estimate_tokens(compendium)
+
+    return _finish(system_content, [compendium, encounter, history, state, message_section], report)
+
+
+def build_scene_prompt(
+    system_instruction: str,
+    players: list[tuple[str, dict[str, Any], str]],
+    compendium_entries: list[dict[str, Any]],
+    monster_stats: dict[str, Any] | None = None,
+    budget: int | None = None,
+) -> tuple[list[dict[str, str]], dict[str, Any]]:
+    """
+    One prompt for a whole party's round: players is [(player_id, stats, message)], answered
+    with one JSON object per player (see SCENE_REMINDER). Same layout and budget rules as
+    build_prompt; the message allowance is shared between the players.
+    """
+    budget, description_chars = _settings(budget)
+
+    system_content = system_instruction.rstrip() + "\n\n" + SCENE_REMINDER
+    report: dict[str, Any] = {"budget": budget, "dropped_entries": 0, "truncated": False, "history": 0}
+    report["system"] = estimate_tokens(system_content)
+
+    max_message_chars = max(100, budget * CHARS_PER_TOKEN // 2 // max(1, len(players)))
+    state_lines, action_lines = [], []
+    for player_id, stats, message in players:
+        state_lines.append(f"- {player_id}: " + _state_fields(stats, report))
+        if len(message) > max_message_chars:
+            message = message[:max_message_chars]
+            report["truncated"] = True
+        action_lines.append(f"- {player_id}: {message}")
+    state = "PARTY STATE:\n" + "\n".join(state_lines)
+    message_section = "PARTY ACTIONS (resolve them together as one scene):\n" + "\n".join(action_lines)
+    report["state"] = estimate_tokens(state)
+    report["message"] = estimate_tokens(message_section)
+
+    encounter = _encounter_section(monster_stats)
+    report["encounter"] = estimate_tokens(encounter)
+
+    used = sum(report[k] for k in ("system", "state", "message", "encounter"))
+    compendium = _compendium_section(compendium_entries, budget - used, description_chars, report)
+    report["compendium"] = estimate_tokens(compendium)
+
+    return _finish(system_content, [compendium, encounter, state, message_section], report)
+
+
+def _record(report: dict[str, Any]) -> None:
+    global _last_report
+    with _totals_lock:
+        _totals["prompts"] += 1
+        _totals["dropped_entries"] += report["dropped_entries"]
+        if report["total"] > report["budget"]:
+            _totals["over_budget"] += 1
+        for section in SECTIONS:
+            _totals["tokens"][section] += report[section]
+        _last_report = report
+    logger.debug("prompt tokens: %s", report)
+
+
+def stats() -> dict[str, Any]:
+    """Cumulative estimated tokens per section, plus the most recent prompt's report."""
+    with _totals_lock:
+        out = {k: (dict(v) if isinstance(v, dict) else v) for k, v in _totals.items()}
+        out["last"] = dict(_last_report) if _last_report else None
+    return out
+
+
+def _tokens_gauge() -> dict[tuple[str], int]:
+    with _totals_lock:
+        return {(section,): n for section, n in _totals["tokens"].items()}
+
+
+def _events_gauge() -> dict[tuple[str], int]:
+    with _totals_lock:
+        return {(event,): _totals[event] for event in ("prompts", "dropped_entries", "over_budget")}
+
+
+metrics.gauge("prompt_tokens_estimated_total", "Estimated prompt tokens by section", _tokens_gauge, ["section"],
+              kind="counter")
+metrics.gauge("prompt_events_total", "Prompts built, compendium entries dropped and prompts over budget",
+              _events_gauge, ["event"], kind="counter")
@@ -0,0 +1,196 @@
+"""
+Local 5e rules for purely mechanical actions, answered without a model call.
+
+resolve(message, stats) recognizes a small set of exact phrasings and returns a
+DM result (same shape as the model's JSON) or None:
+  - inventory checks      "check my inventory", "what's in my pack"
+  - stat queries          "how much gold do I have", "what's my hp", "show my stats"
+  - dice rolls            "roll a d20", "roll 2d6+3"
+Anything else (several clauses, talking, spells, attacks) returns None and goes to a model.
+
+attack_roll(message, stats, monster_stats) only rolls a single attack ("I attack the
+goblin" when MONSTERS has the goblin's AC): d20 + ATTACK_BONUS vs AC and weapon damage
+from the inventory (natural 20 doubles the dice). The model still narrates the outcome,
+since it follows the encounter across turns (the monster's remaining HP, XP for the kill,
+the monster's response).
+
+Env vars:
+  RULES_SEED  seed the dice (for reproducible tests); unset = random
+"""
+
+import os
+import random
+import re
+from typing import Any
+
+import inventory
+import metrics
+
+RESOLVED = metrics.counter("rules_resolved_total", "Actions resolved by the local rules engine", ["kind"])
+
+# Level-1 fighter defaults (STR 16: +3, proficiency +2); the request stats carry no ability scores
+ATTACK_BONUS = 5
+DAMAGE_BONUS = 3
+UNARMED_DAMAGE = "1"
+WEAPON_DAMAGE = {
+    "greatsword": "2d6", "greataxe": "1d12", "maul": "2d6", "longsword": "1d8", "battleaxe": "1d8",
+    "warhammer": "1d8", "rapier": "1d8", "longbow": "1d8", "morningstar": "1d8", "flail": "1d8",
+    "shortsword": "1d6", "scimitar": "1d6", "mace": "1d6", "handaxe": "1d6", "spear": "1d6",
+    "quarterstaff": "1d6", "shortbow": "1d6", "dagger": "1d4", "club": "1d4", "sling": "1d4",
+}
+
+_DICE = re.compile(r"^(\d*)d(\d+)\s*(?:([+-])\s*(\d+))?$")
+_INVENTORY = re.compile(
+    r"(?:i )?(?:check|look (?:at|in|through)|show|open|list|search|what'?s in|what is in) "
+    r"(?:my |the )?(?:inventory|bag|backpack|pack|items|gear)"
+    r"|(?:my )?inventory|what (?:do i have|am i carrying)"
+)
+_STAT = re.compile(
+    r"(?:how much|how many) (hp|health|hit points|gold|xp|experience)(?: do i have| have i got)?"
+    r"|(?:what'?s|what is|check|show) my (hp|health|hit points|gold|xp|experience|stats)"
+    r"|(?:my )?stats"
+)
+_ROLL = re.compile(r"(?:i )?roll (?:a |an )?(\d*d\d+(?:\s*[+-]\s*\d+)?)")
+_ATTACK = re.compile(
+    r"(?:i )?(?:attack|hit|strike|stab|slash|swing at|shoot|fire at) (?:the |a |an |that )?([a-z' -]+?)"
+    r"(?: with (?:my )?([a-z ]+))?"
+)
+_STAT_NAMES = {
+    "hp": "hp", "health": "hp", "hit points": "hp",
+    "gold": "gold", "xp": "xp", "experience": "xp",
+}
+
+
+def _rng() -> random.Random:
+    seed = os.environ.get("RULES_SEED")
+    return random.Random(int(seed)) if seed else random.Random()
+
+
+def parse_dice(expr: str) -> tuple[int, int, int] | None:
+    """'2d6+3' -> (2, 6, 3); 'd20' -> (1, 20, 0); None if it isn't a dice expression."""
+    m = _DICE.match(expr.strip().lower())
+    if not m:
+        return None
+    count = int(m.group(1) or 1)
+    sides = int(m.group(2))
+    bonus = int(m.group(4) or 0) * (-1 if m.group(3) == "-" else 1)
+    if not 1 <= count <= 100 or sides not in (2, 3, 4, 6, 8, 10, 12, 20, 100):
+        return None
+    return count, sides, bonus
+
+
+def roll(expr: str, rng: random.Random | None = None, crit: bool = False) -> tuple[int, list[int]]:
+    """(total, individual dice) for a dice expression or a flat number; crit doubles the dice."""
+    rng = rng or _rng()
+    if expr.isdigit():
+        return int(expr), []
+    count, sides, bonus = parse_dice(expr) or (0, 0, 0)
+    dice = [rng.randint(1, sides) for _ in range(count * (2 if crit else 1))]
+    return sum(dice) + bonus, dice
+
+
+def _normalize(message: str) -> str:
+    return " ".join(message.lower().replace("’", "'").split()).rstrip(".!?")
+
+
+def _result(narrative: str, kind: str) -> dict[str, Any]:
+    RESOLVED.inc(kind=kind)
+    return {"narrative": narrative, "hp_change": 0, "xp_change": 0, "gold_change": 0, "new_items": []}
+
+
+def _weapon(items: list[str], named: str | None) -> tuple[str, str] | None:
+    """
+    (weapon, damage dice): the named weapon if carried (None if not, or if we can't score it),
+    else the first weapon in the inventory, else unarmed.
+    """
+    carried = []
+    for item in items:
+        dice = next((d for weapon, d in WEAPON_DAMAGE.items() if weapon in item.lower()), None)
+        if dice:
+            carried.append((item, dice))
+    if named:
+        named = named.strip()
+        if named in ("fist", "fists", "bare hands"):
+            return "your fists", UNARMED_DAMAGE
+        return next(((item, dice) for item, dice in carried if named in item.lower()), None)
+    return carried[0] if carried else ("your fists", UNARMED_DAMAGE)
+
+
+def _attack(target: str, weapon_name: str | None, stats: dict[str, Any], monster: dict[str, Any],
+            rng: random.Random) -> str | None:
+    name = str(monster.get("name") or "")
+    if not name or target.strip() not in name.lower() or monster.get("ac") is None:
+        return None
+    weapon = _weapon(inventory.render(inventory.counts(stats.get("inventory"))), weapon_name)
+    if weapon is None:
+        return None  # a weapon we can't score: leave it to the DM
+    weapon, dice = weapon
+    d20 = rng.randint(1, 20)
+    total = d20 + ATTACK_BONUS
+    ac = int(monster["ac"])
+    crit = d20 == 20
+    hit = crit or (d20 != 1 and total >= ac)
+    line = f"The player attacks the {name} with {weapon}: d20 {d20} + {ATTACK_BONUS} = {total} vs AC {ac}"
+    RESOLVED.inc(kind="attack_roll")
+    if not hit:
+        return line + (" — a natural 1, a clean miss." if d20 == 1 else " — a miss.")
+    damage, rolled = roll(dice, rng, crit=crit)
+    damage = max(1, damage + DAMAGE_BONUS)
+    line += " — a critical hit!" if crit else " — a hit."
+    shown = f" ({', '.join(map(str, rolled))})" if rolled else ""
+    return line + f" Damage {dice}{' x2' if crit else ''}{shown} + {DAMAGE_BONUS} = {damage}."
+
+
+def _simple(message: str) -> str | None:
+    """The normalized message if it is one short clause, else None."""
+    text = _normalize(message or "")
+    if not text or len(text) > 80 or any(sep in text for sep in (" and ", " then ", ",", ";", ". ")):
+        return None
+    return text
+
+
+def resolve(message: str, stats: dict[str, Any], rng: random.Random | None = None) -> dict[str, Any] | None:
+    """A DM result for a purely mechanical action, or None if the action needs a model."""
+    text = _simple(message)
+    if text is None:
+        return None
+    rng = rng or _rng()
+
+    if _INVENTORY.fullmatch(text):
+        carried = inventory.render(inventory.counts(stats.get("inventory")))
+        items = ", ".join(carried) if carried else "nothing"
+        return _result(f"You check your pack: {items}. You have {stats.get('gold', 0)} gold.", "inventory")
+
+    m = _STAT.fullmatch(text)
+    if m:
+        asked = _STAT_NAMES.get(m.group(1) or m.group(2) or "")
+        hp, gold, xp = stats.get("hp", 100), stats.get("gold", 0), stats.get("xp", 0)
+        if asked == "hp":
+            return _result(f"You have {hp} HP.", "stats")
+        if asked == "gold":
+            return _result(f"You have {gold} gold.", "stats")
+        if asked == "xp":
+            return _result(f"You have {xp} XP.", "stats")
+        return _result(f"HP {hp}, XP {xp}, Gold {gold}.", "stats")
+
+    m = _ROLL.fullmatch(text)
+    if m and parse_dice(m.group(1)):
+        expr = m.group(1).replace(" ", "")
+        total, dice = roll(expr, rng)
+        shown = f" ({', '.join(map(str, dice))})" if len(dice) > 1 else ""
+        return _result(f"You roll {expr}: {total}{shown}.", "roll")
+    return None
+
+
+def attack_roll(
+    message: str,
+    stats: dict[str, Any],
+    monster_stats: dict[str, Any] | None,
+    rng: random.Random | None = None,
+) -> str | None:
+    """The rolled attack for "I attack the <monster>" against a monster with a known AC, or None."""
+    text = _simple(message)
+    m = _ATTACK.fullmatch(text) if text else None
+    if not m or not monster_stats:
+        return None
+    return _attack(m.group(1), m.group(2), stats, monster_stats, rng or _rng())
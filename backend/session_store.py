@@ -0,0 +1,556 @@
+"""
+Per-player game sessions for app.py (character sheet + recent log entries).
+
+StateStore is the interface app.py talks to; SessionStore below keeps everything in
+this process (one worker). state_backend.py has stores shared between worker processes
+and nodes (SQLite in WAL mode, Redis) and picks one from STATE_BACKEND.
+
+Each character carries a state version that goes up on every change. Clients of the
+delta protocol send the version they last saw; state(expected_version=...) raises
+VersionConflict if it moved, and apply_changes() commits only the fields a turn changed.
+
+Sessions are keyed by player_id and spread over lock-striped shards, so concurrent
+Flask threads only contend when they touch the same shard. Each session keeps its
+log in a ring buffer, and idle sessions are evicted (TTL, then LRU once a shard is
+full), so memory stays flat however long the server runs.
+
+Env vars (read by state_backend.from_env):
+  SESSION_LOG_LIMIT  log entries kept per session (default 200)
+  SESSION_TTL        seconds of inactivity before a session is dropped (default 3600)
+  SESSION_MAX        max sessions kept in memory (default 10000)
+  SESSION_SHARDS     number of lock stripes (default 16)
+"""
+
+import copy
+import heapq
+import itertools
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, Callable, Iterable
+
+import inventory
+
+DEFAULT_PLAYER_ID = "default"
+STAT_FIELDS = ("hp", "xp", "gold")
+
+
+class LockTimeout(Exception):
+    """A player's lock wasn't acquired in time (another turn for the player is still running)."""
+
+
+class VersionConflict(Exception):
+    """The character changed since the version the client sent; carries the current state and version."""
+
+    def __init__(self, version: int, stats: dict[str, Any]):
+        super().__init__(f"Character is at version {version}")
+        self.version = version
+        self.stats = stats
+
+
+def _turn_stats(character: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "hp": character.get("hp"),
+        "gold": character.get("gold"),
+        "xp": character.get("xp"),
+        "inventory": list(character.get("inventory", [])),
+    }
+
+
+def merge_stats(character: dict[str, Any], stats: dict[str, Any]) -> None:
+    """update_character's merge: hp/xp/gold/inventory from stats replace the character's, in place."""
+    for field in STAT_FIELDS:
+        character[field] = stats.get(field, character.get(field))
+    character["inventory"] = list(stats.get("inventory", character.get("inventory", [])))
+
+
+def merge_changes(character: dict[str, Any], changes: dict[str, Any]) -> bool:
+    """apply_changes' merge: only the changed fields (inventory as {item: new count}), in place. False if none."""
+    if not changes:
+        return False
+    for field in STAT_FIELDS:
+        if field in changes:
+            character[field] = changes[field]
+    if changes.get("inventory"):
+        items = inventory.apply(inventory.counts(character.get("inventory")), changes["inventory"])
+        character["inventory"] = inventory.render(items)
+    return True
+
+
+class PlayerLock:
+    """
+    Exclusive lock on one player's state, held for a whole turn so concurrent turns for the
+    player (from any thread, worker or node sharing the store) run one after another.
+    Use as a context manager, or acquire() / release(); acquire raises LockTimeout.
+    """
+
+    def __init__(self, player_id: str, timeout: float):
+        self.player_id = player_id
+        self.timeout = timeout
+        self._held = False
+
+    def acquire(self) -> "PlayerLock":
+        if not self._acquire(self.timeout):
+            raise LockTimeout(f"Player {self.player_id} has a turn in progress")
+        self._held = True
+        return self
+
+    def release(self) -> None:
+        """Safe to call twice, or without having acquired."""
+        if self._held:
+            self._held = False
+            self._release()
+
+    def __enter__(self) -> "PlayerLock":
+        return self.acquire()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+    def _acquire(self, timeout: float) -> bool:
+        raise NotImplementedError
+
+    def _release(self) -> None:
+        raise NotImplementedError
+
+
+class StateStore:
+    """
+    Per-player characters, logs and locks. Characters are dicts like the default character;
+    log entries are dicts that get a store-wide increasing "seq". Every method is thread-safe.
+
+    Conversation memory (memory()) always stays in this process: it only makes prompts
+    better, so a turn served by another worker just sees less history.
+    """
+
+    name = ""
+
+    def __init__(
+        self,
+        default_character: dict[str, Any],
+        log_limit: int = 200,
+        ttl: float = 3600.0,
+        max_sessions: int = 10000,
+        memory_factory: Callable[[], Any] | None = None,
+        lock_timeout: float = 30.0,
+    ):
+        self._default = copy.deepcopy(default_character)
+        self.log_limit = max(1, log_limit)
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self.lock_timeout = lock_timeout
+        self._memory_factory = memory_factory
+        self._memories: OrderedDict[str, Any] = OrderedDict()
+        self._memories_lock = threading.Lock()
+
+    def default_character(self) -> dict[str, Any]:
+        return copy.deepcopy(self._default)
+
+    def _new_character(self, player_id: str) -> dict[str, Any]:
+        character = self.default_character()
+        character["player_id"] = player_id
+        return character
+
+    def memory(self, player_id: str | None) -> Any:
+        """The player's conversation memory in this process (created on first use, LRU-bounded), or None."""
+        if self._memory_factory is None:
+            return None
+        player_id = player_id or DEFAULT_PLAYER_ID
+        with self._memories_lock:
+            memory = self._memories.get(player_id)
+            if memory is None:
+                memory = self._memories[player_id] = self._memory_factory()
+                while len(self._memories) > self.max_sessions:
+                    self._memories.popitem(last=False)
+            else:
+                self._memories.move_to_end(player_id)
+            return memory
+
+    def player_lock(self, player_id: str | None, timeout: float | None = None) -> PlayerLock:
+        """An (unacquired) lock on the player's state; waits up to timeout (default lock_timeout) to acquire."""
+        raise NotImplementedError
+
+    def state(self, player_id: str | None, expected_version: int | None = None) -> tuple[dict[str, Any], int]:
+        """
+        (turn stats: hp/gold/xp/inventory, state version) for the player's character.
+        Raises VersionConflict if expected_version is given and the character has moved on.
+        """
+        raise NotImplementedError
+
+    def update_character(self, player_id: str | None, stats: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        """Merge hp/xp/gold/inventory from stats into the player's character; return (copy, new state version)."""
+        raise NotImplementedError
+
+    def apply_changes(self, player_id: str | None, changes: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        """
+        Commit a turn's changes (dm_agent "changes": new hp/xp/gold values, inventory as
+        {item: new count}) onto the current character, touching nothing else, so another
+        change that landed meanwhile is kept. Returns (copy, new state version); no bump if empty.
+        """
+        raise NotImplementedError
+
+    def append_logs(self, player_id: str | None, entries: list[dict[str, Any]]) -> None:
+        """Append entries to the player's log (oldest entries beyond log_limit fall off)."""
+        raise NotImplementedError
+
+    def mark_synced(self, player_id: str | None, turn_ids: Iterable[str]) -> int:
+        """
+        Set isSnowflakeSynced on the player's log entries for these turns, once GAME_HISTORY has
+        them. Bumps the session's store version (not its state version). Returns entries changed.
+        """
+        raise NotImplementedError
+
+    def characters(self, player_id: str | None = None) -> list[dict[str, Any]]:
+        """Copies of every live character (least recently used first), or just player_id's, with their state "version"."""
+        raise NotImplementedError
+
+    def logs(
+        self,
+        player_id: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Log entries in seq order, for one player or for everyone.
+
+        since: only entries with seq > since (cursor from a previous call).
+        limit: at most this many; the oldest ones after `since`, or the newest ones if
+        `since` is not given.
+        """
+        raise NotImplementedError
+
+    def version(self, player_id: str | None = None) -> int:
+        """Change counter for the whole store, or for one player's session (0 if it doesn't exist)."""
+        raise NotImplementedError
+
+    def evict_expired(self) -> int:
+        """Drop sessions idle longer than ttl. Returns how many were removed."""
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, Any]:
+        raise NotImplementedError
+
+
+class _LocalPlayerLock(PlayerLock):
+    """Per-player lock within this process; the lock object lives only while someone holds or waits on it."""
+
+    def __init__(self, table: "_LocalLocks", player_id: str, timeout: float):
+        super().__init__(player_id, timeout)
+        self._table = table
+
+    def _acquire(self, timeout: float) -> bool:
+        return self._table.acquire(self.player_id, timeout)
+
+    def _release(self) -> None:
+        self._table.release(self.player_id)
+
+
+class _LocalLocks:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: dict[str, list] = {}  # player_id -> [Lock, holders + waiters]
+
+    def acquire(self, player_id: str, timeout: float) -> bool:
+        with self._lock:
+            entry = self._locks.setdefault(player_id, [threading.Lock(), 0])
+            entry[1] += 1
+        if entry[0].acquire(timeout=max(0.0, timeout)):
+            return True
+        self._unref(player_id)
+        return False
+
+    def release(self, player_id: str) -> None:
+        with self._lock:
+            self._locks[player_id][0].release()
+        self._unref(player_id)
+
+    def _unref(self, player_id: str) -> None:
+        with self._lock:
+            entry = self._locks[player_id]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[player_id]
+
+
+class Session:
+    """One player's character, recent log entries and conversation memory. Guard access with .lock."""
+
+    __slots__ = ("player_id", "character", "logs", "last_access", "lock", "version", "memory", "state_version")
+
+    def __init__(
+        self, player_id: str, character: dict[str, Any], log_limit: int, version: int = 0, memory: Any = None
+    ):
+        self.player_id = player_id
+        self.character = character
+        # (seq, entry) pairs; seq is store-wide and increasing so logs from many sessions can be merged
+        self.logs: deque[tuple[int, dict[str, Any]]] = deque(maxlen=log_limit)
+        self.last_access = time.monotonic()
+        self.lock = threading.Lock()
+        self.version = version  # store version of this session's last change
+        self.memory = memory  # conversation_memory.ConversationMemory (has its own lock), or None
+        self.state_version = 0  # bumped on every character change; the delta protocol's version
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: OrderedDict[str, Session] = OrderedDict()  # LRU order: oldest first
+
+
+class SessionStore(StateStore):
+    """
+    Thread-safe, bounded in-process store of Session objects.
+
+    get() creates sessions on first use from a copy of default_character. Expired sessions
+    are swept from a shard whenever a session is added to it; when the shard is still over
+    its share of max_sessions, the least recently used sessions go. Reads of the whole store
+    (version(), characters(), logs(), stats()) sweep expired sessions first, so an expiry
+    bumps the store version before anyone can see the session gone.
+    """
+
+    name = "memory"
+
+    def __init__(
+        self,
+        default_character: dict[str, Any],
+        log_limit: int = 200,
+        ttl: float = 3600.0,
+        max_sessions: int = 10000,
+        shards: int = 16,
+        memory_factory: Callable[[], Any] | None = None,
+        lock_timeout: float = 30.0,
+    ):
+        super().__init__(default_character, log_limit, ttl, max_sessions, memory_factory, lock_timeout)
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._per_shard = max(1, -(-self.max_sessions // len(self._shards)))
+        self._seq = itertools.count(1)
+        self._locks = _LocalLocks()
+        self._evictions = 0
+        self._evictions_lock = threading.Lock()
+        # Bumped on every change (any session); lets pollers use it as an ETag
+        self._version = 0
+        self._version_lock = threading.Lock()
+
+    def _shard(self, player_id: str) -> _Shard:
+        return self._shards[zlib.crc32(player_id.encode("utf-8")) % len(self._shards)]
+
+    def get(self, player_id: str | None) -> Session:
+        """Return the player's session, creating it if needed, and mark it as recently used."""
+        player_id = player_id or DEFAULT_PLAYER_ID
+        shard = self._shard(player_id)
+        now = time.monotonic()
+        with shard.lock:
+            session = shard.sessions.get(player_id)
+            if session is not None and now - session.last_access <= self.ttl:
+                session.last_access = now
+                shard.sessions.move_to_end(player_id)
+                return session
+            if session is not None:
+                del shard.sessions[player_id]
+                self._count_evictions(1)
+            character = self._new_character(player_id)
+            memory = self._memory_factory() if self._memory_factory else None
+            session = Session(player_id, character, self.log_limit, self._bump(), memory)
+            shard.sessions[player_id] = session
+            self._evict_locked(shard, now)
+            return session
+
+    def peek(self, player_id: str | None) -> Session | None:
+        """Return the session if it exists and hasn't expired, without creating or touching it."""
+        player_id = player_id or DEFAULT_PLAYER_ID
+        shard = self._shard(player_id)
+        with shard.lock:
+            session = shard.sessions.get(player_id)
+        if session is None or time.monotonic() - session.last_access > self.ttl:
+            return None
+        return session
+
+    def memory(self, player_id: str | None) -> Any:
+        return self.get(player_id).memory
+
+    def player_lock(self, player_id: str | None, timeout: float | None = None) -> PlayerLock:
+        return _LocalPlayerLock(
+            self._locks, player_id or DEFAULT_PLAYER_ID, self.lock_timeout if timeout is None else timeout
+        )
+
+    def state(self, player_id: str | None, expected_version: int | None = None) -> tuple[dict[str, Any], int]:
+        session = self.get(player_id)
+        with session.lock:
+            stats = _turn_stats(session.character)
+            version = session.state_version
+        if expected_version is not None and expected_version != version:
+            raise VersionConflict(version, stats)
+        return stats, version
+
+    def update_character(self, player_id: str | None, stats: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        session = self.get(player_id)
+        with session.lock:
+            merge_stats(session.character, stats)
+            session.version = self._bump()
+            session.state_version += 1
+            return copy.deepcopy(session.character), session.state_version
+
+    def apply_changes(self, player_id: str | None, changes: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        session = self.get(player_id)
+        with session.lock:
+            if merge_changes(session.character, changes):
+                session.version = self._bump()
+                session.state_version += 1
+            return copy.deepcopy(session.character), session.state_version
+
+    def append_logs(self, player_id: str | None, entries: list[dict[str, Any]]) -> None:
+        """Append entries to the player's log ring buffer (oldest entries fall off). Each gets a store-wide "seq"."""
+        session = self.get(player_id)
+        with session.lock:
+            for entry in entries:
+                seq = next(self._seq)
+                session.logs.append((seq, dict(entry, seq=seq)))
+            session.version = self._bump()
+
+    def mark_synced(self, player_id: str | None, turn_ids: Iterable[str]) -> int:
+        session = self.peek(player_id)
+        if session is None:
+            return 0
+        turn_ids = set(turn_ids)
+        changed = 0
+        with session.lock:
+            for _, entry in session.logs:
+                if entry.get("turnId") in turn_ids and not entry.get("isSnowflakeSynced"):
+                    entry["isSnowflakeSynced"] = True
+                    changed += 1
+            if changed:
+                session.version = self._bump()
+        return changed
+
+    def characters(self, player_id: str | None = None) -> list[dict[str, Any]]:
+        """Copies of every live character (least recently used first), or just player_id's, with their state "version"."""
+        out = []
+        for session in self._sessions_for(player_id):
+            with session.lock:
+                out.append(dict(copy.deepcopy(session.character), version=session.state_version))
+        return out
+
+    def logs(
+        self,
+        player_id: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Log entries in seq order, for one player or for everyone.
+
+        since: only entries with seq > since (cursor from a previous call).
+        limit: at most this many; the oldest ones after `since`, or the newest ones if
+        `since` is not given.
+        """
+        per_session = []
+        for session in self._sessions_for(player_id):
+            with session.lock:
+                if since is None:
+                    items = list(session.logs)
+                else:
+                    # Entries are in seq order: walk back from the newest until we pass the cursor
+                    items = []
+                    for item in reversed(session.logs):
+                        if item[0] <= since:
+                            break
+                        items.append(item)
+                    items.reverse()
+            if items:
+                per_session.append(items)
+        merged = list(heapq.merge(*per_session, key=lambda item: item[0]))
+        if limit is not None:
+            merged = merged[:limit] if since is not None else merged[-limit:] if limit > 0 else []
+        return [dict(entry) for _, entry in merged]
+
+    def version(self, player_id: str | None = None) -> int:
+        """Change counter for the whole store, or for one player's session (0 if it doesn't exist)."""
+        if player_id is None:
+            self._sweep_expired()
+            with self._version_lock:
+                return self._version
+        session = self.peek(player_id)
+        if session is None:
+            return 0
+        with session.lock:
+            return session.version
+
+    def evict_expired(self) -> int:
+        """Drop sessions idle longer than ttl. Returns how many were removed."""
+        now = time.monotonic()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += self._evict_locked(shard, now)
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        self._sweep_expired()
+        sessions = 0
+        log_entries = 0
+        for shard in self._shards:
+            with shard.lock:
+                sessions += len(shard.sessions)
+                log_entries += sum(len(s.logs) for s in shard.sessions.values())
+        with self._evictions_lock:
+            evictions = self._evictions
+        return {
+            "sessions": sessions,
+            "log_entries": log_entries,
+            "evictions": evictions,
+            "max_sessions": self.max_sessions,
+            "log_limit": self.log_limit,
+        }
+
+    def _sessions_for(self, player_id: str | None) -> list[Session]:
+        if player_id is None:
+            return self._live_sessions()
+        session = self.peek(player_id)
+        return [session] if session else []
+
+    def _bump(self) -> int:
+        with self._version_lock:
+            self._version += 1
+            return self._version
+
+    def _live_sessions(self) -> list[Session]:
+        self._sweep_expired()
+        now = time.monotonic()
+        out = []
+        for shard in self._shards:
+            with shard.lock:
+                out.extend(s for s in shard.sessions.values() if now - s.last_access <= self.ttl)
+        out.sort(key=lambda s: s.last_access)
+        return out
+
+    def _sweep_expired(self) -> None:
+        """
+        evict_expired() for every shard whose least recently used session has expired. Shards are
+        in LRU order, so shards with nothing expired cost one check each.
+        """
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                if shard.sessions and now - next(iter(shard.sessions.values())).last_access > self.ttl:
+                    self._evict_locked(shard, now)
+
+    def _evict_locked(self, shard: _Shard, now: float) -> int:
+        """Remove expired sessions, then LRU ones beyond the shard's capacity. Caller holds shard.lock."""
+        removed = 0
+        for pid in [pid for pid, s in shard.sessions.items() if now - s.last_access > self.ttl]:
+            del shard.sessions[pid]
+            removed += 1
+        while len(shard.sessions) > self._per_shard:
+            shard.sessions.popitem(last=False)
+            removed += 1
+        if removed:
+            self._count_evictions(removed)
+            self._bump()
+        return removed
+
+    def _count_evictions(self, n: int) -> None:
+        with self._evictions_lock:
+            self._evictions += n
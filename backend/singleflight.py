@@ -0,0 +1,177 @@
+"""
+Deduplicate concurrent identical work ("singleflight").
+
+When several threads ask for the same key at once, the first one (the leader)
+does the work and the others wait for it and share its result, or its
+exception. Nothing is cached: once the call finishes, the next caller starts
+a new one.
+
+    flight = SingleFlight("compendium")
+    row = flight.do(key, lambda: query(key))
+    rows = flight.do_many(keys, lambda missing: bulk_query(missing))   # {key: value}
+
+do_many() is for batched lookups: each key gets its own flight, the caller
+leads one bulk call for every key nobody else is fetching, and waits on the
+others. So party members asking for overlapping monsters share queries even when
+their term lists differ.
+
+Env vars:
+  SINGLEFLIGHT_TIMEOUT  seconds a follower waits for the leader (default 30)
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+import metrics
+
+CALLS = metrics.counter("singleflight_calls_total", "Singleflight calls by role", ["flight", "role"])
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A follower gave up waiting for the in-flight call it joined."""
+
+
+def default_timeout() -> float:
+    try:
+        return float(os.environ.get("SINGLEFLIGHT_TIMEOUT", "30"))
+    except ValueError:
+        return 30.0
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+    def result(self, key: Hashable, timeout: float | None) -> Any:
+        if not self.done.wait(timeout):
+            raise SingleFlightTimeout(f"timed out after {timeout}s waiting for in-flight call {key!r}")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Per-key deduplication of concurrent calls (thread-safe). Also usable from asyncio via ado()."""
+
+    def __init__(self, name: str, timeout: float | None = None):
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._async_calls: dict[tuple[int, Hashable], asyncio.Future] = {}  # in-flight ado() tasks
+
+    def _timeout(self, timeout: float | None) -> float:
+        if timeout is not None:
+            return timeout
+        return self.timeout if self.timeout is not None else default_timeout()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float | None = None) -> Any:
+        """fn() for key, or the result of the identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            return self._follow(key, call, timeout)
+        CALLS.inc(flight=self.name, role="leader")
+        try:
+            call.value = fn()
+        except BaseException as exc:
+            call.error = exc
+            CALLS.inc(flight=self.name, role="error")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def do_many(
+        self,
+        keys: Iterable[Hashable],
+        fn: Callable[[list[Hashable]], dict[Hashable, Any]],
+        timeout: float | None = None,
+    ) -> dict[Hashable, Any]:
+        """
+        {key: value} for every key. Keys nobody is fetching are fetched with one fn(keys) call
+        (missing keys in its result count as None); the rest are awaited from their leaders.
+        If any flight this caller needs fails, its exception is raised.
+        """
+        keys = list(dict.fromkeys(keys))
+        owned: dict[Hashable, _Call] = {}
+        joined: dict[Hashable, _Call] = {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    owned[key] = self._calls[key] = _Call()
+                else:
+                    joined[key] = call
+        out: dict[Hashable, Any] = {}
+        if owned:
+            CALLS.inc(flight=self.name, role="leader")
+            try:
+                found = fn(list(owned))
+                for key, call in owned.items():
+                    call.value = out[key] = found.get(key)
+            except BaseException as exc:
+                CALLS.inc(flight=self.name, role="error")
+                for call in owned.values():
+                    call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    for key in owned:
+                        del self._calls[key]
+                for call in owned.values():
+                    call.done.set()
+        for key, call in joined.items():
+            out[key] = self._follow(key, call, timeout)
+        return {key: out[key] for key in keys}
+
+    def _follow(self, key: Hashable, call: _Call, timeout: float | None) -> Any:
+        CALLS.inc(flight=self.name, role="shared")
+        try:
+            return call.result(key, self._timeout(timeout))
+        except SingleFlightTimeout:
+            CALLS.inc(flight=self.name, role="timeout")
+            raise
+
+    async def ado(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]], timeout: float | None = None) -> Any:
+        """
+        Async do(): tasks on the same event loop share one await of coro_fn(). It runs as its own
+        task, so a caller that is cancelled (the leader included) stops waiting without cancelling
+        the work the others are waiting for.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        task = self._async_calls.get(loop_key)
+        if task is not None:
+            CALLS.inc(flight=self.name, role="shared")
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), self._timeout(timeout))
+            except asyncio.TimeoutError:
+                CALLS.inc(flight=self.name, role="timeout")
+                raise SingleFlightTimeout(f"timed out waiting for in-flight call {key!r}") from None
+        task = asyncio.ensure_future(coro_fn())
+        self._async_calls[loop_key] = task
+        CALLS.inc(flight=self.name, role="leader")
+
+        def finished(task: asyncio.Future) -> None:
+            del self._async_calls[loop_key]
+            # Retrieve the exception so a failure nobody is waiting for any more isn't logged as never retrieved
+            if not task.cancelled() and task.exception() is not None:
+                CALLS.inc(flight=self.name, role="error")
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
@@ -6,19 +6,74 @@ SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE, SNOWFLAKE_SCHEMA.
 
 Expected tables (adjust names to match your Snowflake schema):
   - COMPENDIUM: name, type, hp, ac, description (monsters/items/lore)
-  - PLAYER_STATS: player_id, hp, gold, xp, inventory (JSON or array column)
-  - GAME_HISTORY: player_name, action, narrative, stats (VARIANT)
+  - PLAYER_STATS: player_id, hp, gold, xp, inventory (VARIANT: {item: count}), updated_at
+  - GAME_HISTORY: turn_id, player_name, action, narrative, stats (VARIANT), created_at
+    (turn_id and created_at are newer columns: ensure_game_history_schema() adds them to an
+    existing table before the turn journal's first upload)
+
+Connections come from a shared pool (see db_pool.py for the SNOWFLAKE_POOL_* env vars).
+Callers still do conn = get_connection() ... conn.close(); close() returns the
+session to the pool instead of logging out. After a connector or network error the
+session is discard()ed instead, so no other caller is handed the broken connection.
+
+Compendium reads go through compendium_backend.get_backend(): SnowflakeCompendium
+below, or a local SQLite mirror when COMPENDIUM_BACKEND=sqlite.
+fetch_monster / fetch_monster_stats are cached in-process (hits and misses):
+  COMPENDIUM_CACHE_TTL (3600s), COMPENDIUM_CACHE_NEGATIVE_TTL (300s),
+  COMPENDIUM_CACHE_MAX_ENTRIES (4096 per table, LRU beyond that).
+warm_compendium_cache() preloads both tables; warmup.py calls it at startup when
+COMPENDIUM_CACHE_WARM=1 or WARMUP_STEPS includes compendium.
+snowflake.connector itself is imported on the first connect, not with this module.
+
+queue_player_stats() is the write-behind path for PLAYER_STATS (see write_behind.py):
+  PLAYER_STATS_FLUSH_BATCH (50 players), PLAYER_STATS_FLUSH_INTERVAL (1.0s).
+save_game_turn() appends to the local turn journal, which uploads GAME_HISTORY in
+bulk (see turn_journal.py for the TURN_JOURNAL_* env vars).
+
+Every statement is counted and timed by kind (snowflake_queries_total,
+snowflake_query_seconds), as are new sessions and pool waits; see metrics.py.
 """
 
+import atexit
 import json
+import logging
 import os
-from typing import Any
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+import compendium_backend
+import entity_matcher
+import inventory
+import metrics
+from cache import MISSING, TTLCache
+from compendium_backend import CompendiumBackend
+from db_pool import ConnectionPool, PooledConnection, PoolTimeout
+from singleflight import SingleFlight
+from write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+QUERIES = metrics.counter("snowflake_queries_total", "Snowflake statements executed", ["kind"])
+QUERY_SECONDS = metrics.histogram("snowflake_query_seconds", "Snowflake statement latency", ["kind"])
+ERRORS = metrics.counter("snowflake_errors_total", "Failed Snowflake statements, connects and pool waits", ["kind"])
+CONNECTIONS = metrics.counter("snowflake_connections_opened_total", "New Snowflake sessions opened")
+CONNECT_SECONDS = metrics.histogram("snowflake_connect_seconds", "Time to open a Snowflake session")
+ACQUIRE_SECONDS = metrics.histogram("snowflake_pool_acquire_seconds", "Time waiting for a pooled connection")
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+_connection_factory = None  # overrides _connect (see set_connection_factory)
+_stats_writer: WriteBehindQueue | None = None
 
-import snowflake.connector
 
+def _connect():
+    """Open a new Snowflake session using environment variables."""
+    # Imported on first connect: the connector takes ~0.4s and tens of MB to import
+    import snowflake.connector
 
-def get_connection():
-    """Return a Snowflake connection using environment variables."""
     return snowflake.connector.connect(
         account=os.environ.get("SNOWFLAKE_ACCOUNT", ""),
         user=os.environ.get("SNOWFLAKE_USER", ""),
@@ -26,92 +81,638 @@ def get_connection():
         warehouse=os.environ.get("SNOWFLAKE_WAREHOUSE", ""),
         database=os.environ.get("SNOWFLAKE_DATABASE", ""),
         schema=os.environ.get("SNOWFLAKE_SCHEMA", "PUBLIC"),
+        # Keep pooled sessions from expiring while they sit idle
+        client_session_keep_alive=True,
     )
 
 
+def _open_connection():
+    """Open a session with the configured factory, counting and timing it."""
+    factory = _connection_factory or _connect
+    start = time.perf_counter()
+    try:
+        conn = factory()
+    except Exception:
+        ERRORS.inc(kind="connect")
+        raise
+    CONNECT_SECONDS.observe(time.perf_counter() - start)
+    CONNECTIONS.inc()
+    return conn
+
+
+def _execute(cursor, kind: str, sql: str, params: tuple | None = None):
+    """cursor.execute(sql, params), counted and timed as `kind` in the snowflake_* metrics."""
+    start = time.perf_counter()
+    try:
+        return cursor.execute(sql, params) if params is not None else cursor.execute(sql)
+    except Exception:
+        ERRORS.inc(kind=kind)
+        raise
+    finally:
+        QUERIES.inc(kind=kind)
+        QUERY_SECONDS.observe(time.perf_counter() - start, kind=kind)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Compendium/monster data rarely changes: cache hits and misses (misses for less time)
+_compendium_cache = TTLCache(
+    max_entries=int(_env_float("COMPENDIUM_CACHE_MAX_ENTRIES", 4096)),
+    ttl=_env_float("COMPENDIUM_CACHE_TTL", 3600),
+    negative_ttl=_env_float("COMPENDIUM_CACHE_NEGATIVE_TTL", 300),
+)
+_monster_stats_cache = TTLCache(
+    max_entries=int(_env_float("COMPENDIUM_CACHE_MAX_ENTRIES", 4096)),
+    ttl=_env_float("COMPENDIUM_CACHE_TTL", 3600),
+    negative_ttl=_env_float("COMPENDIUM_CACHE_NEGATIVE_TTL", 300),
+)
+# Concurrent lookups of the same name (e.g. a party attacking one goblin) share one query
+_compendium_flight = SingleFlight("compendium")
+_monster_flight = SingleFlight("monster_stats")
+# Full-table snapshot from warm_compendium_cache(); lets misses be answered without a query
+_warm: dict[str, Any] = {"monsters": [], "loaded_at": None}
+_warm_lock = threading.Lock()
+# Entity matcher built on first use when warm_compendium_cache() hasn't installed one
+ENTITY_MATCHER_RETRY_SECONDS = _env_float("ENTITY_MATCHER_RETRY_SECONDS", 60)
+_matcher_lock = threading.Lock()
+_matcher_retry_at = 0.0
+
+_MONSTER_STATS_COLUMNS = """
+        DATA:name::string as name,
+        DATA:hit_points::int as hp,
+        DATA:armor_class[0].value::int as ac,
+        DATA:type::string as type,
+        DATA:special_abilities::variant as abilities"""
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide Snowflake connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _open_connection,
+                    min_size=int(_env_float("SNOWFLAKE_POOL_MIN_SIZE", 1)),
+                    max_size=int(_env_float("SNOWFLAKE_POOL_MAX_SIZE", 8)),
+                    acquire_timeout=_env_float("SNOWFLAKE_POOL_ACQUIRE_TIMEOUT", 10),
+                    idle_timeout=_env_float("SNOWFLAKE_POOL_IDLE_TIMEOUT", 300),
+                    health_check_interval=_env_float("SNOWFLAKE_POOL_HEALTH_CHECK_INTERVAL", 60),
+                    max_lifetime=_env_float("SNOWFLAKE_POOL_MAX_LIFETIME", 3600),
+                )
+    return _pool
+
+
+def set_connection_factory(factory) -> None:
+    """
+    Use factory() instead of snowflake.connector.connect for new sessions (e.g. the local
+    stand-in in bench/fake_snowflake.py). Closes the current pool; pass None to restore.
+    """
+    global _connection_factory
+    _connection_factory = factory
+    close_pool()
+
+
+def get_connection() -> PooledConnection:
+    """Return a pooled Snowflake connection. Call close() (or use `with`) to give it back."""
+    start = time.perf_counter()
+    try:
+        return get_pool().acquire()
+    except PoolTimeout:
+        ERRORS.inc(kind="pool_timeout")
+        raise
+    finally:
+        ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+
+
+def _connection_broken(exc: BaseException) -> bool:
+    """True if exc means the session itself failed (network, connector), not just the statement."""
+    if isinstance(exc, (OSError, EOFError)):
+        return True
+    errors = sys.modules.get("snowflake.connector.errors")  # only loaded once the connector is
+    return errors is not None and isinstance(exc, (errors.OperationalError, errors.InterfaceError))
+
+
+def _release_connection(conn: PooledConnection, failed: BaseException | None = None) -> None:
+    """Give a pooled connection back, or discard it if `failed` says its session is broken."""
+    try:
+        if failed is not None and _connection_broken(failed):
+            conn.discard()
+        else:
+            conn.close()
+    except Exception:
+        pass
+
+
+def pool_stats() -> dict[str, Any]:
+    """Connection pool metrics (size, idle, in_use, created, reused, waits, timeouts, ...)."""
+    return get_pool().stats()
+
+
+def close_pool() -> None:
+    """Close all pooled connections (e.g. on shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def _cache_key(name: str) -> str:
+    """Normalize a lookup term the same way the SQL does (UPPER(TRIM(...)))."""
+    return name.strip().upper()
+
+
+def _compendium_row(row) -> dict[str, Any]:
+    return {
+        "name": row[0],
+        "type": row[1],
+        "hp": row[2],
+        "ac": row[3],
+        "description": row[4] or "",
+    }
+
+
+def _monster_stats_row(row) -> dict[str, Any]:
+    return {
+        "name": row[0],
+        "hp": row[1],
+        "ac": row[2],
+        "type": row[3],
+        "abilities": row[4],
+    }
+
+
+def _warm_snapshot_fresh() -> bool:
+    """True while a full warm-load is recent enough that a cache miss means "not in the table"."""
+    loaded_at = _warm["loaded_at"]
+    return loaded_at is not None and time.monotonic() - loaded_at < _compendium_cache.ttl
+
+
+def _unique_terms(terms: list[str]) -> list[tuple[str, str]]:
+    """(original term, cache key) for each non-blank term, first occurrence of each key only."""
+    out = []
+    seen = set()
+    for term in terms:
+        if not term or not str(term).strip():
+            continue
+        key = _cache_key(str(term))
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append((term, key))
+    return out
+
+
+def _match_warm_monster(key: str) -> dict[str, Any] | None:
+    """ILIKE '%term%' against the warm snapshot; shortest matching name wins (same order as the SQL)."""
+    needle = key.lower()
+    matches = [m for m in _warm["monsters"] if needle in (m.get("name") or "").lower()]
+    return min(matches, key=lambda m: len(m["name"])) if matches else None
+
+
+class SnowflakeCompendium(CompendiumBackend):
+    """Compendium lookups against Snowflake (pooled connections, one query per call)."""
+
+    name = "snowflake"
+
+    def _query(self, kind: str, sql: str, params: tuple | None = None) -> list[tuple]:
+        conn = get_connection()  # pooled; given back (or dropped if broken) below
+        failed = None
+        try:
+            cursor = conn.cursor()
+            try:
+                _execute(cursor, kind, sql, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as exc:
+            failed = exc
+            raise
+        finally:
+            _release_connection(conn, failed)
+
+    def lookup_compendium(self, keys: list[str]) -> dict[str, dict[str, Any]]:
+        if not keys:
+            return {}
+        placeholders = ", ".join(["%s"] * len(keys))
+        # Adjust table/column names to match your schema
+        rows = self._query(
+            "compendium_lookup",
+            f"""
+            SELECT name, type, hp, ac, description
+            FROM COMPENDIUM
+            WHERE UPPER(TRIM(name)) IN ({placeholders})
+            """,
+            tuple(keys),
+        )
+        found: dict[str, dict[str, Any]] = {}
+        for row in rows:
+            found.setdefault(_cache_key(str(row[0] or "")), _compendium_row(row))
+        return found
+
+    def lookup_monsters(self, terms: list[str]) -> list[dict[str, Any] | None]:
+        if not terms:
+            return []
+        values = ", ".join(["(%s, %s)"] * len(terms))
+        query = f"""
+        SELECT t.idx, {_MONSTER_STATS_COLUMNS}
+        FROM MONSTERS
+        JOIN (SELECT column1 AS idx, column2 AS pattern FROM VALUES {values}) AS t
+          ON DATA:name::string ILIKE t.pattern
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY t.idx ORDER BY LENGTH(DATA:name::string), DATA:name::string) = 1
+        """
+        params = []
+        for idx, term in enumerate(terms):
+            params.extend((idx, f"%{str(term).strip()}%"))
+        found = {r[0]: _monster_stats_row(r[1:]) for r in self._query("monster_lookup", query, tuple(params))}
+        return [found.get(idx) for idx in range(len(terms))]
+
+    def monster_document(self, name: str) -> dict[str, Any] | None:
+        # game_engine's original lookup: the MONSTERS document lives in "VARIANT_COL" there
+        rows = self._query(
+            "monster_document",
+            """
+            SELECT "VARIANT_COL"
+            FROM "DND_PROJECT"."PUBLIC"."MONSTERS"
+            WHERE "VARIANT_COL":name::string ILIKE %s
+            LIMIT 1
+            """,
+            (f"%{name}%",),
+        )
+        if not rows:
+            return None
+        doc = rows[0][0]
+        return json.loads(doc) if isinstance(doc, str) else doc
+
+    def export_compendium(self) -> list[dict[str, Any]]:
+        rows = self._query("compendium_export", "SELECT name, type, hp, ac, description FROM COMPENDIUM")
+        return [_compendium_row(r) for r in rows]
+
+    def export_monsters(self) -> list[dict[str, Any]]:
+        rows = self._query("monster_export", f"SELECT {_MONSTER_STATS_COLUMNS} FROM MONSTERS")
+        return [_monster_stats_row(r) for r in rows]
+
+    def export_monster_documents(self) -> Iterable[dict[str, Any]]:
+        for (doc,) in self._query("monster_document_export", "SELECT DATA FROM MONSTERS"):
+            yield json.loads(doc) if isinstance(doc, str) else doc
+
+
+def fetch_compendium_bulk(terms: list[str]) -> dict[str, dict[str, Any] | None]:
+    """
+    Look up several COMPENDIUM entries by exact (case-insensitive) name in one query.
+    Returns {term: row or None} for each distinct term, in input order. Cached terms
+    (hits and known misses) are not sent to the backend, and terms already being fetched by
+    another thread are shared with it; if nothing is left, no query runs.
+    """
+    pending = _unique_terms(terms)
+    results: dict[str, dict[str, Any] | None] = {}
+    to_query = []
+    for term, key in pending:
+        cached = _compendium_cache.get(key)
+        if cached is not MISSING:
+            results[term] = dict(cached) if cached else None
+        elif _warm_snapshot_fresh():
+            _compendium_cache.set(key, None)
+            results[term] = None
+        else:
+            to_query.append((term, key))
+
+    if to_query:
+        try:
+            found = _compendium_flight.do_many(
+                [key for _, key in to_query], compendium_backend.get_backend().lookup_compendium
+            )
+        except Exception:
+            logger.warning("COMPENDIUM lookup failed for %d terms", len(to_query), exc_info=True)
+            # Don't cache failures as "not found"
+            for term, _ in to_query:
+                results[term] = None
+            to_query = []
+        for term, key in to_query:
+            row = found.get(key)
+            _compendium_cache.set(key, row)
+            results[term] = dict(row) if row else None
+
+    return {term: results[term] for term, _ in pending}
+
+
+def _lookup_monsters_by_key(keys: list[str]) -> dict[str, dict[str, Any] | None]:
+    # Keys are UPPER(TRIM(term)); the ILIKE/LIKE match is case-insensitive, so they work as terms
+    return dict(zip(keys, compendium_backend.get_backend().lookup_monsters(keys)))
+
+
+def fetch_monsters_bulk(terms: list[str]) -> dict[str, dict[str, Any] | None]:
+    """
+    Look up MONSTERS stats for several terms (name ILIKE '%term%') in one query.
+    Returns {term: row or None} for each distinct term, in input order; when several
+    monsters match a term, the shortest name wins ("goblin" -> "Goblin", not "Goblin Boss").
+    Cached terms are not sent to the backend; if nothing is left, no query runs. Terms another
+    thread is already fetching are waited for instead of queried again (see singleflight.py).
+    If the backend fails, the error is logged and the uncached terms come back as misses.
+    """
+    pending = _unique_terms(terms)
+    results: dict[str, dict[str, Any] | None] = {}
+    to_query = []
+    for term, key in pending:
+        cached = _monster_stats_cache.get(key)
+        if cached is not MISSING:
+            results[term] = dict(cached) if cached else None
+        elif _warm_snapshot_fresh():
+            row = _match_warm_monster(key)
+            _monster_stats_cache.set(key, row)
+            results[term] = dict(row) if row else None
+        else:
+            to_query.append((term, key))
+
+    if to_query:
+        try:
+            found = _monster_flight.do_many([key for _, key in to_query], _lookup_monsters_by_key)
+        except Exception:
+            logger.warning("MONSTERS lookup failed for %d terms", len(to_query), exc_info=True)
+            # Don't cache failures as "not found"
+            for term, _ in to_query:
+                results[term] = None
+            to_query = []
+        for term, key in to_query:
+            row = found[key]
+            _monster_stats_cache.set(key, row)
+            results[term] = dict(row) if row else None
+
+    return {term: results[term] for term, _ in pending}
+
+
 def fetch_monster(name: str) -> dict[str, Any] | None:
     """
     Look up a monster (or compendium entry) by name in Snowflake.
     Returns a dict with keys like name, type, hp, ac, description, or None if not found.
+    Results (including misses) are served from the compendium cache when possible.
     """
     if not name or not name.strip():
         return None
+    return fetch_compendium_bulk([name]).get(name)
+
+
+PLAYER_STATS_COLUMNS = ("hp", "gold", "xp", "inventory")
+_PLAYER_STATS_CASTS = {"hp": "::int", "gold": "::int", "xp": "::int", "inventory": "::string"}
+_PLAYER_STATS_DEFAULTS = {"hp": "100", "gold": "0", "xp": "0", "inventory": "PARSE_JSON('{}')"}
+# Players this process has written a PLAYER_STATS row for (LRU-bounded); their later writes
+# only send the columns that changed
+_KNOWN_PLAYERS_MAX = 100_000
+_known_players: OrderedDict[str, None] = OrderedDict()
+_known_lock = threading.Lock()
+
+
+def _player_stats_columns(stats: dict[str, Any], player_id: str) -> tuple[str, ...]:
+    """
+    Columns to write for a stats row. A delta-protocol turn (started from the server's state)
+    lists the columns it changed in "changed"; they are all that's sent for a player already
+    written. Rows without "changed" (stats sent by the client) write every column present.
+    """
+    present = tuple(c for c in PLAYER_STATS_COLUMNS if c in stats)
+    changed = stats.get("changed")
+    if changed is None:
+        return present
+    with _known_lock:
+        known = player_id in _known_players
+    return tuple(c for c in present if c in changed) if known else present
+
+
+def _player_stats_value(stats: dict[str, Any], column: str) -> Any:
+    if column == "inventory":
+        items = stats.get("inventory")
+        return json.dumps(inventory.counts(items)) if items is not None else None
+    return stats.get(column)
+
+
+def _remember_players(player_ids: Iterable[str]) -> None:
+    with _known_lock:
+        for player_id in player_ids:
+            _known_players[player_id] = None
+            _known_players.move_to_end(player_id)
+        while len(_known_players) > _KNOWN_PLAYERS_MAX:
+            _known_players.popitem(last=False)
+
+
+def _merge_stats_rows(older: dict[str, Any], newer: dict[str, Any]) -> dict[str, Any]:
+    """Coalesce two pending PLAYER_STATS rows for a player: newer values win, changed columns add up."""
+    merged = {**older, **newer}
+    if older.get("changed") is None or newer.get("changed") is None:
+        merged.pop("changed", None)
+    else:
+        merged["changed"] = list(dict.fromkeys([*older["changed"], *newer["changed"]]))
+    return merged
+
+
+def update_player_stats_bulk(rows: list[dict[str, Any]]) -> None:
+    """
+    Upsert several players' stats, touching only the columns that changed.
+    Each row is a stats dict as accepted by update_player_stats, optionally with "changed" (the
+    columns its turn changed; see _player_stats_columns). If a player_id appears more than once
+    the rows are coalesced, newest values winning. Rows are grouped by column set and each group
+    is one multi-row MERGE, so a turn that only changed gold sends and updates only gold; rows
+    with nothing to write are skipped. New players get defaults for columns not sent.
+    """
+    by_player: dict[str, dict[str, Any]] = {}
+    for stats in rows:
+        if stats:
+            player_id = stats.get("player_id") or "default"
+            by_player[player_id] = _merge_stats_rows(by_player[player_id], stats) if player_id in by_player else stats
+    groups: dict[tuple[str, ...], list[tuple]] = {}
+    for player_id, stats in by_player.items():
+        columns = _player_stats_columns(stats, player_id)
+        if columns:
+            groups.setdefault(columns, []).append((player_id, *(_player_stats_value(stats, c) for c in columns)))
+    if not groups:
+        return
     conn = None
+    failed = None
     try:
         conn = get_connection()
         cur = conn.cursor()
-        # Adjust table/column names to match your schema
-        cur.execute(
-            """
-            SELECT name, type, hp, ac, description
-            FROM COMPENDIUM
-            WHERE UPPER(TRIM(name)) = UPPER(TRIM(%s))
-            LIMIT 1
-            """,
-            (name.strip(),),
-        )
-        row = cur.fetchone()
+        for columns, params in groups.items():
+            _execute(cur, "player_stats_write", _player_stats_merge_sql(columns, len(params)),
+                     tuple(v for row in params for v in row))
+        conn.commit()
         cur.close()
-        if row is None:
-            return None
-        return {
-            "name": row[0],
-            "type": row[1],
-            "hp": row[2],
-            "ac": row[3],
-            "description": row[4] or "",
-        }
-    except Exception:
-        return None
-    finally:
+    except Exception as exc:
+        failed = exc
         if conn:
             try:
-                conn.close()
+                conn.rollback()
             except Exception:
                 pass
+        raise
+    finally:
+        if conn:
+            _release_connection(conn, failed)
+    _remember_players(p for params in groups.values() for p, *_ in params)
+
+
+def _player_stats_merge_sql(columns: tuple[str, ...], n_rows: int) -> str:
+    """MERGE INTO PLAYER_STATS for n_rows rows of (player_id, *columns); other columns are left alone."""
+    source = ", ".join(
+        ["column1::string AS player_id"]
+        + [f"column{i}{_PLAYER_STATS_CASTS[c]} AS {c}" for i, c in enumerate(columns, 2)]
+    )
+    values = ", ".join(["(" + ", ".join(["%s"] * (len(columns) + 1)) + ")"] * n_rows)
+
+    def value(c: str, current: str) -> str:
+        if c == "inventory":
+            return f"COALESCE(PARSE_JSON(s.inventory), {current})"
+        return f"COALESCE(s.{c}, {current})"
+
+    updates = ",\n                ".join(f"{c} = {value(c, 't.' + c)}" for c in columns)
+    inserts = ", ".join(
+        value(c, _PLAYER_STATS_DEFAULTS[c]) if c in columns else _PLAYER_STATS_DEFAULTS[c] for c in PLAYER_STATS_COLUMNS
+    )
+    # Adjust table/column names to match your schema
+    return f"""
+            MERGE INTO PLAYER_STATS AS t
+            USING (
+                SELECT {source}
+                FROM VALUES {values}
+            ) AS s
+            ON t.player_id = s.player_id
+            WHEN MATCHED THEN UPDATE SET
+                {updates},
+                updated_at = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT (player_id, hp, gold, xp, inventory, updated_at)
+            VALUES (s.player_id, {inserts}, CURRENT_TIMESTAMP())
+            """
 
 
 def update_player_stats(stats: dict[str, Any]) -> None:
     """
     Update player stats in Snowflake (HP, gold, XP, inventory).
-    stats: dict with keys hp, gold, xp, inventory (list of strings).
-    Uses player_id from stats if present; otherwise updates a default row.
+    stats: dict with keys hp, gold, xp, inventory (list of item strings or {item: count}; stored
+    as {item: count}). Missing keys are left as they are. Uses player_id from stats if present; otherwise updates a default row.
+    Runs synchronously; see queue_player_stats for the write-behind path.
+    """
+    if not stats:
+        return
+    update_player_stats_bulk([stats])
+
+
+def _player_stats_writer() -> WriteBehindQueue:
+    """Return the process-wide PLAYER_STATS write-behind queue, creating it on first use."""
+    global _stats_writer
+    if _stats_writer is None:
+        with _pool_lock:
+            if _stats_writer is None:
+                _stats_writer = WriteBehindQueue(
+                    update_player_stats_bulk,
+                    key_fn=lambda stats: stats.get("player_id") or "default",
+                    merge_fn=_merge_stats_rows,
+                    max_batch=int(_env_float("PLAYER_STATS_FLUSH_BATCH", 50)),
+                    flush_interval=_env_float("PLAYER_STATS_FLUSH_INTERVAL", 1.0),
+                    name="player-stats-writer",
+                )
+                atexit.register(_stats_writer.close)
+    return _stats_writer
+
+
+def queue_player_stats(stats: dict[str, Any]) -> None:
+    """
+    Queue a PLAYER_STATS upsert and return immediately. Pending updates are coalesced per
+    player_id (newest wins) and written in batches by a background thread, on
+    PLAYER_STATS_FLUSH_BATCH pending players or after PLAYER_STATS_FLUSH_INTERVAL seconds.
     """
     if not stats:
         return
+    _player_stats_writer().put(dict(stats))
+
+
+def flush_player_stats(timeout: float | None = None) -> bool:
+    """Block until queued player stats are written. Returns False on timeout."""
+    if _stats_writer is None:
+        return True
+    return _stats_writer.flush(timeout)
+
+
+def player_stats_writer_stats() -> dict[str, Any]:
+    """Write-behind counters (enqueued, coalesced, written, batches, failed_batches, pending)."""
+    if _stats_writer is None:
+        return {"enqueued": 0, "coalesced": 0, "written": 0, "batches": 0, "failed_batches": 0, "pending": 0}
+    return _stats_writer.stats()
+
+
+GAME_HISTORY_MIGRATION = (
+    "ALTER TABLE GAME_HISTORY ADD COLUMN IF NOT EXISTS turn_id STRING",
+    "ALTER TABLE GAME_HISTORY ADD COLUMN IF NOT EXISTS created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()",
+)
+
+
+def ensure_game_history_schema() -> bool:
+    """
+    Add the turn_id and created_at columns upload_game_history needs to GAME_HISTORY (a no-op
+    once they exist). False, logged, if the table can't be migrated (e.g. no ALTER privilege);
+    connection errors are raised so the caller can retry.
+    """
+    conn = get_connection()  # can't connect: raised, like any upload failure
+    failed = None
+    try:
+        cur = conn.cursor()
+        for sql in GAME_HISTORY_MIGRATION:
+            _execute(cur, "game_history_migrate", sql)
+        cur.close()
+        return True
+    except Exception as exc:
+        failed = exc
+        if _connection_broken(exc):
+            raise
+        logger.error("could not add turn_id/created_at to GAME_HISTORY; run the ALTER TABLEs in README.md", exc_info=True)
+        return False
+    finally:
+        _release_connection(conn, failed)
+
+
+def upload_game_history(records: list[dict[str, Any]]) -> None:
+    """
+    Insert journaled turns (turn_journal records) into GAME_HISTORY with a single multi-row
+    MERGE on turn_id, so uploading the same records again inserts nothing.
+    """
+    by_turn: dict[str, tuple] = {}
+    for r in records:
+        by_turn[r["turn_id"]] = (
+            r["turn_id"], r.get("player_id") or "default", r.get("action"), r.get("narrative"),
+            json.dumps(r.get("stats") or {}), r.get("ts") or time.time(),
+        )
+    if not by_turn:
+        return
     conn = None
+    failed = None
     try:
         conn = get_connection()
         cur = conn.cursor()
-        player_id = stats.get("player_id") or "default"
-        hp = stats.get("hp")
-        gold = stats.get("gold")
-        xp = stats.get("xp")
-        inventory = stats.get("inventory")
-        if inventory is not None and not isinstance(inventory, list):
-            inventory = [inventory] if inventory else []
-        inv_json = json.dumps(inventory) if inventory is not None else "[]"
-
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(by_turn))
         # Adjust table/column names to match your schema
-        cur.execute(
-            """
-            MERGE INTO PLAYER_STATS AS t
-            USING (SELECT %s AS player_id) AS s
-            ON t.player_id = s.player_id
-            WHEN MATCHED THEN UPDATE SET
-                hp = COALESCE(%s, t.hp),
-                gold = COALESCE(%s, t.gold),
-                xp = COALESCE(%s, t.xp),
-                inventory = COALESCE(PARSE_JSON(%s), t.inventory),
-                updated_at = CURRENT_TIMESTAMP()
-            WHEN NOT MATCHED THEN INSERT (player_id, hp, gold, xp, inventory, updated_at)
-            VALUES (%s, COALESCE(%s, 100), COALESCE(%s, 0), COALESCE(%s, 0), PARSE_JSON(%s), CURRENT_TIMESTAMP())
+        _execute(
+            cur,
+            "game_history_merge",
+            f"""
+            MERGE INTO GAME_HISTORY AS t
+            USING (
+                SELECT column1::string AS turn_id, column2::string AS player_name, column3::string AS action,
+                       column4::string AS narrative, column5::string AS stats, column6::float AS ts
+                FROM VALUES {values}
+            ) AS s
+            ON t.turn_id = s.turn_id
+            WHEN NOT MATCHED THEN INSERT (turn_id, player_name, action, narrative, stats, created_at)
+            VALUES (s.turn_id, s.player_name, s.action, s.narrative, PARSE_JSON(s.stats),
+                    TO_TIMESTAMP_NTZ(s.ts))
             """,
-            (player_id, hp, gold, xp, inv_json, player_id, hp, gold, xp, inv_json),
+            tuple(v for params in by_turn.values() for v in params),
         )
         conn.commit()
         cur.close()
-    except Exception:
+    except Exception as exc:
+        failed = exc
         if conn:
             try:
                 conn.rollback()
@@ -120,10 +721,7 @@ def update_player_stats(stats: dict[str, Any]) -> None:
         raise
     finally:
         if conn:
-            try:
-                conn.close()
-            except Exception:
-                pass
+            _release_connection(conn, failed)
 
 
 def save_game_turn(
@@ -131,17 +729,28 @@ def save_game_turn(
     action: str,
     narrative: str,
     stats: dict[str, Any],
-) -> None:
+) -> str | None:
     """
-    Insert a new row into GAME_HISTORY for this turn.
-    stats is serialized with json.dumps() and stored in a VARIANT column.
+    Record this turn in GAME_HISTORY. stats is stored in a VARIANT column.
+    With the turn journal on (default) the turn is appended locally and uploaded in bulk
+    later; returns its turn_id (see turn_journal.TurnJournal.is_synced). With
+    TURN_JOURNAL_ENABLED=0 the row is inserted right away and None is returned.
     """
+    import turn_journal
+
+    journal = turn_journal.get_journal()
+    if journal is not None:
+        return journal.append(player_name, action, narrative, stats)
+
     conn = None
+    failed = None
     try:
         conn = get_connection()
         cur = conn.cursor()
         stats_json = json.dumps(stats) if stats is not None else "{}"
-        cur.execute(
+        _execute(
+            cur,
+            "game_history_write",
             """
             INSERT INTO GAME_HISTORY (player_name, action, narrative, stats)
             VALUES (%s, %s, %s, PARSE_JSON(%s))
@@ -150,53 +759,156 @@ def save_game_turn(
         )
         conn.commit()
         cur.close()
-    except Exception:
+    except Exception as exc:
+        failed = exc
         if conn:
             try:
                 conn.rollback()
             except Exception:
                 pass
         raise
+    finally:
+        if conn:
+            _release_connection(conn, failed)
+    return None
+
+
+def fetch_game_history(limit: int = 1000) -> list[dict[str, Any]]:
+    """
+    The newest `limit` GAME_HISTORY turns, oldest first, as {player_name, action, created_at}
+    (used by bench/replay_load.py to replay recorded sessions).
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        _execute(
+            cur,
+            "game_history_read",
+            "SELECT player_name, action, created_at FROM GAME_HISTORY ORDER BY created_at DESC LIMIT %s",
+            (int(limit),),
+        )
+        rows = cur.fetchall()
+        cur.close()
     finally:
         if conn:
             try:
                 conn.close()
             except Exception:
                 pass
+    return [{"player_name": r[0], "action": r[1], "created_at": r[2]} for r in reversed(rows)]
 
 
 def fetch_monster_stats(monster_name):
     """
     Searches Snowflake for a monster and returns its stats.
     Using 'ILIKE' makes it find 'Goblin' even if the player types 'goblin'.
+    Results (including misses) are served from the monster stats cache when possible.
     """
-    conn = get_connection() # Uses your existing connection logic
-    cursor = conn.cursor()
-    
-    query = """
-    SELECT 
-        DATA:name::string as name,
-        DATA:hit_points::int as hp,
-        DATA:armor_class[0].value::int as ac,
-        DATA:type::string as type,
-        DATA:special_abilities::variant as abilities
-    FROM MONSTERS
-    WHERE DATA:name::string ILIKE %s
-    LIMIT 1
-    """
-    
-    try:
-        cursor.execute(query, (f"%{monster_name}%",))
-        result = cursor.fetchone()
-        if result:
-            return {
-                "name": result[0],
-                "hp": result[1],
-                "ac": result[2],
-                "type": result[3],
-                "abilities": result[4]
-            }
+    if not monster_name or not str(monster_name).strip():
         return None
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+    return fetch_monsters_bulk([monster_name]).get(monster_name)
+
+
+def warm_compendium_cache() -> dict[str, int]:
+    """
+    Load every COMPENDIUM and MONSTERS row (from the compendium backend) into memory so
+    lookups don't hit it.
+    While the snapshot is fresh (COMPENDIUM_CACHE_TTL), misses are answered locally too.
+    Also installs an entity_matcher built from the loaded names.
+    Returns row counts loaded per table.
+    """
+    backend = compendium_backend.get_backend()
+    compendium = backend.export_compendium()
+    monsters = backend.export_monsters()
+    for row in compendium:
+        if row["name"]:
+            _compendium_cache.set(_cache_key(str(row["name"])), row)
+    for row in monsters:
+        if row["name"]:
+            _monster_stats_cache.set(_cache_key(str(row["name"])), row)
+    with _warm_lock:
+        _warm["monsters"] = monsters
+        _warm["loaded_at"] = time.monotonic()
+    entity_matcher.set_matcher(entity_matcher.EntityMatcher.from_rows(compendium, monsters))
+    return {"compendium": len(compendium), "monsters": len(monsters)}
+
+
+def load_entity_matcher() -> entity_matcher.EntityMatcher | None:
+    """
+    The installed entity matcher, built from the compendium backend's names (the SQLite mirror
+    or one export query per table) on first use if warm_compendium_cache() hasn't installed one.
+    Concurrent first callers share one build. If it fails, returns None (dm_agent guesses words)
+    and doesn't try again for ENTITY_MATCHER_RETRY_SECONDS.
+    """
+    global _matcher_retry_at
+    matcher = entity_matcher.get_matcher()
+    if matcher is not None:
+        return matcher
+    with _matcher_lock:
+        matcher = entity_matcher.get_matcher()
+        if matcher is not None or time.monotonic() < _matcher_retry_at:
+            return matcher
+        try:
+            backend = compendium_backend.get_backend()
+            matcher = entity_matcher.EntityMatcher.from_rows(backend.export_compendium(), backend.export_monsters())
+        except Exception:
+            logger.warning(
+                "building the entity matcher failed; guessing search terms for %.0fs",
+                ENTITY_MATCHER_RETRY_SECONDS,
+                exc_info=True,
+            )
+            _matcher_retry_at = time.monotonic() + ENTITY_MATCHER_RETRY_SECONDS
+            return None
+        entity_matcher.set_matcher(matcher)
+        return matcher
+
+
+def cache_stats() -> dict[str, Any]:
+    """Hit/miss/eviction counters for the compendium and monster stats caches."""
+    return {
+        "compendium": _compendium_cache.stats(),
+        "monster_stats": _monster_stats_cache.stats(),
+        "warm_loaded": _warm_snapshot_fresh(),
+    }
+
+
+def clear_caches() -> None:
+    """Drop all cached lookups, any warm-loaded snapshot and the entity matcher built from it."""
+    global _matcher_retry_at
+    _compendium_cache.clear()
+    _monster_stats_cache.clear()
+    with _warm_lock:
+        _warm["monsters"] = []
+        _warm["loaded_at"] = None
+    entity_matcher.set_matcher(None)
+    _matcher_retry_at = 0.0
+
+
+def _pool_gauge() -> dict[tuple[str], int]:
+    pool = _pool  # don't create a pool just to report on it
+    if pool is None:
+        return {}
+    s = pool.stats()
+    return {("in_use",): s["in_use"], ("idle",): s["idle"], ("size",): s["size"]}
+
+
+metrics.gauge("snowflake_pool_connections", "Pooled Snowflake sessions by state", _pool_gauge, ["state"])
+metrics.gauge(
+    "player_stats_pending_writes",
+    "PLAYER_STATS rows waiting for the write-behind flush",
+    lambda: player_stats_writer_stats()["pending"],
+)
+
+
+def _cache_events() -> dict[tuple[str, str], int]:
+    out = {}
+    for cache, s in (("compendium", _compendium_cache.stats()), ("monster_stats", _monster_stats_cache.stats())):
+        for event in ("hits", "negative_hits", "misses", "evictions", "expirations"):
+            out[(cache, event)] = s[event]
+    return out
+
+
+metrics.gauge(
+    "compendium_cache_events_total", "Compendium lookup cache events", _cache_events, ["cache", "event"], kind="counter"
+)
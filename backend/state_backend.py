@@ -0,0 +1,767 @@
+"""
+Shared session state for running several API workers (processes or machines) at once.
+
+session_store.SessionStore keeps characters, logs and locks inside one process, so a
+second gunicorn worker would see different characters and could run two turns for the
+same player at once. The StateStore implementations here keep that state outside the
+process instead:
+
+  - SQLiteStateStore: one SQLite file in WAL mode, shared by every worker on one
+    machine. Writes are short BEGIN IMMEDIATE transactions; readers never block.
+  - RedisStateStore: a Redis server (or anything speaking its protocol), shared by
+    workers on any number of machines. Character updates are optimistic (WATCH/MULTI/EXEC);
+    idle sessions expire through key TTLs. Talks RESP over a plain socket, so no
+    client library is needed; bench/fake_redis.py is a local stand-in for tests.
+
+Both give every player a lock held for the whole turn (player_lock), so concurrent
+turns for one player, from any worker, run one after another. A lock expires after
+STATE_LOCK_TTL seconds in case its worker dies mid-turn; while the worker is alive, a
+heartbeat thread extends the locks it holds every STATE_LOCK_TTL / 3 seconds, so a slow
+turn (LLM retries can take minutes) keeps its lock.
+
+Conversation memory and admission control stay per process (see StateStore).
+
+Env vars:
+  STATE_BACKEND       memory (default; session_store.SessionStore), sqlite or redis
+  STATE_SQLITE_PATH   SQLite file (default state.sqlite next to this file)
+  STATE_REDIS_URL     redis://[:password@]host[:port][/db] (default redis://127.0.0.1:6379/0)
+  STATE_LOCK_TIMEOUT  seconds a turn waits for the player's lock before a 429 (default 30)
+  STATE_LOCK_TTL      seconds before an abandoned (no longer renewed) lock expires (default 120)
+  SESSION_LOG_LIMIT, SESSION_TTL, SESSION_MAX, SESSION_SHARDS  as in session_store.py
+"""
+
+import heapq
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+from urllib.parse import unquote, urlparse
+
+from session_store import (
+    DEFAULT_PLAYER_ID,
+    PlayerLock,
+    SessionStore,
+    StateStore,
+    VersionConflict,
+    _turn_stats,
+    merge_changes,
+    merge_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = str(Path(__file__).resolve().parent / "state.sqlite")
+DEFAULT_REDIS_URL = "redis://127.0.0.1:6379/0"
+SWEEP_INTERVAL = 60.0  # seconds between TTL / max_sessions sweeps per process
+
+
+class _SharedLock(PlayerLock):
+    """A player lock kept in the shared store: polled with backoff until taken or timed out."""
+
+    def __init__(self, store: "_SharedStore", player_id: str, timeout: float):
+        super().__init__(player_id, timeout)
+        self._store = store
+        self._token = uuid.uuid4().hex
+
+    def _acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while not self._store._try_lock(self.player_id, self._token):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.1)
+        self._store._hold(self._token, self.player_id)
+        return True
+
+    def _release(self) -> None:
+        if not self._store._drop(self._token):
+            logger.warning("state lock for %s expired during the turn; another turn may have run alongside", self.player_id)
+            return
+        try:
+            released = self._store._unlock(self.player_id, self._token)
+        except Exception:
+            logger.warning("could not release state lock for %s; it expires on its own", self.player_id, exc_info=True)
+            return
+        if not released:
+            logger.warning("state lock for %s expired during the turn; another turn may have run alongside", self.player_id)
+
+
+class _SharedStore(StateStore):
+    """What the SQLite and Redis stores have in common: wall-clock TTLs, shared locks, periodic sweeps."""
+
+    def __init__(self, default_character: dict[str, Any], lock_ttl: float = 120.0, **kwargs: Any):
+        super().__init__(default_character, **kwargs)
+        self.lock_ttl = lock_ttl
+        self._swept_at = 0.0
+        self._sweep_lock = threading.Lock()
+        # token -> player_id of the locks this process holds, renewed by the heartbeat thread
+        self._held: dict[str, str] = {}
+        self._held_lock = threading.Lock()
+        self._heartbeat: threading.Thread | None = None
+
+    def player_lock(self, player_id: str | None, timeout: float | None = None) -> PlayerLock:
+        return _SharedLock(self, player_id or DEFAULT_PLAYER_ID, self.lock_timeout if timeout is None else timeout)
+
+    def _try_lock(self, player_id: str, token: str) -> bool:
+        raise NotImplementedError
+
+    def _renew(self, player_id: str, token: str) -> bool:
+        """Extend the lock to lock_ttl from now if token still holds it; False if it expired or was taken over."""
+        raise NotImplementedError
+
+    def _unlock(self, player_id: str, token: str) -> bool:
+        """Delete the lock if token still holds it; False if it had expired (and maybe been taken over)."""
+        raise NotImplementedError
+
+    def _hold(self, token: str, player_id: str) -> None:
+        """Renew this lock until _drop(token); starts the heartbeat thread on first use."""
+        with self._held_lock:
+            self._held[token] = player_id
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew_held, name="state-lock-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _drop(self, token: str) -> bool:
+        """Stop renewing; False if the heartbeat already found the lock lost."""
+        with self._held_lock:
+            return self._held.pop(token, None) is not None
+
+    def _renew_held(self) -> None:
+        while True:
+            time.sleep(self.lock_ttl / 3)
+            with self._held_lock:
+                held = list(self._held.items())
+            for token, player_id in held:
+                try:
+                    renewed = self._renew(player_id, token)
+                except Exception:
+                    logger.warning("could not renew state lock for %s", player_id, exc_info=True)
+                    continue
+                if not renewed:
+                    with self._held_lock:
+                        lost = self._held.pop(token, None) is not None
+                    if lost:
+                        logger.warning("state lock for %s expired before it could be renewed", player_id)
+
+    def _maybe_sweep(self) -> None:
+        """evict_expired() at most every SWEEP_INTERVAL seconds (best effort)."""
+        with self._sweep_lock:
+            now = time.monotonic()
+            if now - self._swept_at < SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+        try:
+            self.evict_expired()
+        except Exception:
+            logger.warning("state sweep failed", exc_info=True)
+
+    def state(self, player_id: str | None, expected_version: int | None = None) -> tuple[dict[str, Any], int]:
+        character, version = self._read_character(player_id or DEFAULT_PLAYER_ID)
+        stats = _turn_stats(character)
+        if expected_version is not None and expected_version != version:
+            raise VersionConflict(version, stats)
+        return stats, version
+
+    def _read_character(self, player_id: str) -> tuple[dict[str, Any], int]:
+        """(character, state version) without creating or touching the session."""
+        raise NotImplementedError
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    player_id TEXT PRIMARY KEY, data TEXT NOT NULL, state_version INTEGER NOT NULL,
+    version INTEGER NOT NULL, last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_last_access ON characters (last_access);
+CREATE TABLE IF NOT EXISTS logs (seq INTEGER PRIMARY KEY AUTOINCREMENT, player_id TEXT NOT NULL, entry TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS logs_player ON logs (player_id, seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS locks (player_id TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('evictions', 0);
+"""
+
+
+class SQLiteStateStore(_SharedStore):
+    """
+    State in one SQLite file in WAL mode, for workers on one machine. Each thread keeps its
+    own connection; writes take the database write lock (BEGIN IMMEDIATE) for a few
+    statements, readers see the last commit without waiting. Log seq numbers come from
+    the logs table's AUTOINCREMENT key, so they increase across every worker.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, default_character: dict[str, Any], busy_timeout: float = 10.0, **kwargs: Any):
+        super().__init__(default_character, **kwargs)
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump(self, conn: sqlite3.Connection, key: str = "version", n: int = 1) -> int:
+        conn.execute("UPDATE meta SET value = value + ? WHERE key = ?", (n, key))
+        return conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _load(self, conn: sqlite3.Connection, player_id: str) -> tuple[dict[str, Any], int]:
+        """(character, state version) inside a write transaction; an expired session starts over."""
+        row = conn.execute(
+            "SELECT data, state_version, last_access FROM characters WHERE player_id = ?", (player_id,)
+        ).fetchone()
+        if row is not None and time.time() - row[2] <= self.ttl:
+            return json.loads(row[0]), row[1]
+        if row is not None:
+            self._delete(conn, [player_id])
+        return self._new_character(player_id), 0
+
+    def _save(self, conn: sqlite3.Connection, player_id: str, character: dict[str, Any], state_version: int) -> None:
+        conn.execute(
+            "INSERT INTO characters (player_id, data, state_version, version, last_access) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (player_id) DO UPDATE SET data = excluded.data, state_version = excluded.state_version, "
+            "version = excluded.version, last_access = excluded.last_access",
+            (player_id, json.dumps(character), state_version, self._bump(conn), time.time()),
+        )
+
+    def _delete(self, conn: sqlite3.Connection, player_ids: list[str]) -> None:
+        for player_id in player_ids:
+            conn.execute("DELETE FROM logs WHERE player_id = ?", (player_id,))
+            conn.execute("DELETE FROM characters WHERE player_id = ?", (player_id,))
+        self._bump(conn, "evictions", len(player_ids))
+        self._bump(conn)
+
+    def _read_character(self, player_id: str) -> tuple[dict[str, Any], int]:
+        row = self._conn().execute(
+            "SELECT data, state_version FROM characters WHERE player_id = ? AND last_access >= ?",
+            (player_id, time.time() - self.ttl),
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (self._new_character(player_id), 0)
+
+    def update_character(self, player_id: str | None, stats: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        player_id = player_id or DEFAULT_PLAYER_ID
+        self._maybe_sweep()
+        with self._write() as conn:
+            character, state_version = self._load(conn, player_id)
+            merge_stats(character, stats)
+            self._save(conn, player_id, character, state_version + 1)
+        return character, state_version + 1
+
+    def apply_changes(self, player_id: str | None, changes: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        player_id = player_id or DEFAULT_PLAYER_ID
+        self._maybe_sweep()
+        with self._write() as conn:
+            character, state_version = self._load(conn, player_id)
+            if merge_changes(character, changes):
+                state_version += 1
+                self._save(conn, player_id, character, state_version)
+        return character, state_version
+
+    def append_logs(self, player_id: str | None, entries: list[dict[str, Any]]) -> None:
+        player_id = player_id or DEFAULT_PLAYER_ID
+        self._maybe_sweep()
+        with self._write() as conn:
+            character, state_version = self._load(conn, player_id)
+            conn.executemany(
+                "INSERT INTO logs (player_id, entry) VALUES (?, ?)",
+                [(player_id, json.dumps(entry)) for entry in entries],
+            )
+            conn.execute(
+                "DELETE FROM logs WHERE player_id = ? AND seq <= "
+                "(SELECT seq FROM logs WHERE player_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (player_id, player_id, self.log_limit),
+            )
+            self._save(conn, player_id, character, state_version)
+
+    def mark_synced(self, player_id: str | None, turn_ids: Iterable[str]) -> int:
+        player_id = player_id or DEFAULT_PLAYER_ID
+        turn_ids = set(turn_ids)
+        updates = []
+        with self._write() as conn:
+            for seq, raw in conn.execute("SELECT seq, entry FROM logs WHERE player_id = ?", (player_id,)).fetchall():
+                entry = json.loads(raw)
+                if entry.get("turnId") in turn_ids and not entry.get("isSnowflakeSynced"):
+                    entry["isSnowflakeSynced"] = True
+                    updates.append((json.dumps(entry), seq))
+            if updates:
+                conn.executemany("UPDATE logs SET entry = ? WHERE seq = ?", updates)
+                conn.execute("UPDATE characters SET version = ? WHERE player_id = ?", (self._bump(conn), player_id))
+        return len(updates)
+
+    def characters(self, player_id: str | None = None) -> list[dict[str, Any]]:
+        sql = "SELECT data, state_version FROM characters WHERE last_access >= ?"
+        params: tuple = (time.time() - self.ttl,)
+        if player_id is not None:
+            sql += " AND player_id = ?"
+            params += (player_id,)
+        rows = self._conn().execute(sql + " ORDER BY last_access", params).fetchall()
+        return [dict(json.loads(data), version=state_version) for data, state_version in rows]
+
+    def logs(
+        self,
+        player_id: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        sql = (
+            "SELECT l.seq, l.entry FROM logs l JOIN characters c ON c.player_id = l.player_id "
+            "WHERE c.last_access >= ? AND l.seq > ?"
+        )
+        params: tuple = (time.time() - self.ttl, since if since is not None else -1)
+        if player_id is not None:
+            sql += " AND l.player_id = ?"
+            params += (player_id,)
+        newest = since is None and limit is not None
+        sql += " ORDER BY l.seq DESC" if newest else " ORDER BY l.seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (max(0, limit),)
+        rows = self._conn().execute(sql, params).fetchall()
+        if newest:
+            rows.reverse()
+        return [dict(json.loads(entry), seq=seq) for seq, entry in rows]
+
+    def version(self, player_id: str | None = None) -> int:
+        conn = self._conn()
+        if player_id is None:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        row = conn.execute(
+            "SELECT version FROM characters WHERE player_id = ? AND last_access >= ?",
+            (player_id, time.time() - self.ttl),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def evict_expired(self) -> int:
+        """Drop sessions idle longer than ttl, then the least recently used beyond max_sessions."""
+        with self._write() as conn:
+            expired = [r[0] for r in conn.execute(
+                "SELECT player_id FROM characters WHERE last_access < ?", (time.time() - self.ttl,)
+            )]
+            excess = conn.execute("SELECT COUNT(*) FROM characters").fetchone()[0] - len(expired) - self.max_sessions
+            if excess > 0:
+                expired += [r[0] for r in conn.execute(
+                    "SELECT player_id FROM characters WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                    (time.time() - self.ttl, excess),
+                )]
+            if expired:
+                self._delete(conn, expired)
+            conn.execute("DELETE FROM locks WHERE expires_at < ?", (time.time(),))
+        return len(expired)
+
+    def stats(self) -> dict[str, Any]:
+        conn = self._conn()
+        cutoff = time.time() - self.ttl
+        sessions = conn.execute("SELECT COUNT(*) FROM characters WHERE last_access >= ?", (cutoff,)).fetchone()[0]
+        return {
+            "sessions": sessions,
+            "log_entries": conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0],
+            "evictions": conn.execute("SELECT value FROM meta WHERE key = 'evictions'").fetchone()[0],
+            "max_sessions": self.max_sessions,
+            "log_limit": self.log_limit,
+        }
+
+    def _try_lock(self, player_id: str, token: str) -> bool:
+        now = time.time()
+        with self._write() as conn:
+            conn.execute("DELETE FROM locks WHERE player_id = ? AND expires_at < ?", (player_id, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO locks (player_id, token, expires_at) VALUES (?, ?, ?)",
+                (player_id, token, now + self.lock_ttl),
+            )
+            return cur.rowcount == 1
+
+    def _renew(self, player_id: str, token: str) -> bool:
+        with self._write() as conn:
+            cur = conn.execute(
+                "UPDATE locks SET expires_at = ? WHERE player_id = ? AND token = ?",
+                (time.time() + self.lock_ttl, player_id, token),
+            )
+            return cur.rowcount == 1
+
+    def _unlock(self, player_id: str, token: str) -> bool:
+        with self._write() as conn:
+            cur = conn.execute("DELETE FROM locks WHERE player_id = ? AND token = ?", (player_id, token))
+            return cur.rowcount == 1
+
+
+class RedisError(Exception):
+    """An error reply from the server."""
+
+
+class _Resp:
+    """Minimal RESP2 client on one socket: commands go out as arrays of bulk strings."""
+
+    def __init__(self, host: str, port: int, password: str | None, db: int, timeout: float):
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if password:
+            self.call("AUTH", password)
+        if db:
+            self.call("SELECT", db)
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read(self) -> Any:
+        line = self._file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the state server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            return RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self._file.read(n + 2)[:-2].decode("utf-8")
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise ConnectionError(f"bad reply from the state server: {line!r}")
+
+    def pipeline(self, *commands: tuple) -> list[Any]:
+        """Send commands together and read every reply; raises the first error reply."""
+        self._sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def call(self, *args: Any) -> Any:
+        return self.pipeline(args)[0]
+
+
+KEY_PREFIX = "dm:"
+
+
+class RedisStateStore(_SharedStore):
+    """
+    State in Redis, for workers on several machines. Keys (all under KEY_PREFIX):
+      version, seq        store-wide change counter and log sequence (INCR)
+      char:<player>       JSON {character, state_version}; updated with WATCH/MULTI/EXEC
+      pver:<player>       store version of the player's last change
+      logs:<player>       list of JSON log entries, trimmed to log_limit
+      players             sorted set of player ids by last access (wall clock)
+      lock:<player>       turn lock token (SET NX PX lock_ttl, PEXPIREd by the heartbeat)
+    Per-player keys expire after ttl without a write, like idle sessions.
+    """
+
+    name = "redis"
+    CAS_RETRIES = 50
+
+    def __init__(self, url: str, default_character: dict[str, Any], socket_timeout: float = 5.0, **kwargs: Any):
+        super().__init__(default_character, **kwargs)
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"STATE_REDIS_URL must be redis://..., not {url!r}")
+        self._address = (parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.strip("/") or 0)
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+
+    def _client(self) -> _Resp:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = _Resp(*self._address, self._password, self._db, self.socket_timeout)
+            self._local.client = client
+        return client
+
+    def _run(self, fn: Callable[[_Resp], Any]) -> Any:
+        """fn(client); a broken connection is dropped (the next call reconnects) and the error re-raised."""
+        client = self._client()
+        try:
+            return fn(client)
+        except (OSError, ConnectionError):
+            self._local.client = None
+            client.close()
+            raise
+
+    def _call(self, *args: Any) -> Any:
+        return self._run(lambda client: client.call(*args))
+
+    def _pipeline(self, *commands: tuple) -> list[Any]:
+        return self._run(lambda client: client.pipeline(*commands))
+
+    def _ttl_ms(self) -> int:
+        return max(1, int(self.ttl * 1000))
+
+    def _touch_commands(self, player_id: str, version: int) -> list[tuple]:
+        ttl = self._ttl_ms()
+        return [
+            ("SET", f"{KEY_PREFIX}pver:{player_id}", version, "PX", ttl),
+            ("PEXPIRE", f"{KEY_PREFIX}char:{player_id}", ttl),
+            ("PEXPIRE", f"{KEY_PREFIX}logs:{player_id}", ttl),
+            ("ZADD", f"{KEY_PREFIX}players", repr(time.time()), player_id),
+        ]
+
+    def _parse(self, player_id: str, raw: str | None) -> tuple[dict[str, Any], int]:
+        if raw is None:
+            return self._new_character(player_id), 0
+        doc = json.loads(raw)
+        return doc["character"], doc["state_version"]
+
+    def _read_character(self, player_id: str) -> tuple[dict[str, Any], int]:
+        return self._parse(player_id, self._call("GET", f"{KEY_PREFIX}char:{player_id}"))
+
+    def _modify(
+        self, player_id: str | None, change: Callable[[dict[str, Any]], bool]
+    ) -> tuple[dict[str, Any], int]:
+        """Apply change(character) -> changed? with optimistic retries; returns (character, state version)."""
+        player_id = player_id or DEFAULT_PLAYER_ID
+        self._maybe_sweep()
+        key = f"{KEY_PREFIX}char:{player_id}"
+
+        def attempt(client: _Resp) -> tuple[dict[str, Any], int] | None:
+            client.call("WATCH", key)
+            character, state_version = self._parse(player_id, client.call("GET", key))
+            if not change(character):
+                client.call("UNWATCH")
+                return character, state_version
+            state_version += 1
+            version = client.call("INCR", f"{KEY_PREFIX}version")
+            doc = json.dumps({"character": character, "state_version": state_version})
+            replies = client.pipeline(
+                ("MULTI",), ("SET", key, doc), *self._touch_commands(player_id, version), ("EXEC",)
+            )
+            return (character, state_version) if replies[-1] is not None else None
+
+        for _ in range(self.CAS_RETRIES):
+            result = self._run(attempt)
+            if result is not None:
+                return result
+        raise RuntimeError(f"character update for {player_id} kept conflicting")
+
+    def update_character(self, player_id: str | None, stats: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        return self._modify(player_id, lambda character: merge_stats(character, stats) or True)
+
+    def apply_changes(self, player_id: str | None, changes: dict[str, Any]) -> tuple[dict[str, Any], int]:
+        return self._modify(player_id, lambda character: merge_changes(character, changes))
+
+    def append_logs(self, player_id: str | None, entries: list[dict[str, Any]]) -> None:
+        if not entries:
+            return
+        player_id = player_id or DEFAULT_PLAYER_ID
+        self._maybe_sweep()
+        last = self._call("INCRBY", f"{KEY_PREFIX}seq", len(entries))
+        version = self._call("INCR", f"{KEY_PREFIX}version")
+        first = last - len(entries) + 1
+        key = f"{KEY_PREFIX}logs:{player_id}"
+        self._pipeline(
+            ("MULTI",),
+            ("RPUSH", key, *[json.dumps(dict(entry, seq=first + i)) for i, entry in enumerate(entries)]),
+            ("LTRIM", key, -self.log_limit, -1),
+            *self._touch_commands(player_id, version),
+            ("EXEC",),
+        )
+
+    def mark_synced(self, player_id: str | None, turn_ids: Iterable[str]) -> int:
+        player_id = player_id or DEFAULT_PLAYER_ID
+        turn_ids = set(turn_ids)
+        key = f"{KEY_PREFIX}logs:{player_id}"
+
+        def attempt(client: _Resp) -> int | None:
+            client.call("WATCH", key)
+            updates = []
+            for i, raw in enumerate(client.call("LRANGE", key, 0, -1)):
+                entry = json.loads(raw)
+                if entry.get("turnId") in turn_ids and not entry.get("isSnowflakeSynced"):
+                    entry["isSnowflakeSynced"] = True
+                    updates.append(("LSET", key, i, json.dumps(entry)))
+            if not updates:
+                client.call("UNWATCH")
+                return 0
+            version = client.call("INCR", f"{KEY_PREFIX}version")
+            replies = client.pipeline(
+                ("MULTI",), *updates, ("SET", f"{KEY_PREFIX}pver:{player_id}", version, "XX", "KEEPTTL"), ("EXEC",)
+            )
+            return len(updates) if replies[-1] is not None else None
+
+        for _ in range(self.CAS_RETRIES):
+            result = self._run(attempt)
+            if result is not None:
+                return result
+        raise RuntimeError(f"log update for {player_id} kept conflicting")
+
+    def _live_players(self) -> list[str]:
+        """Player ids touched within ttl, least recently used first."""
+        return self._call("ZRANGEBYSCORE", f"{KEY_PREFIX}players", repr(time.time() - self.ttl), "+inf")
+
+    def characters(self, player_id: str | None = None) -> list[dict[str, Any]]:
+        if player_id is not None:
+            live = self._call("GET", f"{KEY_PREFIX}pver:{player_id}") is not None
+            players = [player_id] if live else []
+        else:
+            players = self._live_players()
+        if not players:
+            return []
+        raws = self._pipeline(*[("GET", f"{KEY_PREFIX}char:{p}") for p in players])
+        out = []
+        for p, raw in zip(players, raws):
+            character, state_version = self._parse(p, raw)
+            out.append(dict(character, version=state_version))
+        return out
+
+    def logs(
+        self,
+        player_id: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        players = [player_id] if player_id is not None else self._live_players()
+        if not players:
+            return []
+        lists = self._pipeline(*[("LRANGE", f"{KEY_PREFIX}logs:{p}", 0, -1) for p in players])
+        per_player = []
+        for raws in lists:
+            entries = [json.loads(raw) for raw in raws]
+            if since is not None:
+                entries = [e for e in entries if e["seq"] > since]
+            if entries:
+                per_player.append(entries)
+        merged = list(heapq.merge(*per_player, key=lambda entry: entry["seq"]))
+        if limit is not None:
+            merged = merged[:limit] if since is not None else merged[-limit:] if limit > 0 else []
+        return merged
+
+    def version(self, player_id: str | None = None) -> int:
+        key = f"{KEY_PREFIX}version" if player_id is None else f"{KEY_PREFIX}pver:{player_id}"
+        return int(self._call("GET", key) or 0)
+
+    def evict_expired(self) -> int:
+        """
+        Forget players idle longer than ttl (their keys have expired already), then drop the
+        least recently used beyond max_sessions.
+        """
+        players = f"{KEY_PREFIX}players"
+        expired, count = self._pipeline(
+            ("ZREMRANGEBYSCORE", players, "-inf", f"({time.time() - self.ttl!r}"),
+            ("ZCARD", players),
+        )
+        excess = count - self.max_sessions
+        if excess > 0:
+            victims = self._call("ZRANGE", players, 0, excess - 1)
+            if victims:
+                self._pipeline(
+                    *[("DEL", f"{KEY_PREFIX}{kind}:{p}") for p in victims for kind in ("char", "pver", "logs")],
+                    ("ZREM", players, *victims),
+                )
+                expired += len(victims)
+        if expired:
+            self._pipeline(("INCRBY", f"{KEY_PREFIX}evictions", expired), ("INCR", f"{KEY_PREFIX}version"))
+        return expired
+
+    def stats(self) -> dict[str, Any]:
+        sessions, evictions = self._pipeline(
+            ("ZCOUNT", f"{KEY_PREFIX}players", repr(time.time() - self.ttl), "+inf"),
+            ("GET", f"{KEY_PREFIX}evictions"),
+        )
+        return {
+            "sessions": sessions,
+            "evictions": int(evictions or 0),
+            "max_sessions": self.max_sessions,
+            "log_limit": self.log_limit,
+        }
+
+    def _try_lock(self, player_id: str, token: str) -> bool:
+        reply = self._call("SET", f"{KEY_PREFIX}lock:{player_id}", token, "NX", "PX", max(1, int(self.lock_ttl * 1000)))
+        return reply == "OK"
+
+    def _if_held(self, player_id: str, token: str, command: tuple) -> bool:
+        """Run command on the lock key in a transaction if token still holds the lock."""
+        key = f"{KEY_PREFIX}lock:{player_id}"
+
+        def attempt(client: _Resp) -> bool | None:
+            client.call("WATCH", key)
+            if client.call("GET", key) != token:
+                client.call("UNWATCH")  # expired, maybe taken over by someone else: not ours any more
+                return False
+            replies = client.pipeline(("MULTI",), command, ("EXEC",))
+            return True if replies[-1] is not None else None
+
+        for _ in range(self.CAS_RETRIES):
+            result = self._run(attempt)
+            if result is not None:
+                return result
+        return False
+
+    def _renew(self, player_id: str, token: str) -> bool:
+        return self._if_held(player_id, token, ("PEXPIRE", f"{KEY_PREFIX}lock:{player_id}", max(1, int(self.lock_ttl * 1000))))
+
+    def _unlock(self, player_id: str, token: str) -> bool:
+        return self._if_held(player_id, token, ("DEL", f"{KEY_PREFIX}lock:{player_id}"))
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def from_env(default_character: dict[str, Any], memory_factory: Callable[[], Any] | None = None) -> StateStore:
+    """The StateStore selected by STATE_BACKEND, configured from the env vars above."""
+    kind = os.environ.get("STATE_BACKEND", "memory").strip().lower()
+    common: dict[str, Any] = {
+        "log_limit": _env_int("SESSION_LOG_LIMIT", 200),
+        "ttl": _env_float("SESSION_TTL", 3600.0),
+        "max_sessions": _env_int("SESSION_MAX", 10000),
+        "memory_factory": memory_factory,
+        "lock_timeout": _env_float("STATE_LOCK_TIMEOUT", 30.0),
+    }
+    if kind == "memory":
+        return SessionStore(default_character, shards=_env_int("SESSION_SHARDS", 16), **common)
+    lock_ttl = _env_float("STATE_LOCK_TTL", 120.0)
+    if kind == "sqlite":
+        path = os.environ.get("STATE_SQLITE_PATH") or DEFAULT_SQLITE_PATH
+        return SQLiteStateStore(path, default_character, lock_ttl=lock_ttl, **common)
+    if kind == "redis":
+        url = os.environ.get("STATE_REDIS_URL") or DEFAULT_REDIS_URL
+        return RedisStateStore(url, default_character, lock_ttl=lock_ttl, **common)
+    raise ValueError(f"unknown STATE_BACKEND: {kind!r}")
@@ -0,0 +1,24 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def snowflake(tmp_path):
+    """snowflake_db pointed at a fresh bench/fake_snowflake fixture; yields the SQLite path."""
+    import snowflake_db
+    from bench import fake_snowflake
+
+    path = str(tmp_path / "snowflake.sqlite")
+    fake_snowflake.create_fixture(path)
+    fake_snowflake.install(path)
+    fake_snowflake.reset_stats()
+    snowflake_db._known_players.clear()
+    yield path
+    snowflake_db.set_connection_factory(None)
+    snowflake_db.clear_caches()
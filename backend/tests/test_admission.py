@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Rejected
+
+
+def _queued(controller, n):
+    deadline = time.monotonic() + 5
+    while controller.stats()["queued"] < n and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert controller.stats()["queued"] == n
+
+
+def test_admits_up_to_max_concurrency_then_frees_slots():
+    controller = AdmissionController(max_concurrency=2, max_queue=0)
+    a, b = controller.acquire("a"), controller.acquire("b")
+    with pytest.raises(Rejected) as info:
+        controller.acquire("c")
+    assert (info.value.status, info.value.reason) == (503, "queue_full")
+    assert info.value.retry_after >= 1
+    a.release()
+    a.release()  # safe twice
+    with controller.acquire("c"):
+        assert controller.stats()["in_flight"] == 2
+    b.release()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_one_turn_per_player():
+    controller = AdmissionController(max_concurrency=4)
+    with controller.acquire("a"):
+        with pytest.raises(Rejected) as info:
+            controller.acquire("a")
+        assert (info.value.status, info.value.reason) == (429, "player_busy")
+        controller.acquire(None).release()  # anonymous turns aren't tracked per player
+    controller.acquire("a").release()
+
+
+def test_queued_turns_are_admitted_in_order():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+    first = controller.acquire("a")
+    order = []
+
+    def wait(player_id):
+        ticket = controller.acquire(player_id)
+        order.append(player_id)
+        ticket.release()
+
+    threads = []
+    for n, player_id in enumerate(["b", "c", "d"], 1):
+        threads.append(threading.Thread(target=wait, args=(player_id,)))
+        threads[-1].start()
+        _queued(controller, n)
+    first.release()
+    for t in threads:
+        t.join()
+    assert order == ["b", "c", "d"]
+    assert (controller.stats()["in_flight"], controller.stats()["queued"]) == (0, 0)
+
+
+def test_queue_timeout_rejects_and_leaves_no_trace():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+    with controller.acquire("a"):
+        with pytest.raises(Rejected) as info:
+            controller.acquire("b")
+        assert (info.value.status, info.value.reason) == (503, "queue_timeout")
+        assert controller.stats()["queued"] == 0
+    controller.acquire("b").release()  # b is no longer marked busy
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_acquire_many_is_all_or_nothing():
+    controller = AdmissionController(max_concurrency=4)
+    busy = controller.acquire("c")
+    with pytest.raises(Rejected):
+        controller.acquire_many(["a", "b", "c"])
+    assert controller.stats()["in_flight"] == 1
+    busy.release()
+    ticket = controller.acquire_many(["a", "b", "c"])
+    assert controller.stats()["in_flight"] == 3
+    with pytest.raises(Rejected):
+        controller.acquire("b")
+    ticket.release()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_acquire_many_takes_its_slots_together():
+    controller = AdmissionController(max_concurrency=3, max_queue=4, queue_timeout=5)
+    held = [controller.acquire("x"), controller.acquire("y")]
+    admitted = []
+
+    def party(player_ids):
+        ticket = controller.acquire_many(player_ids)
+        admitted.append(player_ids)
+        ticket.release()
+
+    threads = [threading.Thread(target=party, args=(ids,)) for ids in (["a", "b"], ["c", "d"])]
+    for n, t in enumerate(threads, 1):
+        t.start()
+        _queued(controller, n)
+    # One slot is free, but neither party holds it while waiting for a second one
+    assert controller.stats()["in_flight"] == 2
+    for ticket in held:
+        ticket.release()
+    for t in threads:
+        t.join()
+    assert admitted == [["a", "b"], ["c", "d"]]
+    assert (controller.stats()["in_flight"], controller.stats()["queued"]) == (0, 0)
+
+
+def test_party_larger_than_max_concurrency_is_admitted():
+    controller = AdmissionController(max_concurrency=2, max_queue=4, queue_timeout=5)
+    with controller.acquire_many(["a", "b", "c", "d"]):
+        assert controller.stats()["in_flight"] == 2
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_disabled_controller_admits_everything():
+    controller = AdmissionController(max_concurrency=0)
+    tickets = [controller.acquire("a") for _ in range(3)]
+    for ticket in tickets:
+        ticket.release()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_async_waiter_is_woken_by_a_thread_release():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+    held = controller.acquire("a")
+
+    async def main():
+        task = asyncio.ensure_future(controller.aacquire("b"))
+        await asyncio.sleep(0)
+        _queued(controller, 1)
+        threading.Timer(0.02, held.release).start()
+        ticket = await task
+        assert controller.stats()["in_flight"] == 1
+        ticket.release()
+
+    asyncio.run(main())
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_cancelled_async_waiter_gives_up_its_place():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+    held = controller.acquire("a")
+
+    async def main():
+        task = asyncio.ensure_future(controller.aacquire("b"))
+        await asyncio.sleep(0)
+        _queued(controller, 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert controller.stats()["queued"] == 0
+    held.release()
+    assert controller.stats()["in_flight"] == 0
+    controller.acquire("b").release()
+
+
+def test_anonymous_turns_are_admitted_as_the_default_player(monkeypatch):
+    import app
+
+    controller = AdmissionController(max_concurrency=4)
+    monkeypatch.setattr(app, "admission", controller)
+    with app._admit([None]):
+        with pytest.raises(Rejected) as info:
+            app._admit([None])  # would otherwise hold a slot while it waits on the "default" lock
+        assert info.value.reason == "player_busy"
+        assert controller.stats()["in_flight"] == 1
+    assert controller.stats()["in_flight"] == 0
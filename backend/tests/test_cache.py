@@ -0,0 +1,58 @@
+import time
+
+import snowflake_db
+from bench import fake_snowflake
+from cache import MISSING, TTLCache
+
+
+def test_hits_misses_and_negative_entries():
+    cache = TTLCache()
+    assert cache.get("goblin") is MISSING
+    cache.set("goblin", {"hp": 7})
+    cache.set("sword", None)
+    assert cache.get("goblin") == {"hp": 7}
+    assert cache.get("sword") is None  # known absent, not MISSING
+    stats = cache.stats()
+    assert (stats["hits"], stats["negative_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 2 / 3
+
+
+def test_negative_entries_expire_on_their_own_ttl():
+    cache = TTLCache(ttl=60, negative_ttl=0.05)
+    cache.set("goblin", {"hp": 7})
+    cache.set("sword", None)
+    time.sleep(0.1)
+    assert cache.get("sword") is MISSING
+    assert cache.get("goblin") == {"hp": 7}
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 1
+
+
+def test_explicit_ttl_and_non_positive_ttl():
+    cache = TTLCache(ttl=60)
+    cache.set("orc", {"hp": 15}, ttl=0.05)
+    cache.set("troll", {"hp": 84}, ttl=0)  # not stored at all
+    assert cache.get("troll") is MISSING
+    time.sleep(0.1)
+    assert cache.get("orc") is MISSING
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_miss_is_queried_again(snowflake, monkeypatch):
+    monkeypatch.setattr(snowflake_db._compendium_cache, "negative_ttl", 0.05)
+    assert snowflake_db.fetch_compendium_bulk(["Vorpal Sword"]) == {"Vorpal Sword": None}
+    snowflake_db.fetch_compendium_bulk(["Vorpal Sword"])
+    assert fake_snowflake.stats()["by_kind"] == {"compendium_lookup": 1}
+    time.sleep(0.1)
+    snowflake_db.fetch_compendium_bulk(["Vorpal Sword"])
+    assert fake_snowflake.stats()["by_kind"] == {"compendium_lookup": 2}
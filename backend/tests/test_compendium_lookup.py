@@ -0,0 +1,44 @@
+import snowflake_db
+from bench import fake_snowflake
+
+
+def test_monster_lookup_failure_returns_misses_and_caches_nothing(snowflake, monkeypatch):
+    def broken(keys):
+        raise ConnectionResetError("snowflake went away")
+
+    monkeypatch.setattr(snowflake_db, "_lookup_monsters_by_key", broken)
+    assert snowflake_db.fetch_monsters_bulk(["goblin", "troll"]) == {"goblin": None, "troll": None}
+    monkeypatch.undo()
+    # The failure wasn't remembered as "not found"
+    assert snowflake_db.fetch_monsters_bulk(["goblin"])["goblin"]["name"] == "Goblin"
+    assert fake_snowflake.stats()["by_kind"] == {"monster_lookup": 1}
+
+
+def test_lookup_compendium_matches_names_in_one_query(snowflake):
+    found = snowflake_db.SnowflakeCompendium().lookup_compendium(["GOBLIN", "HEALING POTION", "VORPAL SWORD"])
+    assert sorted(found) == ["GOBLIN", "HEALING POTION"]  # misses are left out
+    assert found["HEALING POTION"]["name"] == "Healing Potion"
+    assert found["GOBLIN"]["hp"] == 7
+    assert fake_snowflake.stats()["by_kind"] == {"compendium_lookup": 1}
+
+
+def test_lookup_monsters_prefers_the_shortest_name(snowflake):
+    rows = snowflake_db.SnowflakeCompendium().lookup_monsters(["goblin", " BOSS ", "red dragon", "beholder"])
+    # One result per term, in order; ties on length go to the first name alphabetically
+    assert [r and r["name"] for r in rows] == ["Goblin", "Goblin Boss", "Adult Red Dragon", None]
+    assert (rows[0]["hp"], rows[0]["ac"]) == (7, 15)
+    assert fake_snowflake.stats()["by_kind"] == {"monster_lookup": 1}
+
+
+def test_bulk_fetches_query_only_uncached_terms(snowflake):
+    first = snowflake_db.fetch_compendium_bulk(["Goblin", "goblin ", "Vorpal Sword"])
+    assert list(first) == ["Goblin", "Vorpal Sword"]  # duplicates by key collapse
+    assert (first["Goblin"]["name"], first["Vorpal Sword"]) == ("Goblin", None)
+    assert snowflake_db.fetch_monsters_bulk(["orc", "beholder"])["orc"]["name"] == "Orc"
+    fake_snowflake.reset_stats()
+
+    # Hits and known misses come from the cache; only the new term is queried
+    assert snowflake_db.fetch_compendium_bulk(["GOBLIN", "vorpal sword", "Torch"])["Torch"]["name"] == "Torch"
+    monsters = snowflake_db.fetch_monsters_bulk(["Orc", "Beholder"])
+    assert (monsters["Orc"]["name"], monsters["Beholder"]) == ("Orc", None)
+    assert fake_snowflake.stats()["by_kind"] == {"compendium_lookup": 1}
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+import snowflake_db
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self, n):
+        self.n = n
+        self.closed = False
+        self.fail = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.fail:
+            raise ConnectionResetError("connection reset by peer")
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+def _factory():
+    made = []
+    lock = threading.Lock()
+
+    def factory():
+        with lock:
+            made.append(FakeConn(len(made)))
+            return made[-1]
+
+    return factory, made
+
+
+def test_released_connection_is_reused():
+    factory, made = _factory()
+    pool = ConnectionPool(factory, min_size=0, max_size=2)
+    conn = pool.acquire()
+    raw = conn.n
+    conn.close()
+    assert pool.acquire().n == raw
+    assert len(made) == 1
+
+
+def test_discarded_connection_is_not_handed_out_again():
+    factory, made = _factory()
+    pool = ConnectionPool(factory, min_size=0, max_size=1, health_check_interval=3600)
+    conn = pool.acquire()
+    conn.discard()
+    assert made[0].closed
+    again = pool.acquire(timeout=0.1)  # the slot is free again: a fresh connection
+    assert again.n == 1
+    assert pool.stats()["size"] == 1
+    with pytest.raises(AttributeError):
+        conn.cursor()
+
+
+def test_pool_times_out_when_full():
+    factory, _ = _factory()
+    pool = ConnectionPool(factory, min_size=0, max_size=1)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    held.close()
+    pool.acquire(timeout=0.05).close()
+
+
+def test_unhealthy_idle_connection_is_replaced():
+    factory, made = _factory()
+    pool = ConnectionPool(factory, min_size=0, max_size=1, health_check_interval=0)
+    conn = pool.acquire()
+    conn.close()
+    made[0].closed = True  # the session died while idle
+    assert pool.acquire().n == 1
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_snowflake_db_discards_a_connection_after_a_network_error():
+    factory, made = _factory()
+    snowflake_db.set_connection_factory(factory)
+    try:
+        snowflake_db.get_connection().close()
+        made[0].fail = True
+        with pytest.raises(ConnectionResetError):
+            snowflake_db.SnowflakeCompendium().lookup_compendium(["GOBLIN"])
+        assert made[0].closed
+        # The next caller gets a new session, not the broken one
+        snowflake_db.update_player_stats_bulk([{"player_id": "alice", "hp": 3}])
+        assert len(made) == 2 and not made[1].closed
+    finally:
+        snowflake_db.set_connection_factory(None)
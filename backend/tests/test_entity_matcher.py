@@ -0,0 +1,38 @@
+import dm_agent
+import entity_matcher
+import snowflake_db
+from bench import fake_snowflake
+
+
+def test_matcher_is_built_on_first_turn_without_warm_up(snowflake):
+    assert entity_matcher.get_matcher() is None
+    compendium, monsters = dm_agent._search_terms("I swing my longsword at the two adult red dragons")
+    assert compendium == ["Longsword"]
+    assert monsters == ["Adult Red Dragon"]
+    assert entity_matcher.get_matcher() is not None
+    kinds = fake_snowflake.stats()["by_kind"]
+    assert kinds == {"compendium_export": 1, "monster_export": 1}
+
+    # Later turns reuse it; unknown words are never looked up
+    fake_snowflake.reset_stats()
+    prepared = dm_agent._prepare_turn("I sneak past the sleeping guards", {"hp": 10})
+    assert prepared["compendium_entries"] == []
+    assert fake_snowflake.stats()["by_kind"] == {}
+
+
+def test_failed_build_guesses_words_and_backs_off(snowflake, monkeypatch):
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ConnectionResetError("snowflake went away")
+
+    monkeypatch.setattr(snowflake_db.compendium_backend, "get_backend", broken)
+    compendium, monsters = dm_agent._search_terms("I attack the goblin")
+    assert compendium == monsters == ["goblin"]
+    dm_agent._search_terms("I attack the goblin")
+    assert len(calls) == 1  # not retried until ENTITY_MATCHER_RETRY_SECONDS pass
+
+    monkeypatch.undo()
+    snowflake_db._matcher_retry_at = 0.0  # backoff over
+    assert snowflake_db.load_entity_matcher() is not None
@@ -0,0 +1,61 @@
+import sqlite3
+
+import dm_agent
+import snowflake_db
+from bench import fake_snowflake
+
+
+def _row(path, player_id):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT hp, gold, xp FROM PLAYER_STATS WHERE player_id = ?", (player_id,)).fetchone()
+    finally:
+        db.close()
+
+
+def _set_gold(path, player_id, gold):
+    db = sqlite3.connect(path)
+    try:
+        db.execute("UPDATE PLAYER_STATS SET gold = ? WHERE player_id = ?", (gold, player_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _out(hp, gold, xp, changes):
+    return {"stats": {"hp": hp, "gold": gold, "xp": xp, "inventory": [], "player_id": "alice"}, "changes": changes}
+
+
+def test_full_stats_turn_writes_every_column(snowflake):
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(20, 5, 0, {}))])
+    _set_gold(snowflake, "alice", 99)  # drifted, e.g. written by another worker
+    # The client sent gold=5 with the turn: only hp changed, but the row must match what was sent
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(15, 5, 0, {"hp": 15}))])
+    assert _row(snowflake, "alice") == (15, 5, 0)
+
+
+def test_delta_turn_writes_only_changed_columns(snowflake):
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(20, 5, 0, {}), delta=True)])
+    assert _row(snowflake, "alice") == (20, 5, 0)  # first write for the player: everything
+    _set_gold(snowflake, "alice", 99)
+    fake_snowflake.reset_stats()
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(15, 5, 0, {"hp": 15}), delta=True)])
+    assert _row(snowflake, "alice") == (15, 99, 0)  # gold wasn't sent
+    assert fake_snowflake.stats()["by_kind"] == {"player_stats_write": 1}
+
+
+def test_delta_turn_with_no_changes_writes_nothing(snowflake):
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(20, 5, 0, {}), delta=True)])
+    fake_snowflake.reset_stats()
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(20, 5, 0, {}), delta=True)])
+    assert fake_snowflake.stats()["round_trips"] == 0
+
+
+def test_coalescing_a_full_row_with_a_delta_row_writes_every_column(snowflake):
+    snowflake_db.update_player_stats_bulk([dm_agent._stats_row(_out(20, 5, 0, {}))])
+    _set_gold(snowflake, "alice", 99)
+    snowflake_db.update_player_stats_bulk([
+        dm_agent._stats_row(_out(18, 7, 0, {"hp": 18})),
+        dm_agent._stats_row(_out(16, 7, 0, {"hp": 16}), delta=True),
+    ])
+    assert _row(snowflake, "alice") == (16, 7, 0)
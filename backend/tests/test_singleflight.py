@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, SingleFlightTimeout
+
+
+def _start(n, target):
+    results, errors = [None] * n, []
+
+    def run(i):
+        try:
+            results[i] = target(i)
+        except BaseException as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _wait_for(flight, calls):
+    deadline = time.monotonic() + 5
+    while flight.in_flight() < calls and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "goblin"
+
+    threads, results, errors = _start(8, lambda i: flight.do("goblin", fetch))
+    _wait_for(flight, 1)
+    time.sleep(0.05)  # let the followers join
+    release.set()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert results == ["goblin"] * 8
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_leader_exception_is_shared_and_nothing_is_cached():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("db down")
+
+    threads, results, errors = _start(4, lambda i: flight.do("orc", fail))
+    _wait_for(flight, 1)
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 4 and all(isinstance(e, ValueError) for e in errors)
+    assert flight.do("orc", lambda: "orc") == "orc"
+
+
+def test_follower_times_out():
+    flight = SingleFlight("test", timeout=0.05)
+    release = threading.Event()
+    threads, _, errors = _start(1, lambda i: flight.do("slow", lambda: release.wait(5)))
+    _wait_for(flight, 1)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do("slow", lambda: None)
+    release.set()
+    threads[0].join()
+    assert not errors
+
+
+def test_do_many_fetches_only_keys_nobody_else_is_fetching():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    batches = []
+
+    def bulk(keys):
+        batches.append(sorted(keys))
+        if "goblin" in keys:
+            release.wait(5)
+        return {k: k.upper() for k in keys if k != "missing"}
+
+    first, results, errors = _start(1, lambda i: flight.do_many(["goblin", "orc"], bulk))
+    _wait_for(flight, 2)
+    # orc is in flight already: the second caller fetches only troll and missing, then waits for orc
+    second, others, other_errors = _start(1, lambda i: flight.do_many(["orc", "troll", "missing"], bulk))
+    deadline = time.monotonic() + 5
+    while len(batches) < 2 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in first + second:
+        t.join()
+    assert not errors and not other_errors
+    assert results[0] == {"goblin": "GOBLIN", "orc": "ORC"}
+    assert others[0] == {"orc": "ORC", "troll": "TROLL", "missing": None}
+    assert batches == [["goblin", "orc"], ["missing", "troll"]]
+
+
+def test_ado_shares_one_await():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("dragon", fetch) for _ in range(5)])
+
+    assert asyncio.run(main()) == [42] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_ado_leader_does_not_cancel_followers():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "owlbear"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("owlbear", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("owlbear", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "owlbear"
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
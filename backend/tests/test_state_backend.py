@@ -0,0 +1,211 @@
+"""StateStore backends: memory, SQLite (temp file) and Redis (bench/fake_redis)."""
+
+import threading
+import time
+
+import pytest
+
+from bench.fake_redis import FakeRedis
+from session_store import LockTimeout, SessionStore, VersionConflict
+from state_backend import RedisStateStore, SQLiteStateStore
+
+CHARACTER = {"name": "Tester", "hp": 20, "xp": 0, "gold": 5, "inventory": ["Dagger"]}
+
+
+@pytest.fixture(scope="module")
+def redis_server():
+    server = FakeRedis().start()
+    yield server
+    server.stop()
+
+
+def _factory(kind, tmp_path, redis_server):
+    """A function making stores that share one backend, like workers sharing a file or a server."""
+    if kind == "memory":
+        store = SessionStore(CHARACTER, log_limit=50)
+        return lambda **kw: store
+    if kind == "sqlite":
+        path = str(tmp_path / "state.sqlite")
+        return lambda **kw: SQLiteStateStore(path, CHARACTER, log_limit=50, **kw)
+    redis_server._cmd_flushdb()
+    return lambda **kw: RedisStateStore(redis_server.url, CHARACTER, log_limit=50, **kw)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_store(request, tmp_path, redis_server):
+    return _factory(request.param, tmp_path, redis_server)
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_shared(request, tmp_path, redis_server):
+    return _factory(request.param, tmp_path, redis_server)
+
+
+def _run_threads(n, target):
+    errors = []
+
+    def run(i):
+        try:
+            target(i)
+        except BaseException as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+
+def test_new_player_starts_from_default_character(make_store):
+    store = make_store()
+    stats, version = store.state("alice")
+    assert version == 0
+    assert stats == {"hp": 20, "gold": 5, "xp": 0, "inventory": ["Dagger"]}
+
+
+def test_update_and_apply_changes_bump_state_version(make_store):
+    store = make_store()
+    character, version = store.update_character("alice", {"hp": 15, "xp": 10, "gold": 5, "inventory": []})
+    assert (character["hp"], version) == (15, 1)
+    character, version = store.apply_changes("alice", {"gold": 9})
+    assert (character["gold"], character["hp"], version) == (9, 15, 2)
+    _, version = store.apply_changes("alice", {})
+    assert version == 2
+    assert store.characters("alice")[0]["version"] == 2
+
+
+def test_stale_expected_version_raises_conflict(make_store):
+    store = make_store()
+    store.update_character("alice", {"hp": 12})
+    store.state("alice", expected_version=1)
+    with pytest.raises(VersionConflict) as info:
+        store.state("alice", expected_version=0)
+    assert info.value.version == 1
+    assert info.value.stats["hp"] == 12
+
+
+def test_concurrent_turns_for_one_player_run_one_at_a_time(make_store):
+    stores = [make_store() for _ in range(4)]  # one per worker (the memory store is one process)
+
+    def turn(i):
+        store = stores[i % len(stores)]
+        for _ in range(5):
+            with store.player_lock("alice", timeout=30):
+                stats, version = store.state("alice")
+                time.sleep(0.001)  # widen the read-modify-write window
+                store.update_character("alice", dict(stats, xp=stats["xp"] + 1))
+
+    _run_threads(8, turn)
+    stats, version = stores[0].state("alice")
+    assert stats["xp"] == 40
+    assert version == 40
+
+
+def test_concurrent_writes_without_lock_are_not_lost(make_store):
+    # SQLite serializes with BEGIN IMMEDIATE, Redis retries WATCH/MULTI/EXEC on conflict
+    store = make_store()
+    _run_threads(8, lambda i: [store.apply_changes("alice", {"gold": i}) for _ in range(10)])
+    assert store.state("alice")[1] == 80
+
+
+def test_player_lock_times_out_while_held(make_store):
+    store = make_store()
+    with store.player_lock("alice"):
+        with pytest.raises(LockTimeout):
+            store.player_lock("alice", timeout=0.05).acquire()
+        store.player_lock("bob", timeout=0.05).acquire().release()
+    store.player_lock("alice", timeout=0.05).acquire().release()
+
+
+def test_abandoned_lock_expires(make_shared):
+    store = make_shared(lock_ttl=0.2)
+    assert store._try_lock("alice", "dead-worker")  # taken and never renewed
+    with pytest.raises(LockTimeout):
+        store.player_lock("alice", timeout=0.05).acquire()
+    time.sleep(0.3)
+    lock = store.player_lock("alice", timeout=1.0).acquire()
+    assert store._unlock("alice", "dead-worker") is False  # not the holder any more
+    lock.release()
+
+
+def test_held_lock_is_renewed_past_its_ttl(make_shared):
+    worker_a, worker_b = make_shared(lock_ttl=0.2), make_shared(lock_ttl=0.2)
+    lock = worker_a.player_lock("alice", timeout=1.0).acquire()
+    time.sleep(0.7)
+    with pytest.raises(LockTimeout):
+        worker_b.player_lock("alice", timeout=0.05).acquire()
+    lock.release()
+    worker_b.player_lock("alice", timeout=0.05).acquire().release()
+
+
+def test_release_of_a_lost_lock_is_reported(make_shared, caplog):
+    store = make_shared(lock_ttl=0.2)
+    lock = store.player_lock("alice", timeout=1.0).acquire()
+    store._drop(lock._token)  # no more renewals, as if the worker stalled
+    time.sleep(0.3)
+    other = store.player_lock("alice", timeout=1.0).acquire()
+    lock.release()
+    assert "expired during the turn" in caplog.text
+    with pytest.raises(LockTimeout):
+        store.player_lock("alice", timeout=0.05).acquire()  # the new holder keeps it
+    other.release()
+
+
+def test_workers_sharing_a_backend_see_each_others_state(make_shared):
+    worker_a, worker_b = make_shared(), make_shared()
+    worker_a.update_character("alice", {"hp": 3})
+    worker_a.append_logs("alice", [{"role": "user", "content": "hi"}])
+    assert worker_b.state("alice")[0]["hp"] == 3
+    assert [e["content"] for e in worker_b.logs("alice")] == ["hi"]
+    assert worker_b.version("alice") == worker_a.version("alice") > 0
+
+
+def test_logs_since_and_limit(make_store):
+    store = make_store()
+    store.append_logs("alice", [{"content": f"a{i}"} for i in range(3)])
+    store.append_logs("bob", [{"content": f"b{i}"} for i in range(2)])
+    everything = store.logs()
+    assert [e["content"] for e in everything] == ["a0", "a1", "a2", "b0", "b1"]
+    seqs = [e["seq"] for e in everything]
+    assert seqs == sorted(seqs)
+    assert [e["content"] for e in store.logs("alice", limit=2)] == ["a1", "a2"]
+    assert [e["content"] for e in store.logs(since=seqs[1], limit=2)] == ["a2", "b0"]
+    assert store.logs(since=seqs[-1]) == []
+
+
+def test_log_limit_drops_oldest_entries(make_store):
+    store = make_store()
+    store.append_logs("alice", [{"content": str(i)} for i in range(60)])
+    contents = [e["content"] for e in store.logs("alice")]
+    assert contents == [str(i) for i in range(10, 60)]
+
+
+def test_mark_synced_sets_flag_and_store_version_only(make_store):
+    store = make_store()
+    store.update_character("alice", {"hp": 10})
+    store.append_logs("alice", [
+        {"role": "user", "turnId": "t1", "isSnowflakeSynced": False},
+        {"role": "dm", "turnId": "t1", "isSnowflakeSynced": False},
+        {"role": "user", "turnId": "t2", "isSnowflakeSynced": False},
+    ])
+    version, state_version = store.version("alice"), store.state("alice")[1]
+    assert store.mark_synced("alice", ["t1"]) == 2
+    assert [e["isSnowflakeSynced"] for e in store.logs("alice")] == [True, True, False]
+    assert store.version("alice") > version
+    assert store.state("alice")[1] == state_version
+    assert store.mark_synced("alice", ["t1"]) == 0
+    assert store.mark_synced("nobody", ["t1"]) == 0
+
+
+def test_memory_store_expiry_bumps_the_store_version():
+    store = SessionStore(CHARACTER, ttl=0.05)
+    store.update_character("alice", {"hp": 10})
+    etag = store.version()
+    assert [c["name"] for c in store.characters()] == ["Tester"]
+    time.sleep(0.1)
+    # Nobody created a session meanwhile: the read itself sweeps, so the ETag can't stay fresh
+    assert store.version() > etag
+    assert store.characters() == []
+    assert store.stats()["evictions"] == 1
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+import snowflake_db
+import turn_journal
+from turn_journal import TurnJournal, read_segment
+
+
+def _history(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT turn_id, player_name, action FROM GAME_HISTORY ORDER BY created_at").fetchall()
+    finally:
+        db.close()
+
+
+def _journal(directory, **kwargs):
+    kwargs.setdefault("upload_fn", snowflake_db.upload_game_history)
+    kwargs.setdefault("prepare_fn", snowflake_db.ensure_game_history_schema)
+    return TurnJournal(directory, start=False, **kwargs)
+
+
+def test_segments_rotate_by_size(tmp_path):
+    journal = TurnJournal(tmp_path, lambda records: None, segment_bytes=300, start=False)
+    ids = [journal.append("alice", f"action {i}", "x" * 100) for i in range(6)]
+    journal._roll_if_due(force=True)
+    segments = journal._segments(".jsonl")
+    assert len(segments) >= 3
+    assert [seq for seq, _ in segments] == sorted(seq for seq, _ in segments)
+    assert [r["turn_id"] for _, path in segments for r in read_segment(path)] == ids
+
+
+def test_upload_merges_turns_and_deletes_segments(tmp_path, snowflake):
+    journal = _journal(tmp_path / "journal")
+    ids = [journal.append("alice", f"action {i}", "narrative") for i in range(3)]
+    assert not any(journal.is_synced(t) for t in ids)
+    assert journal.flush()
+    assert [row[0] for row in _history(snowflake)] == ids
+    assert journal._segments(".jsonl") == [] and journal._segments(".open") == []
+    assert all(journal.is_synced(t) for t in ids)
+    assert journal.stats()["unsynced_turns"] == 0
+
+
+def test_uploading_the_same_records_again_adds_no_rows(snowflake):
+    records = [{"turn_id": f"t{i}", "player_id": "alice", "action": "a", "narrative": "n", "ts": 1.0 + i} for i in range(3)]
+    snowflake_db.ensure_game_history_schema()
+    snowflake_db.upload_game_history(records)
+    snowflake_db.upload_game_history(records)
+    assert len(_history(snowflake)) == 3
+
+
+def test_failed_upload_keeps_the_segment(tmp_path):
+    def fail(records):
+        raise ConnectionError("snowflake unreachable")
+
+    journal = TurnJournal(tmp_path, fail, start=False)
+    turn_id = journal.append("alice", "look", "You see a door.")
+    journal._roll_if_due(force=True)
+    with pytest.raises(ConnectionError):
+        journal.upload_pending()
+    assert len(journal._segments(".jsonl")) == 1
+    assert not journal.is_synced(turn_id)
+
+
+def test_restart_recovers_open_segments_and_uploads_them(tmp_path, snowflake):
+    crashed = _journal(tmp_path)
+    ids = [crashed.append("alice", f"action {i}", "narrative") for i in range(2)]
+    crashed._file.close()  # the process dies: the segment is never closed
+    crashed._file = None
+    assert len(crashed._segments(".open")) == 1
+
+    journal = _journal(tmp_path)
+    assert journal._segments(".open") == []
+    assert not any(journal.is_synced(t) for t in ids)  # counted as unsynced again
+    assert journal.stats()["unsynced_turns"] == 2
+    uploaded = []
+    journal._on_uploaded = uploaded.extend
+    later = journal.append("alice", "action 2", "narrative")
+    assert journal.flush()
+    assert [row[0] for row in _history(snowflake)] == ids + [later]
+    assert [r["turn_id"] for r in uploaded] == ids + [later]
+
+
+def test_unmigrated_game_history_gets_the_journal_columns(tmp_path, snowflake):
+    db = sqlite3.connect(snowflake)
+    db.executescript(
+        "DROP TABLE GAME_HISTORY; CREATE TABLE GAME_HISTORY (player_name TEXT, action TEXT, narrative TEXT, stats TEXT);"
+    )
+    db.close()
+    journal = _journal(tmp_path)
+    turn_id = journal.append("alice", "look", "You see a door.")
+    assert journal.flush()
+    assert _history(snowflake) == [(turn_id, "alice", "look")]
+
+
+def test_journal_turns_itself_off_if_game_history_cannot_be_migrated(tmp_path, monkeypatch):
+    uploads = []
+    journal = TurnJournal(tmp_path, uploads.append, prepare_fn=lambda: False, start=False)
+    journal.append("alice", "look", "You see a door.")
+    journal.flush()
+    assert journal.disabled
+    assert uploads == []
+    assert len(journal._segments(".jsonl")) == 1  # kept for after the table is fixed
+
+    monkeypatch.setattr(turn_journal, "_journal", journal)
+    monkeypatch.setenv("TURN_JOURNAL_ENABLED", "1")
+    assert turn_journal.get_journal() is None
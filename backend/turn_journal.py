@@ -0,0 +1,457 @@
+"""
+Durable local journal of game turns, bulk-uploaded to Snowflake GAME_HISTORY.
+
+Every turn is appended as one JSON line to the open segment file
+(<seq>.open in TURN_JOURNAL_DIR) before the response goes out, so the turn log
+survives a Snowflake outage or a restart. Segments are closed (fsynced and
+renamed to <seq>.jsonl) when they reach TURN_JOURNAL_SEGMENT_BYTES or
+TURN_JOURNAL_SEGMENT_SECONDS. A background thread then uploads closed segments in order with
+multi-row MERGEs keyed on turn_id, and deletes each segment once all of its rows
+are in. The MERGE ignores turn_ids that are already there, so re-uploading after a
+crash (segment uploaded but not yet deleted, or half-uploaded) never duplicates
+rows. On startup, leftover .open segments are closed and uploaded like any other.
+Listeners registered with add_upload_listener() hear about every uploaded segment
+(app.py uses this to set isSnowflakeSynced on the shared StateStore's log entries).
+
+Before its first upload the journal makes sure GAME_HISTORY has the turn_id and
+created_at columns the MERGE needs (snowflake_db.ensure_game_history_schema). If the
+table can't be migrated, the journal logs an error and turns itself off: turns are then
+inserted directly as with TURN_JOURNAL_ENABLED=0, and the segments already written stay
+on disk for the next start after the table is fixed.
+
+Several worker processes can share TURN_JOURNAL_DIR: each one claims a directory of
+its own (the directory itself, else worker-1/, worker-2/, ... inside it) and holds it
+with a file lock while it runs. A restarted worker claims a free one and so also
+uploads whatever a dead worker left behind there.
+
+fsync policy (TURN_JOURNAL_FSYNC):
+  always    fsync after every turn (a turn is on disk before the API answers)
+  interval  fsync at most every TURN_JOURNAL_FSYNC_INTERVAL seconds (a crash can lose that window)
+  never     leave it to the OS (segments are still fsynced when closed)
+
+Env vars:
+  TURN_JOURNAL_ENABLED          0 to write GAME_HISTORY directly, one INSERT per turn (default 1)
+  TURN_JOURNAL_DIR              segment directory (default backend/journal)
+  TURN_JOURNAL_FSYNC            always | interval | never (default interval)
+  TURN_JOURNAL_FSYNC_INTERVAL   seconds (default 1)
+  TURN_JOURNAL_SEGMENT_BYTES    close a segment at this size (default 4194304)
+  TURN_JOURNAL_SEGMENT_SECONDS  close a non-empty segment at this age, so it gets uploaded (default 10)
+  TURN_JOURNAL_UPLOAD_BATCH     rows per MERGE (default 500)
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per journal directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = Path(__file__).resolve().parent / "journal"
+FSYNC_POLICIES = ("always", "interval", "never")
+MAX_BACKOFF = 300.0
+
+APPENDED = metrics.counter("turn_journal_appended_total", "Turns written to the local journal")
+UPLOADED = metrics.counter("turn_journal_uploaded_total", "Journaled turns uploaded to GAME_HISTORY")
+UPLOAD_FAILURES = metrics.counter("turn_journal_upload_failures_total", "Failed GAME_HISTORY upload attempts")
+UPLOAD_SECONDS = metrics.histogram("turn_journal_upload_seconds", "Time to upload one closed segment")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def enabled() -> bool:
+    return os.environ.get("TURN_JOURNAL_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform (Windows)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_segment(path: Path) -> list[dict[str, Any]]:
+    """Records in a segment file. A torn last line (crash mid-write) is skipped with a warning."""
+    records = []
+    with open(path, "rb") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning("skipping unreadable line %d in journal segment %s", n, path.name)
+    return records
+
+
+class TurnJournal:
+    """Append-only segmented JSONL journal with a background uploader. Thread-safe."""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        upload_fn: Callable[[list[dict[str, Any]]], None],
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        segment_bytes: int = 4 << 20,
+        segment_seconds: float = 10.0,
+        upload_batch: int = 500,
+        start: bool = True,
+        on_uploaded: Callable[[list[dict[str, Any]]], None] | None = None,
+        prepare_fn: Callable[[], bool] | None = None,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._upload_fn = upload_fn
+        self._on_uploaded = on_uploaded
+        # Called before the first upload: True once the target is ready, False if it never will be
+        self._prepare_fn = prepare_fn
+        self._prepared = prepare_fn is None
+        self.disabled = False
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.upload_batch = max(1, upload_batch)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._file = None
+        self._seq = 0
+        self._size = 0
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        # turn_id -> segment seq for turns in this directory that aren't uploaded yet
+        self._unsynced: dict[str, int] = {}
+        self._segment_turns: dict[int, list[str]] = {}
+        self._idle = threading.Condition(self._lock)
+        self._uploading = False
+        self._passes = 0
+        self._failures = 0
+        # Bumped whenever turns are uploaded, so callers can tell sync state changed (e.g. for ETags)
+        self.version = 0
+
+        self._recover()
+        self._thread: threading.Thread | None = None
+        if start:
+            self._thread = threading.Thread(target=self._run, name="turn-journal-uploader", daemon=True)
+            self._thread.start()
+
+    def _segments(self, suffix: str) -> list[tuple[int, Path]]:
+        out = []
+        for path in self.directory.glob(f"*{suffix}"):
+            try:
+                out.append((int(path.name[: -len(suffix)]), path))
+            except ValueError:
+                continue
+        return sorted(out)
+
+    def _recover(self) -> None:
+        """
+        Close segments left open by a previous process, count their turns as unsynced and
+        continue numbering after the last one.
+        """
+        for seq, path in self._segments(".open"):
+            path.replace(path.with_suffix(".jsonl"))
+            logger.info("recovered journal segment %s", path.name)
+        closed = self._segments(".jsonl")
+        for seq, path in closed:
+            turn_ids = [r["turn_id"] for r in read_segment(path) if r.get("turn_id")]
+            self._segment_turns[seq] = turn_ids
+            self._unsynced.update(dict.fromkeys(turn_ids, seq))
+        self._seq = closed[-1][0] if closed else 0
+
+    # -- writing -----------------------------------------------------------------------------
+
+    def _open_locked(self) -> None:
+        self._seq += 1
+        path = self.directory / f"{self._seq:012d}.open"
+        self._file = open(path, "ab")
+        self._size = 0
+        self._opened_at = time.monotonic()
+
+    def _close_locked(self) -> None:
+        """fsync and rename the open segment so the uploader picks it up."""
+        if self._file is None:
+            return
+        f, self._file = self._file, None
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        path = self.directory / f"{self._seq:012d}.open"
+        path.replace(path.with_suffix(".jsonl"))
+        _fsync_dir(self.directory)
+
+    def append(
+        self,
+        player_id: str,
+        action: str,
+        narrative: str,
+        stats: dict[str, Any] | None = None,
+        turn_id: str | None = None,
+    ) -> str:
+        """Journal one turn; returns its turn_id. Raises OSError if the journal can't be written."""
+        turn_id = turn_id or uuid.uuid4().hex
+        record = {
+            "turn_id": turn_id,
+            "player_id": player_id,
+            "action": action,
+            "narrative": narrative,
+            "stats": stats or {},
+            "ts": time.time(),
+        }
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self._open_locked()
+            self._file.write(line)
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            self._size += len(line)
+            self._unsynced[turn_id] = self._seq
+            self._segment_turns.setdefault(self._seq, []).append(turn_id)
+            if self._size >= self.segment_bytes:
+                self._close_locked()
+                self._wake.set()
+        APPENDED.inc()
+        return turn_id
+
+    def is_synced(self, turn_id: str) -> bool:
+        """
+        True once the turn is in GAME_HISTORY, or if it was never in this journal (another
+        worker's turn). The API reads the isSnowflakeSynced flag in the StateStore instead.
+        """
+        with self._lock:
+            return turn_id not in self._unsynced
+
+    # -- uploading ---------------------------------------------------------------------------
+
+    def _upload_segment(self, seq: int, path: Path) -> None:
+        start = time.perf_counter()
+        records = read_segment(path)
+        for i in range(0, len(records), self.upload_batch):
+            self._upload_fn(records[i:i + self.upload_batch])
+        UPLOAD_SECONDS.observe(time.perf_counter() - start)
+        path.unlink()
+        UPLOADED.inc(len(records))
+        with self._lock:
+            for turn_id in self._segment_turns.pop(seq, ()):
+                self._unsynced.pop(turn_id, None)
+            self.version += 1
+        if self._on_uploaded is not None:
+            try:
+                self._on_uploaded(records)
+            except Exception:
+                logger.warning("upload listener failed for journal segment %s", path.name, exc_info=True)
+
+    def _ready(self) -> bool:
+        """Run prepare_fn until it succeeds once (raising counts as an upload failure); False once disabled."""
+        if not self._prepared and not self.disabled:
+            if self._prepare_fn():
+                self._prepared = True
+            else:
+                self._disable()
+        return self._prepared
+
+    def _disable(self) -> None:
+        with self._lock:
+            self.disabled = True
+            self._stop = True
+            self._close_locked()
+        logger.error(
+            "turn journal disabled: GAME_HISTORY can't take journaled turns; %d segment(s) stay in %s",
+            len(self._segments(".jsonl")), self.directory,
+        )
+
+    def upload_pending(self) -> int:
+        """Upload every closed segment, oldest first; returns segments uploaded. Raises on the first failure."""
+        if not self._ready():
+            return 0
+        done = 0
+        for seq, path in self._segments(".jsonl"):
+            self._upload_segment(seq, path)
+            done += 1
+        return done
+
+    def _roll_if_due(self, force: bool = False) -> None:
+        with self._lock:
+            if self._file is not None and self._size and (
+                force or time.monotonic() - self._opened_at >= self.segment_seconds
+            ):
+                self._close_locked()
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            self._wake.wait(backoff or min(self.segment_seconds, 5.0))
+            with self._lock:
+                if self._stop:
+                    return
+                self._wake.clear()
+                self._uploading = True
+            try:
+                self._roll_if_due()
+                self.upload_pending()
+                backoff = 0.0
+            except Exception:
+                self._failures += 1
+                UPLOAD_FAILURES.inc()
+                backoff = min(MAX_BACKOFF, max(1.0, backoff * 2))
+                logger.warning("GAME_HISTORY upload failed; retrying in %.0fs", backoff, exc_info=True)
+            finally:
+                with self._lock:
+                    self._uploading = False
+                    self._passes += 1
+                    self._idle.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Close the open segment and wait for an upload pass. False on timeout or if segments are still pending."""
+        self._roll_if_due(force=True)
+        if self._thread is None or not self._thread.is_alive():
+            self.upload_pending()
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            # A pass already running may have missed the segment just closed: wait for the next one
+            target = self._passes + (2 if self._uploading else 1)
+            self._wake.set()
+            while self._passes < target and not self.disabled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return not self._segments(".jsonl")
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        """Close the open segment (it stays on disk for the next process) and stop the uploader."""
+        try:
+            self.flush(timeout)
+        except Exception:
+            logger.warning("final GAME_HISTORY upload failed; segments stay in %s", self.directory, exc_info=True)
+        with self._lock:
+            self._stop = True
+            self._close_locked()
+        self._wake.set()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            open_bytes = self._size if self._file is not None else 0
+            unsynced = len(self._unsynced)
+        return {
+            "unsynced_turns": unsynced,
+            "closed_segments": len(self._segments(".jsonl")),
+            "open_segment_bytes": open_bytes,
+            "upload_failures": self._failures,
+            "version": self.version,
+        }
+
+
+_journal: TurnJournal | None = None
+_journal_lock = threading.Lock()
+_upload_listeners: list[Callable[[list[dict[str, Any]]], None]] = []
+_claim = None  # open .lock file of the directory this process journals to
+
+
+def claim_directory(base: str | Path) -> Path:
+    """
+    A journal directory no other live process is using: base, else base/worker-1, worker-2, ...
+    It stays claimed (flock on its .lock file) until this process exits.
+    """
+    global _claim
+    base = Path(base)
+    base.mkdir(parents=True, exist_ok=True)
+    if fcntl is None:
+        return base
+    for n in itertools.count():
+        directory = base if n == 0 else base / f"worker-{n}"
+        directory.mkdir(exist_ok=True)
+        f = open(directory / ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _claim = f
+        return directory
+
+
+def add_upload_listener(fn: Callable[[list[dict[str, Any]]], None]) -> None:
+    """Call fn(records) after each segment of the process-wide journal is in GAME_HISTORY."""
+    _upload_listeners.append(fn)
+
+
+def _notify_uploaded(records: list[dict[str, Any]]) -> None:
+    for fn in list(_upload_listeners):
+        fn(records)
+
+
+def get_journal() -> TurnJournal | None:
+    """
+    The process-wide journal uploading to GAME_HISTORY, created on first use; None if
+    TURN_JOURNAL_ENABLED=0 or the journal disabled itself (GAME_HISTORY couldn't be migrated).
+    """
+    global _journal
+    if not enabled():
+        return None
+    if _journal is not None and _journal.disabled:
+        return None
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                import atexit
+
+                from snowflake_db import ensure_game_history_schema, upload_game_history
+
+                _journal = TurnJournal(
+                    claim_directory(os.environ.get("TURN_JOURNAL_DIR") or DEFAULT_DIR),
+                    upload_game_history,
+                    fsync=os.environ.get("TURN_JOURNAL_FSYNC", "interval").strip().lower(),
+                    fsync_interval=_env_float("TURN_JOURNAL_FSYNC_INTERVAL", 1.0),
+                    segment_bytes=int(_env_float("TURN_JOURNAL_SEGMENT_BYTES", 4 << 20)),
+                    segment_seconds=_env_float("TURN_JOURNAL_SEGMENT_SECONDS", 10.0),
+                    upload_batch=int(_env_float("TURN_JOURNAL_UPLOAD_BATCH", 500)),
+                    on_uploaded=_notify_uploaded,
+                    prepare_fn=ensure_game_history_schema,
+                )
+                atexit.register(_journal.close)
+    return _journal
+
+
+metrics.gauge(
+    "turn_journal_unsynced_turns", "Journaled turns not yet in GAME_HISTORY",
+    lambda: _journal.stats()["unsynced_turns"] if _journal else 0,
+)
+
+
+def close_journal(timeout: float | None = 10.0) -> None:
+    """Upload what can be uploaded within timeout and stop the uploader (leftover segments go next start)."""
+    if _journal is not None:
+        _journal.close(timeout)
@@ -0,0 +1,196 @@
+"""
+Background warm-up at boot, and the readiness state behind GET /api/ready.
+
+Importing app.py is kept cheap: the Snowflake connector and the OpenAI SDK are only
+imported when first used, so a new worker answers /api/health almost at once. Left
+alone, the first turn would pay for those imports plus the first Snowflake login and
+the first TLS handshake to OpenRouter. start() runs these steps in background threads
+at boot instead:
+
+  pool        open the Snowflake pool's SNOWFLAKE_POOL_MIN_SIZE sessions
+  compendium  load COMPENDIUM/MONSTERS into the lookup cache and build the entity matcher
+  llm         import the OpenAI SDK, build the shared client and open a connection to the API
+
+Each step is timed. A failed step is logged and reported but still counts as finished (turns
+then pay for it themselves), so a Snowflake outage can't keep a worker out of rotation
+forever. /api/ready answers 200 once every step has finished and 503 before that.
+
+Startup timings (in the /api/ready body and the startup_seconds gauge):
+  import      time to import app.py
+  warmup      time from start() until every step finished
+  first_turn  latency of the first turn served (streamed turns aren't counted)
+  to_first_turn  time from the start of app.py's import until that turn finished
+
+Env vars:
+  WARMUP_STEPS  steps to run at boot, comma-separated: pool, compendium, llm, or all
+                (default none; COMPENDIUM_CACHE_WARM=1 adds compendium)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STEPS = ("pool", "compendium", "llm")
+
+STEP_SECONDS = metrics.histogram(
+    "warmup_step_seconds", "Time taken by each boot warm-up step", ["step", "ok"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+_lock = threading.Lock()
+_done = threading.Condition(_lock)
+_steps: dict[str, dict[str, Any]] = {}  # step -> {"state": running|ok|failed, "seconds", "error"?}
+_started_at: float | None = None
+_finished_at: float | None = None
+_import_started: float | None = None
+_import_seconds: float | None = None
+_first_turn: dict[str, float] | None = None
+
+
+def _pool() -> Any:
+    import snowflake_db
+
+    return {"opened": snowflake_db.get_pool().fill()}
+
+
+def _compendium() -> Any:
+    import snowflake_db
+
+    return snowflake_db.warm_compendium_cache()
+
+
+def _llm() -> Any:
+    import llm_client
+
+    llm_client.prime()
+
+
+_STEP_FNS: dict[str, Callable[[], Any]] = {"pool": _pool, "compendium": _compendium, "llm": _llm}
+
+
+def configured_steps() -> list[str]:
+    """Steps named by WARMUP_STEPS (plus compendium for COMPENDIUM_CACHE_WARM=1), in STEPS order."""
+    names = {s.strip().lower() for s in os.environ.get("WARMUP_STEPS", "").split(",") if s.strip()}
+    if "all" in names:
+        names = set(STEPS)
+    unknown = names - set(STEPS)
+    if unknown:
+        logger.warning("ignoring unknown WARMUP_STEPS: %s", ", ".join(sorted(unknown)))
+    if os.environ.get("COMPENDIUM_CACHE_WARM", "").strip().lower() in ("1", "true", "yes", "on"):
+        names.add("compendium")
+    return [s for s in STEPS if s in names]
+
+
+def mark_imported(started: float) -> None:
+    """Record how long app.py took to import; started is time.perf_counter() from its first line."""
+    global _import_started, _import_seconds
+    with _lock:
+        _import_started = started
+        _import_seconds = time.perf_counter() - started
+    logger.info("app imported in %.3fs", _import_seconds)
+
+
+def _run_step(name: str) -> None:
+    global _finished_at
+    start = time.perf_counter()
+    outcome: dict[str, Any] = {"state": "ok"}
+    try:
+        result = _STEP_FNS[name]()
+        if result:
+            outcome["result"] = result
+    except Exception as exc:
+        outcome = {"state": "failed", "error": f"{type(exc).__name__}: {exc}"}
+        logger.warning("warm-up step %s failed; turns will pay for it instead", name, exc_info=True)
+    seconds = time.perf_counter() - start
+    outcome["seconds"] = round(seconds, 3)
+    STEP_SECONDS.observe(seconds, step=name, ok=str(outcome["state"] == "ok").lower())
+    with _lock:
+        _steps[name] = outcome
+        if all(s["state"] != "running" for s in _steps.values()):
+            _finished_at = time.perf_counter()
+            logger.info("warm-up finished in %.3fs", _finished_at - _started_at)
+            _done.notify_all()
+
+
+def start(steps: list[str] | None = None) -> None:
+    """Run the warm-up steps (default: configured_steps()) in background threads. Only the first call counts."""
+    global _started_at, _finished_at
+    steps = configured_steps() if steps is None else steps
+    with _lock:
+        if _started_at is not None:
+            return
+        _started_at = time.perf_counter()
+        if not steps:
+            _finished_at = _started_at
+            return
+        for name in steps:
+            _steps[name] = {"state": "running"}
+    for name in steps:
+        threading.Thread(target=_run_step, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+
+def ready() -> bool:
+    """True once start() has run and every step has finished (ok or failed)."""
+    with _lock:
+        return _finished_at is not None
+
+
+def wait(timeout: float | None = None) -> bool:
+    """Block until ready() (or timeout); returns ready()."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _lock:
+        while _finished_at is None:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            _done.wait(remaining)
+        return True
+
+
+def record_turn(seconds: float) -> None:
+    """Note a served turn's latency; only the first one is kept."""
+    global _first_turn
+    with _lock:
+        if _first_turn is not None:
+            return
+        now = time.perf_counter()
+        _first_turn = {"seconds": round(seconds, 3)}
+        if _import_started is not None:
+            _first_turn["since_import"] = round(now - _import_started, 3)
+    logger.info("first turn served in %.3fs", seconds)
+
+
+def _timings_locked() -> dict[str, float | None]:
+    return {
+        "import": _import_seconds,
+        "warmup": None if _finished_at is None or _started_at is None else _finished_at - _started_at,
+        "first_turn": _first_turn["seconds"] if _first_turn else None,
+        "to_first_turn": _first_turn.get("since_import") if _first_turn else None,
+    }
+
+
+def status() -> dict[str, Any]:
+    """{ready, steps: {step: {state, seconds, error?, result?}}, timings: {import, warmup, first_turn, to_first_turn}}."""
+    with _lock:
+        timings = _timings_locked()
+        return {
+            "ready": _finished_at is not None,
+            "steps": {name: dict(step) for name, step in _steps.items()},
+            "timings": {k: None if v is None else round(v, 3) for k, v in timings.items()},
+        }
+
+
+def _timings_gauge() -> dict[tuple[str], float | None]:
+    with _lock:
+        return {(phase,): v for phase, v in _timings_locked().items()}
+
+
+metrics.gauge("startup_seconds", "Startup timings: import, warm-up, first turn, time to first turn", _timings_gauge,
+              ["phase"])
+metrics.gauge("ready", "1 once the boot warm-up has finished", lambda: int(ready()))
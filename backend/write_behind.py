@@ -0,0 +1,180 @@
+"""
+Background write-behind queue that coalesces writes per key.
+
+put() only records the newest item for its key and returns immediately; a daemon
+thread hands batches to flush_fn when max_batch keys are pending or the oldest
+pending key has waited flush_interval seconds. If a player acts several times
+before a flush, only their latest state is written (or, with merge_fn, the pending
+items are combined, e.g. partial updates that each touch different fields).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Coalescing write-behind buffer.
+
+    - put(item): replace any pending item with the same key_fn(item) (or merge_fn(pending, item)).
+    - flush(timeout): block until everything pending at call time has been written.
+    - close(timeout): flush and stop the worker (registered with atexit by callers).
+    Failed batches are re-queued (unless a newer item for the key arrived) and retried
+    after retry_delay seconds.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[list[Any]], None],
+        key_fn: Callable[[Any], Hashable],
+        max_batch: int = 50,
+        flush_interval: float = 1.0,
+        retry_delay: float = 5.0,
+        name: str = "write-behind",
+        merge_fn: Callable[[Any, Any], Any] | None = None,
+    ):
+        self._flush_fn = flush_fn
+        self._key_fn = key_fn
+        self._merge_fn = merge_fn
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._name = name
+        # key -> (first enqueued at, newest item); ordered by first enqueue
+        self._pending: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._cond = threading.Condition(threading.Lock())
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._flush_waiters = 0
+        self._inflight = 0
+        self._retry_at = 0.0
+        self._counters = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+        }
+
+    def put(self, item: Any) -> None:
+        key = self._key_fn(item)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self._name} queue is closed")
+            self._counters["enqueued"] += 1
+            if key in self._pending:
+                first, pending = self._pending[key]
+                self._pending[key] = (first, self._merge_fn(pending, item) if self._merge_fn else item)
+                self._counters["coalesced"] += 1
+            else:
+                self._pending[key] = (time.monotonic(), item)
+            self._ensure_worker_locked()
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Write everything pending now. Returns False if it didn't finish within timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if not self._pending and not self._inflight:
+                return True
+            self._ensure_worker_locked()
+            self._flush_waiters += 1
+            self._retry_at = 0.0
+            self._cond.notify_all()
+            try:
+                while self._pending or self._inflight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_waiters -= 1
+
+    def close(self, timeout: float | None = 10.0) -> bool:
+        """Flush pending writes and stop the worker thread."""
+        ok = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return ok
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            out = dict(self._counters)
+            out["pending"] = len(self._pending)
+        return out
+
+    # ---- worker ----
+
+    def _ensure_worker_locked(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def _due_in_locked(self) -> float:
+        """Seconds until the next batch should go out (0 = now)."""
+        if not self._pending:
+            return float("inf")
+        now = time.monotonic()
+        if self._retry_at > now:
+            return self._retry_at - now
+        if self._flush_waiters or self._closed or len(self._pending) >= self.max_batch:
+            return 0.0
+        oldest, _ = next(iter(self._pending.values()))
+        return max(0.0, oldest + self.flush_interval - now)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    wait = self._due_in_locked()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(None if wait == float("inf") else wait)
+                batch_keys = list(self._pending)[: self.max_batch]
+                batch = [(k, self._pending.pop(k)) for k in batch_keys]
+                self._inflight += 1
+            try:
+                self._flush_fn([item for _, (_, item) in batch])
+                failed = False
+            except Exception:
+                logger.exception("%s: batch of %d failed; will retry", self._name, len(batch))
+                failed = True
+            with self._cond:
+                self._inflight -= 1
+                if failed:
+                    self._counters["failed_batches"] += 1
+                    # Put failed items back in front; a newer write for the key wins (or is merged on top)
+                    for key, entry in reversed(batch):
+                        if key not in self._pending:
+                            self._pending[key] = entry
+                        elif self._merge_fn:
+                            first, item = entry
+                            self._pending[key] = (first, self._merge_fn(item, self._pending[key][1]))
+                        else:
+                            continue
+                        self._pending.move_to_end(key, last=False)
+                    self._retry_at = time.monotonic() + self.retry_delay
+                    if self._closed:
+                        # Don't spin forever on shutdown; drop what can't be written
+                        self._pending.clear()
+                else:
+                    self._counters["batches"] += 1
+                    self._counters["written"] += len(batch)
+                self._cond.notify_all()
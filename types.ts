@@ -23,6 +23,7 @@ export interface GameEntry {
   role: 'user' | 'dm';
   content: string;
   isSnowflakeSynced: boolean;
+  turnId?: string | null;
 }
 
 export interface CompendiumEntry {